@@ -1,6 +1,7 @@
 import logging
 import os
 import time
+from functools import lru_cache
 from glob import glob
 from typing import Optional, Dict, Union
 
@@ -143,28 +144,7 @@ class Envi(object):
 
         if not file_hdr:
             raise AssertionError('Could not load %s', l_path)
-        with open(file_hdr, 'r') as header:
-            mergedlines = []
-            bracecount = 0
-            for line in header.readlines():
-                line = line.strip(' \t\n\r')
-                assert(bracecount >= 0)
-                if bracecount:
-                    mergedlines[-1] += line
-                else:
-                    mergedlines.append(line)
-                bracecount += line.count('{') - line.count('}')
-            try:
-                hdict = dict([tuple(el.strip(' \t') for el in  val.split('=', 1)) for val in mergedlines[1:] if val])
-            except ValueError as e:
-                raise AssertionError(f'file {file_hdr} ENVI field is invalid: {e}')
-
-            # print(f"--------------- {l_path } ---------")
-            # pprint(hdict)
-
-            # assert(int(hdict['bands']) == 1)
-            imshape = (int(hdict['lines']), int(hdict['samples']))
-            return imshape, hdict
+        return parse_header(file_hdr)
 
     def save_dict_to_hdr(self, fname, dict):
         with open(fname, 'w') as hdr:
@@ -222,6 +202,32 @@ class Envi(object):
         return [os.path.split(os.path.splitext(el)[0])[1] for el in glob(os.path.join(l_path, '*.hdr'))]
 
 
+def parse_header(file_hdr) -> (tuple, dict):
+    """ (lines, samples), header dict of ENVI header file """
+    with open(file_hdr, 'r') as header:
+        mergedlines = []
+        bracecount = 0
+        for line in header.readlines():
+            line = line.strip(' \t\n\r')
+            assert(bracecount >= 0)
+            if bracecount:
+                mergedlines[-1] += line
+            else:
+                mergedlines.append(line)
+            bracecount += line.count('{') - line.count('}')
+        try:
+            hdict = dict([tuple(el.strip(' \t') for el in  val.split('=', 1)) for val in mergedlines[1:] if val])
+        except ValueError as e:
+            raise AssertionError(f'file {file_hdr} ENVI field is invalid: {e}')
+
+        # print(f"--------------- {l_path } ---------")
+        # pprint(hdict)
+
+        # assert(int(hdict['bands']) == 1)
+        imshape = (int(hdict['lines']), int(hdict['samples']))
+        return imshape, hdict
+
+
 def header_transform_map_for_zone(hdict, zoneY, zoneX):
     """ https://gis.stackexchange.com/questions/42790/gdal-and-python-how-to-get-coordinates-for-all-cells-having-a-specific-value
     Map info fields:
@@ -279,61 +285,196 @@ def pixelsToCoordAffine(dx, dy, geoTransform):
     return px, py
 
 
-def pixelsToCoord(fname, dx, dy):
-    from osgeo import gdal
-    from osgeo.gdalconst import GA_ReadOnly
-    file = gdal.Open(fname, GA_ReadOnly)
+""" ENVI datum names (lower case, alphanumerics only) -> proj datum, other datums are resolved by GDAL """
+ENVI_DATUMS = {
+    'wgs84': 'WGS84',
+    'nad83': 'NAD83',
+    'northamerica1983': 'NAD83',
+    'nad27': 'NAD27',
+    'northamerica1927': 'NAD27',
+    'osgb36': 'OSGB36',
+    'ordnancesurveyofgreatbritain1936': 'OSGB36',
+    'potsdam': 'potsdam',
+}
+
+
+def _envi_datum(map_info: list, index: int) -> str:
+    """ proj datum of map info field, WGS84 if field is missed (as GDAL ENVI driver) """
+    value = map_info[index] if len(map_info) > index else ''
+    if not value or '=' in value:
+        return 'WGS84'
+    key = ''.join(c for c in value.lower() if c.isalnum())
+    if key not in ENVI_DATUMS:
+        raise AssertionError(f"ENVI datum '{value}' is not supported without coordinate system string")
+    return ENVI_DATUMS[key]
+
+
+def _envi_crs(map_info: list, hdict: dict) -> str:
+    """ CRS of ENVI raster: coordinate system string (WKT) if any, otherwise proj4 composed from map info
+
+    map info fields after pixel size (index 7...):
+        UTM: zone, North|South, datum, units=..., rotation=...
+        Geographic Lat/Lon: datum, units=..., rotation=...
+    """
+    wkt = hdict.get('coordinate system string', '').strip('{} ')
+    if wkt:
+        return wkt
+    name = map_info[0].lower()
+    if name.startswith('geographic'):
+        return f'+proj=longlat +datum={_envi_datum(map_info, 7)} +no_defs'
+    if name == 'utm' and len(map_info) > 8:
+        units = [x.split('=', 1)[1].lower() for x in map_info[9:] if x.lower().startswith('units=')]
+        if units and units[0] not in ('meters', 'metres', 'm'):
+            raise AssertionError(f"ENVI UTM units '{units[0]}' are not supported without coordinate system string")
+        south = ' +south' if map_info[8].lower().startswith('s') else ''
+        return f'+proj=utm +zone={int(map_info[7])}{south} +datum={_envi_datum(map_info, 9)} +units=m +no_defs'
+    raise AssertionError(f"ENVI projection '{map_info[0]}' is not supported without coordinate system string")
+
+
+class Georeference(object):
+    """ raster size, CRS and affine pixel -> coordinate transform
+
+    conversions accept scalars or arrays, use get_georeference(fname) to build it once per raster
+
+    :param width: raster samples
+    :param height: raster lines
+    :param crs: anything GeoDataFrame.to_crs() accepts (proj4, WKT)
+    :param transform: affine.Affine of pixel corner -> coordinates (GDAL geo-transform)
+    """
 
-    if not file:
-        raise AssertionError(f"Could not read '{file}'")
-    # GDAL affine transform parameters, According to gdal documentation xoff/yoff are image left corner, a/e are pixel wight/height and b/d is rotation and is zero if image is north up.
-    # xoff, a, b, yoff, d, e = file.GetGeoTransform()
+    def __init__(self, width: int, height: int, crs: str, transform: affine.Affine):
+        self.width = width
+        self.height = height
+        self.crs = crs
+        self.transform = transform
+        self.reverse_transform = ~transform
+
+    @classmethod
+    def from_envi_header(cls, file_hdr):
+        """ georeference from 'map info' of ENVI header, raster is not opened
+
+        see header_transform_map_for_zone() for map info fields, rotation and tie point are applied
+        as GDAL ENVI driver does (ProcessMapinfo), result should match from_gdal()
+        """
+        imshape, hdict = parse_header(file_hdr)
+        if 'map info' not in hdict:
+            raise AssertionError(f"ENVI header {file_hdr} has no map info")
+        map_info = [x.strip() for x in hdict['map info'].strip('{} ').split(',')]
+        xReference, yReference, pixelEasting, pixelNorthing, xPixelSize, yPixelSize = [float(x) for x in map_info[1:7]]
+        rotation = 0.
+        for x in map_info[7:]:
+            if x.lower().startswith('rotation='):
+                """ ENVI rotation is counter-clockwise, GDAL negates it """
+                rotation = -np.deg2rad(float(x.split('=', 1)[1]))
+        gt1, gt2 = np.cos(rotation) * xPixelSize, -np.sin(rotation) * xPixelSize
+        gt4, gt5 = -np.sin(rotation) * yPixelSize, -np.cos(rotation) * yPixelSize
+        """ tie point is 1-based pixel (xReference, yReference) """
+        geo_transform = (pixelEasting - (xReference - 1) * gt1 - (yReference - 1) * gt2, gt1, gt2,
+                         pixelNorthing - (xReference - 1) * gt4 - (yReference - 1) * gt5, gt4, gt5)
+        return cls(imshape[1], imshape[0], _envi_crs(map_info, hdict), affine.Affine.from_gdal(*geo_transform))
+
+    @classmethod
+    def from_gdal(cls, fname):
+        from osgeo import gdal, osr
+        from osgeo.gdalconst import GA_ReadOnly
+        file: gdal.Dataset = gdal.Open(fname, GA_ReadOnly)
+
+        if not file:
+            raise AssertionError(f"Could not read '{fname}'")
+        srs = osr.SpatialReference(wkt=file.GetProjection())
+        return cls(file.RasterXSize, file.RasterYSize, srs.ExportToProj4(),
+                   affine.Affine.from_gdal(*file.GetGeoTransform()))
+
+    @property
+    def geo_transform(self) -> tuple:
+        return self.transform.to_gdal()
+
+    def to_coords(self, px, py):
+        """ coordinates of pixel corners """
+        return self.transform * (np.asarray(px, dtype=np.float64), np.asarray(py, dtype=np.float64))
+
+    def to_pixels(self, x, y):
+        """ nearest pixel corners of coordinates, int arrays (ints for scalars) """
+        px, py = self.reverse_transform * (np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+        px, py = (px + 0.5).astype(np.int64), (py + 0.5).astype(np.int64)
+        if px.ndim == 0:
+            return int(px), int(py)
+        return px, py
+
+    def reproject(self, rois, roi_crs) -> gpd.GeoDataFrame:
+        """ all ROIs in raster CRS
+
+        :param rois: GeoDataFrame or iterable of ROI records (rows of roi db)
+        """
+        df = rois if isinstance(rois, gpd.GeoDataFrame) else gpd.GeoDataFrame(list(rois), crs=roi_crs)
+        if df.crs is None:
+            df.crs = roi_crs
+        return df.to_crs(self.crs)
+
+    def zones(self, rois, roi_crs) -> list:
+        """ zones (minY, minX, maxY, maxX) in pixels for every ROI, clipped to raster """
+        df = self.reproject(rois, roi_crs)
+        if not len(df):
+            return []
+        bounds = df.geometry.bounds
+        x0, y0 = self.to_pixels(bounds['minx'].values, bounds['miny'].values)
+        x1, y1 = self.to_pixels(bounds['maxx'].values, bounds['maxy'].values)
+        cx = np.clip(np.stack([x0, x1]), 0, self.width).astype(np.uint32)
+        cy = np.clip(np.stack([y0, y1]), 0, self.height).astype(np.uint32)
+        """ rearange Geo-min to pixels-min """
+        minx, maxx, miny, maxy = cx.min(axis=0), cx.max(axis=0), cy.min(axis=0), cy.max(axis=0)
+        zones = []
+        for n in range(len(df)):
+            _name = df.iloc[n]['name'] if 'name' in df.columns else n
+            log.debug(f"roi {_name} bounds {tuple(bounds.iloc[n])} un-clipped zone ({y0[n]} {x0[n]} {y1[n]} {x1[n]})"
+                      f" clipped zone ({miny[n]} {minx[n]} {maxy[n]} {maxx[n]})")
+            zones.append((int(miny[n]), int(minx[n]), int(maxy[n]), int(maxx[n])))
+        return zones
+
+
+@lru_cache(maxsize=64)
+def _georeference(fname, mtime) -> Georeference:
+    _hdr = os.path.splitext(fname)[0] + '.hdr'
+    if os.path.isfile(_hdr):
+        try:
+            return Georeference.from_envi_header(_hdr)
+        except (AssertionError, KeyError, ValueError, IndexError) as e:
+            log.debug(f"Could not georeference {fname} by ENVI header, using GDAL: {e}")
+    return Georeference.from_gdal(fname)
+
+
+def get_georeference(fname) -> Georeference:
+    """ georeference of raster, built once until file is modified, ENVI rasters are not opened """
+    return _georeference(os.path.abspath(fname), os.path.getmtime(fname))
 
-    forward_transform = affine.Affine.from_gdal(*file.GetGeoTransform())
-    px, py = forward_transform * (dx, dy)
-    return px, py
+
+def pixelsToCoord(fname, dx, dy):
+    return get_georeference(fname).to_coords(dx, dy)
 
 
 def coordToPixels(fname, dx, dy):
-    from osgeo import gdal
-    from osgeo.gdalconst import GA_ReadOnly
-    file = gdal.Open(fname, GA_ReadOnly)
-
-    if not file:
-        raise AssertionError(f"Could not read '{file}'")
-    # GDAL affine transform parameters, According to gdal documentation xoff/yoff are image left corner, a/e are pixel wight/height and b/d is rotation and is zero if image is north up.
-    # xoff, a, b, yoff, d, e = file.GetGeoTransform()
-
-    forward_transform = affine.Affine.from_gdal(*file.GetGeoTransform())
-    reverse_transform = ~forward_transform
-    px, py = reverse_transform * (dx, dy)
-    px, py = int(px + 0.5), int(py + 0.5)
-    return px, py
+    return get_georeference(fname).to_pixels(dx, dy)
 
 
 def getProj4AndRes(fname):
-    from osgeo import gdal, osr
-    from osgeo.gdalconst import GA_ReadOnly
-    file: gdal.Dataset = gdal.Open(fname, GA_ReadOnly)
+    """ (width, height, crs) of raster
 
-    if not file:
-        raise AssertionError(f"Could not read '{file}'")
-    srs = osr.SpatialReference(wkt=file.GetProjection())
-    return file.RasterXSize, file.RasterYSize, srs.ExportToProj4()
+    crs is WKT when ENVI header has 'coordinate system string', proj4 otherwise (ENVI map info or GDAL),
+    both are accepted by GeoDataFrame.to_crs() and pyproj
+    """
+    g = get_georeference(fname)
+    return g.width, g.height, g.crs
+
+
+def zonesByRois(fname, rois, roi_crs) -> list:
+    """ zones (minY, minX, maxY, maxX) in pixels of raster for every roi, all ROIs are reprojected in one pass
+
+    :param rois: iterable of ROI records (rows of roi db)
+    """
+    g = get_georeference(fname)
+    log.info(f"Georeference {fname} WxH={g.width}x{g.height} '{g.crs}'")
+    return g.zones(rois, roi_crs)
 
 
 def zoneByRoi(fname, roi, roi_crs) -> tuple:
-    df = gpd.GeoDataFrame([roi], crs=roi_crs)
-    rwidth, rheigh, prj = getProj4AndRes(fname)
-    df = df.to_crs(prj)
-    minx, miny, maxx, maxy = df.iloc[0].geometry.bounds
-    log.info(f"GDAL info for roi {roi['name']} WxH={rwidth}x{rheigh} bounds {(minx, miny, maxx, maxy)} '{prj}'")
-    minx, miny = coordToPixels(fname, minx, miny)
-    maxx, maxy = coordToPixels(fname, maxx, maxy)
-    log.debug(f"un-clipped zone  roi {roi['name']} ({miny} {minx} {maxy} {maxx})")
-    cx = gpd.np.clip([minx, maxx], 0, rwidth).astype(gpd.np.uint32)
-    cy = gpd.np.clip([miny, maxy], 0, rheigh).astype(gpd.np.uint32)
-    minx, maxx, miny, maxy = min(cx), max(cx), min(cy), max(cy)  # rearange Geo-min to pixels-min
-    log.debug(f"Clipped zone  roi {roi['name']} ({miny} {minx} {maxy} {maxx})")
-    zone = (int(miny), int(minx), int(maxy), int(maxx))
-    return zone
+    return zonesByRois(fname, [roi], roi_crs)[0]
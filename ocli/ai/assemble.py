@@ -1,14 +1,15 @@
 import logging
 # sys.path.insert(0, "./")
 import os
-import time
 
 import numpy as np
 
+from ocli.ai import pyramid, tensor_store
 from ocli.ai.Envi import Envi, header_transform_map_for_zone
 # from ocli.ai.filter.smoothing import anisotropic_diffusion, fix_pixels
 from ocli.ai.recipe import Recipe
 from ocli.ai.util import Filenames
+from ocli.util import metrics
 
 log = logging.getLogger()
 
@@ -17,6 +18,29 @@ from ocli.ai.filter.anisotropic_diffusion import anisotropic_diffusion
 from ocli.ai.filter.fix_pixels import fix_pixels
 
 
+def preprocess_sigma(s: np.ndarray) -> (np.ndarray, np.ndarray):
+    """ clip, log10 and fix bad pixels of sigma band
+
+    :return: (preprocessed band, bad data mask)
+    """
+    bad_data = (s < 1e-6) | (s > 10)
+    s = np.clip(s, 1e-6, 10)
+    s = np.log10(s)
+    fix_pixels(s, bad_data)
+    return s, bad_data
+
+
+def preprocess_coh(c: np.ndarray) -> (np.ndarray, np.ndarray):
+    """ clip and fix bad pixels of coherence band
+
+    :return: (preprocessed band, bad data mask)
+    """
+    bad_data = (c < 0) | (c > 1)
+    c = np.clip(c, 0, 1)
+    fix_pixels(c, bad_data)
+    return c, bad_data
+
+
 class Assemble(object):
     """
     collect bytes from ENVI channels in recipe  (full or part by mode key)
@@ -51,7 +75,24 @@ class Assemble(object):
         else:
             self.log.info(msg)
 
+    def _stack_overviews(self, name, arr):
+        """ full mode loads whole stack band, so overviews for stack previews are almost free """
+        if self.mode != 'full':
+            return
+        fname = os.path.join(self.recipe.get("DATADIR"), name + '.img')
+        if pyramid.available_overviews(fname):
+            return
+        try:
+            with metrics.span('overviews', band=name):
+                pyramid.build_overviews(fname, arr)
+        except OSError as e:
+            self.log.warning(f"Could not create stack overviews for {fname}: {e}")
+
     def run(self, progress=None):
+        with metrics.run('assemble', self.WORKDIR, mode=self.mode, recipe=self.recipe.get('friendly_name')):
+            return self._run(progress)
+
+    def _run(self, progress=None):
         mode = self.mode
         if mode not in ('zone', 'full'):
             self.log.error(f"Unlnowm mode '{mode}' . Allowed: [zone|full]")
@@ -117,6 +158,15 @@ class Assemble(object):
         self.log.info(f'Full shape: {(full_shape[0], full_shape[1], nproducts)}')
         tnsr_full = np.empty((full_shape[0], full_shape[1], nproducts), dtype=np.float32)
         bd_full = np.zeros((full_shape[0], full_shape[1]), dtype=np.bool)
+        """ time-series cube keeps running means of sigma_avg/coh_avg, stack files are not re-read """
+        ts = None
+        if recipe.get('timeseries'):
+            from ocli.ai.timeseries import TimeSeriesCube
+            ts = TimeSeriesCube(recipe['timeseries'])
+            if ts.shape != (full_shape[0], full_shape[1]):
+                raise AssertionError(f"Time-series cube shape {ts.shape} does not fit {mode} shape {full_shape}")
+            self.log.info(f"using time-series cube {recipe['timeseries']}, {ts.count} dates")
+            bd_full |= ts.bad_data()
 
         # if mode in ('zone'):
         #     tnsr_zone = np.empty((zone_shape[0], zone_shape[1], nproducts), dtype=np.float32)
@@ -148,66 +198,52 @@ class Assemble(object):
             params = products['sigma']
             for sn in sigma_names:
                 self.progress(f'sigma: {sn}', 0)
-                _st = time.time()
-                _stt = time.time()
                 self.log.debug(f'#{product_index} sigma {sn}')
-                s,_ = file_loader(sn)
-                self.log.debug(f'#{product_index} sigma  loaded in {time.time() - _st}')
-                _st = time.time()
-                bad_data = (s < 1e-6) | (s > 10)
-                self.log.debug(f'#{product_index} sigma bad_data in {time.time() - _st}')
-                _st = time.time()
-                s = np.clip(s, 1e-6, 10)
-                s = np.log10(s)
-                self.log.debug(f'#{product_index} sigma clamped in {time.time() - _st}')
-                _st = time.time()
+                with metrics.span('load', band=sn):
+                    s,_ = file_loader(sn)
+                self._stack_overviews(sn, s)
+                with metrics.span('clip_log', band=sn):
+                    bad_data = (s < 1e-6) | (s > 10)
+                    s = np.clip(s, 1e-6, 10)
+                    s = np.log10(s)
                 self.log.debug(f'#{product_index} sigma fixing  {bad_data.sum()} pixels')
-                fix_pixels(s, bad_data)
-                # self.log.error('EXITING HERE!!!')
-                # return
-                self.log.debug(f'#{product_index} sigma fix_pixels in {time.time() - _st}')
-                _st = time.time()
-                s = anisotropic_diffusion(s, params[0], params[1], 0.2, option=1)
-                self.log.debug(f'#{product_index} sigma anisotropic_diffusion in {time.time() - _st}')
-                _st = time.time()
+                with metrics.span('fix_pixels', band=sn):
+                    fix_pixels(s, bad_data)
+                with metrics.span('diffusion', band=sn):
+                    s = anisotropic_diffusion(s, params[0], params[1], 0.2, option=1)
 
                 tnsr_full[..., product_index] = s
                 bd_full |= bad_data
-                self.log.debug(f'#{product_index} sigma bad_data in {time.time() - _st}')
-                self.log.info(f'#{product_index} sigma {sn} done in {time.time() - _stt}')
                 band_names.append(sn)
                 product_index += 1
                 self.progress(f'sigma: {sn}')
 
         if 'sigma_avg' in products:
             self.progress(f'sigma_avg', 0)
-            _stt = time.time()
-            _st = time.time()
             params = products['sigma_avg']
-            savg = np.zeros(full_shape, dtype=np.float32)
-            self.log.debug(f'#{product_index} sigma_avg  np.zeros in {time.time() - _st}')
-
-            for sn in sigma_avg_names:
+            if ts is not None and 'sigma' in ts.channels:
+                with metrics.span('load', band='sigma_avg', timeseries=True):
+                    savg = ts.mean('sigma')
+                _avg_names = []
+                _n = 1
+            else:
+                savg = np.zeros(full_shape, dtype=np.float32)
+                _avg_names = sigma_avg_names
+                _n = len(sigma_avg_names)
+
+            for sn in _avg_names:
                 self.log.debug(f'#{product_index} sigma_avg {sn}')
-                s,_ = file_loader(sn)
-                self.log.debug(f'#{product_index} sigma_avg loaded in {time.time() - _st}')
-                _st = time.time()
-                bad_data = (s < 1e-6) | (s > 10)
-                s = np.clip(s, 1e-6, 10)
-                s = np.log10(s)
-                self.log.debug(f'#{product_index} sigma_avg clamp,bad_data  in {time.time() - _st}')
-                _st = time.time()
-                fix_pixels(s, bad_data)
-                self.log.debug(f'#{product_index} sigma_avg fix_pixels in {time.time() - _st}')
-                _st = time.time()
+                with metrics.span('load', band=sn):
+                    s,_ = file_loader(sn)
+                self._stack_overviews(sn, s)
+                with metrics.span('clip_log', band=sn, fix_pixels=True):
+                    s, bad_data = preprocess_sigma(s)
                 savg += s
                 bd_full |= bad_data
-                self.log.debug(f'#{product_index} coh_avg avg and bad_data in {time.time() - _st}')
 
-            tnsr_full[..., product_index] = anisotropic_diffusion(savg / len(sigma_avg_names), params[0],
-                                                                  params[1], 0.2, option=1)
-            self.log.debug(f'#{product_index} sigma_avg anisotropic_diffusion in {time.time() - _st}')
-            self.log.info(f'#{product_index} sigma done in {time.time() - _stt}')
+            with metrics.span('diffusion', band='sigma_avg'):
+                tnsr_full[..., product_index] = anisotropic_diffusion(savg / _n, params[0],
+                                                                      params[1], 0.2, option=1)
             band_names.append('sigma_avg')
             product_index += 1
             self.progress(f'sigma_avg')
@@ -216,59 +252,50 @@ class Assemble(object):
             params = products['coh']
             for cn in coh_names:
                 self.progress(f'coh: {cn}', 0)
-                _st = time.time()
-                _stt = time.time()
                 self.log.debug(f'#{product_index} coh {cn}')
-                c = file_loader(cn)[0]
-                self.log.debug(f'#{product_index} coh  loaded in {time.time() - _st}')
-                _st = time.time()
-                bad_data = (c < 0) | (c > 1)
-                c = np.clip(c, 0, 1)
-                self.log.debug(f'#{product_index} coh clamped in {time.time() - _st}')
-                _st = time.time()
-                fix_pixels(c, bad_data)
-                self.log.debug(f'#{product_index} coh fix_pixels in {time.time() - _st}')
-                _st = time.time()
-                c = anisotropic_diffusion(c, params[0], params[1], 0.2, option=1)
-                self.log.debug(f'#{product_index} coh anisotropic_diffusion in {time.time() - _st}')
-                _st = time.time()
+                with metrics.span('load', band=cn):
+                    c = file_loader(cn)[0]
+                self._stack_overviews(cn, c)
+                with metrics.span('clip_log', band=cn):
+                    bad_data = (c < 0) | (c > 1)
+                    c = np.clip(c, 0, 1)
+                with metrics.span('fix_pixels', band=cn):
+                    fix_pixels(c, bad_data)
+                with metrics.span('diffusion', band=cn):
+                    c = anisotropic_diffusion(c, params[0], params[1], 0.2, option=1)
 
                 tnsr_full[..., product_index] = c
                 bd_full |= bad_data
                 product_index += 1
-                self.log.debug(f'#{product_index} coh bad_data in {time.time() - _st}')
-                self.log.info(f'#{product_index} coh {cn} done in {time.time() - _stt}')
                 band_names.append(cn)
                 self.progress(f'coh: {cn}')
 
         if 'coh_avg' in products:
             self.progress(f'coh_avg assembling', 0)
-            _stt = time.time()
-            _st = time.time()
 
-            cavg_full = np.zeros(full_shape, dtype=np.float32)
-            self.log.debug(f'#{product_index} coh_avg  np.zeros in {time.time() - _st}')
+            if ts is not None and 'coh' in ts.channels:
+                with metrics.span('load', band='coh_avg', timeseries=True):
+                    cavg_full = ts.mean('coh')
+                _avg_names = []
+                _n = 1
+            else:
+                cavg_full = np.zeros(full_shape, dtype=np.float32)
+                _avg_names = coh_avg_names
+                _n = len(coh_avg_names)
             params = products['coh_avg']
-            for cn in coh_avg_names:
+            for cn in _avg_names:
                 self.log.debug(f'#{product_index} coh_avg {cn}')
-                c,_ = file_loader(cn)
-                self.log.debug(f'#{product_index} coh_avg  loaded in {time.time() - _st}')
-                _st = time.time()
-                bad_data = (c < 0) | (c > 1)
-                c = np.clip(c, 0, 1)
-                self.log.debug(f'#{product_index} coh clamp, bad data in {time.time() - _st}')
-                _st = time.time()
-                fix_pixels(c, bad_data)
-                self.log.debug(f'#{product_index} coh_avg fix in {time.time() - _st}')
-                _st = time.time()
+                with metrics.span('load', band=cn):
+                    c,_ = file_loader(cn)
+                self._stack_overviews(cn, c)
+                with metrics.span('clip_log', band=cn, fix_pixels=True):
+                    c, bad_data = preprocess_coh(c)
                 cavg_full += c
                 bd_full |= bad_data
-                self.log.debug(f'#{product_index} coh_avg added to avg in {time.time() - _st}')
 
-            tnsr_full[..., product_index] = anisotropic_diffusion(cavg_full / len(coh_avg_names), params[0],
-                                                                  params[1], 0.2, option=1)
-            self.log.debug(f'#{product_index} coh_avg anisotropic_diffusion in {time.time() - _st}')
-            self.log.info(f'#{product_index} coh_avg done in {time.time() - _stt}')
+            with metrics.span('diffusion', band='coh_avg'):
+                tnsr_full[..., product_index] = anisotropic_diffusion(cavg_full / _n, params[0],
+                                                                      params[1], 0.2, option=1)
             product_index += 1
             band_names.append('coh_avg')
             self.progress(f'coh_avg assembled')
@@ -296,13 +323,21 @@ class Assemble(object):
         if mode in ('zone'):
             envi_header['map info'] = header_transform_map_for_zone(envi_header, zoneY=zone[0][0],
                                                                               zoneX=zone[0][1])
-        np.save(self.filenames.tnsr, tnsr_full)
-        np.save(self.filenames.bd, bd_full)
-        envi_header['lines'] = tnsr_full.shape[0]
-        envi_header['samples'] = tnsr_full.shape[1]
-        envi_header['bands'] = tnsr_full.shape[2]
-        envi_header['band names'] = "{" + ",".join(band_names) + "}"
-        self.envi.save_dict_to_hdr(self.filenames.tnsr_hdr, envi_header)
+        with metrics.span('save'):
+            """ data type of stack bands is replaced by stored one, quantised tensor gains/offsets are in header """
+            envi_header.pop(tensor_store.HDR_GAIN, None)
+            envi_header.pop(tensor_store.HDR_OFFSET, None)
+            envi_header.update(tensor_store.save_tensor(self.filenames.tnsr, tnsr_full, recipe.get('tensor_format'),
+                                                        quantization=recipe.get('tensor_quantize')))
+            np.save(self.filenames.bd, bd_full)
+            envi_header['lines'] = tnsr_full.shape[0]
+            envi_header['samples'] = tnsr_full.shape[1]
+            envi_header['bands'] = tnsr_full.shape[2]
+            envi_header['band names'] = "{" + ",".join(band_names) + "}"
+            self.envi.save_dict_to_hdr(self.filenames.tnsr_hdr, envi_header)
+        with metrics.span('overviews'):
+            pyramid.remove_overviews(self.filenames.tnsr)
+            pyramid.build_overviews(self.filenames.tnsr, tnsr_full)
         self.log.info('tensors processed')
         # system("say 'assembling complete'")
         return 0
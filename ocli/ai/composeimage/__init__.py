@@ -8,7 +8,7 @@ import numpy as np
 from skimage import exposure
 from skimage import img_as_ubyte
 
-from ocli.ai import Envi
+from ocli.ai import Envi, pyramid, tensor_store
 from ocli.ai.recipe import Recipe
 from ocli.ai.util import Filenames, zone_slice
 
@@ -47,7 +47,7 @@ class OptossImage(object):
             os.makedirs(self.WORKDIR)
         self.log.debug(f"Saving tnsr to {self.tnsr_filename}")
 
-        np.save(self.tnsr_filename, self.tnsr_full)
+        tensor_store.save_tensor(self.tnsr_filename, self.tnsr_full, self.recipe.get('tensor_format'))
         self.envi.save_dict_to_hdr(self.tnsr_filename, self.tnsr_full_hdr)
         self.log.info('tensor assembled')
 
@@ -104,10 +104,13 @@ class OptossImage(object):
             return False
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
-            self.envi.save(self.filenames.pred8c, img_as_ubyte(arr),
+            arr = img_as_ubyte(arr)
+            self.envi.save(self.filenames.pred8c, arr,
                            map_info=self.tnsr_full_hdr['map info'],
                            coord_string=self.tnsr_full_hdr['coordinate system string'],
                            chnames=['R', 'G', 'B'], desc='Overlay image')
+        pyramid.remove_overviews(self.filenames.pred8c_img)
+        pyramid.build_overviews(self.filenames.pred8c_img, arr)
         self.log.info(f"saving image {self.filenames.pred8c}")
 
     def rescale_intensity(self, src: np.ndarray, args: Dict):
@@ -125,10 +128,10 @@ class OptossImage(object):
 
     def process(self, show=False, show_intermediate=False):
         if True or self.tnsr_full is None:
-            if not os.path.exists(self.tnsr_filename):
+            if not tensor_store.tensor_exists(self.tnsr_filename):
                 self.log.error(
                     f"could not find {self.tnsr_filename}, did you forget run image assemble {self.mode}")
-            self.tnsr_full = np.load(self.tnsr_filename)
+            self.tnsr_full = tensor_store.load_tensor(self.tnsr_filename)
             _, self.tnsr_full_hdr = self.envi.read_header(self.tnsr_filename, is_fullpath=True)
         else:
             self.log.info("reusing data from previous step")
@@ -0,0 +1,153 @@
+"""
+Gaussian smoothing of tensor blocks (lines, samples, bands): all bands of a block are filtered by one call.
+
+methods:
+    FIR  - scipy.ndimage separable convolution, kernel radius truncate*sigma, result equals per-band gaussian_filter
+    IIR  - recursive Young - van Vliet approximation (3-rd order, forward + backward pass),
+           cost per pixel does not depend on sigma, edges are mirrored
+    AUTO - IIR for sigma >= IIR_MIN_SIGMA, FIR otherwise
+
+StripGaussian filters image strip by strip with halo rows (see Process prediction loop),
+horizontal pass of every row is computed once and reused by the next strip, only strip rows are returned.
+"""
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from scipy.signal import lfilter, lfilter_zi
+
+FIR = 'fir'
+IIR = 'iir'
+AUTO = 'auto'
+METHODS = (FIR, IIR, AUTO)
+""" for small sigma FIR kernel is short and exact """
+IIR_MIN_SIGMA = 4.
+""" scipy.ndimage default """
+TRUNCATE = 4.0
+
+
+def radius(sigma: float, truncate=TRUNCATE) -> int:
+    """ FIR kernel radius, rows of halo required for exact strip filtering """
+    return int(truncate * float(sigma) + 0.5)
+
+
+def resolve_method(sigma: float, method: str = FIR) -> str:
+    if method not in METHODS:
+        raise AssertionError(f"Unknown gauss method '{method}', allowed: {'|'.join(METHODS)}")
+    if method == AUTO:
+        return IIR if sigma >= IIR_MIN_SIGMA else FIR
+    return method
+
+
+def _yvv(sigma: float) -> (np.ndarray, np.ndarray):
+    """ lfilter (b, a) of Young - van Vliet recursive gaussian, valid for sigma >= 0.5 """
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * np.sqrt(1 - 0.26891 * sigma)
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    b1 = 2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3
+    b2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3)
+    b3 = 0.422205 * q ** 3
+    return np.array([1 - (b1 + b2 + b3) / b0]), np.array([1, -b1 / b0, -b2 / b0, -b3 / b0])
+
+
+def _causal(x: np.ndarray, b: np.ndarray, a: np.ndarray, axis: int) -> np.ndarray:
+    """ forward recursive pass, filter state is started at steady state of the first value """
+    if axis == 0:
+        """ lfilter along the first axis reads values far apart, recursion over rows is vectorised along rows """
+        y = np.empty_like(x)
+        c0, c1, c2, c3 = b[0], -a[1], -a[2], -a[3]
+        p1 = p2 = p3 = x[0]
+        for n in range(x.shape[0]):
+            r = c0 * x[n]
+            r += c1 * p1
+            r += c2 * p2
+            r += c3 * p3
+            y[n] = r
+            p3, p2, p1 = p2, p1, y[n]
+        return y
+    zshape = [1] * x.ndim
+    zshape[axis] = len(a) - 1
+    zi = lfilter_zi(b, a).astype(x.dtype).reshape(zshape)
+    return lfilter(b, a, x, axis=axis, zi=zi * np.take(x, [0], axis=axis))[0]
+
+
+def _iir1d(arr: np.ndarray, sigma: float, axis: int) -> np.ndarray:
+    dtype = np.result_type(arr.dtype, np.float32)
+    b, a = (c.astype(dtype) for c in _yvv(sigma))
+    r = radius(sigma)
+    """ edges are mirrored as scipy.ndimage 'reflect' mode """
+    pad = [(0, 0)] * arr.ndim
+    pad[axis] = (r, r)
+    y = np.pad(arr.astype(dtype, copy=False), pad, mode='symmetric')
+    y = _causal(y, b, a, axis)
+    y = _causal(np.flip(y, axis=axis), b, a, axis)
+    crop = [slice(None)] * arr.ndim
+    crop[axis] = slice(r, r + arr.shape[axis])
+    return np.flip(y, axis=axis)[tuple(crop)]
+
+
+def filter1d(arr: np.ndarray, sigma: float, axis: int, method: str = FIR, out: np.ndarray = None) -> np.ndarray:
+    """ gaussian along one axis of all bands
+
+    :param out: output array, could be arr
+    """
+    if resolve_method(sigma, method) == IIR:
+        y = _iir1d(arr, sigma, axis)
+        if out is None:
+            return y.astype(arr.dtype)
+        out[...] = y
+        return out
+    return gaussian_filter1d(arr, sigma, axis=axis, output=out, truncate=TRUNCATE)
+
+
+def gaussian_block(arr: np.ndarray, sigma: float, method: str = FIR, out: np.ndarray = None) -> np.ndarray:
+    """ 2D gaussian of every band of (lines, samples[, bands]) block
+
+    :param out: output array, could be arr for in-place filtering
+    """
+    if not sigma:
+        if out is None:
+            return arr.copy()
+        out[...] = arr
+        return out
+    if out is None:
+        out = np.empty_like(arr)
+    """ 1D passes filter line by line, so in-place output is safe """
+    filter1d(arr, sigma, 0, method, out)
+    return filter1d(out, sigma, 1, method, out)
+
+
+class StripGaussian(object):
+    """ gaussian of image processed by strips of rows
+
+    every call gets block of rows [start, start + len(block)) = strip + halo rows,
+    with halo >= self.halo (or at image borders) FIR result equals gaussian_block of whole image.
+    Strips are expected in top-down order, horizontal pass of rows shared with previous block is reused.
+    """
+
+    def __init__(self, sigma: float, method: str = FIR, truncate=TRUNCATE):
+        self.sigma = sigma
+        self.method = resolve_method(sigma, method)
+        self.halo = radius(sigma, truncate)
+        self._rows = None  # type: np.ndarray
+        self._start = 0
+
+    def reset(self):
+        self._rows = None
+
+    def __call__(self, block: np.ndarray, start: int, lo: int, hi: int) -> np.ndarray:
+        """ filtered rows [lo, hi) of the image
+
+        :param block: image rows starting at start
+        :param start: image row of block[0]
+        """
+        stop = start + block.shape[0]
+        h = np.empty(block.shape, dtype=np.result_type(block.dtype, np.float32))
+        done = start
+        if self._rows is not None and self._start <= start < self._start + self._rows.shape[0]:
+            done = min(self._start + self._rows.shape[0], stop)
+            h[:done - start] = self._rows[start - self._start:done - self._start]
+        if done < stop:
+            filter1d(block[done - start:], self.sigma, 1, self.method, h[done - start:])
+        self._rows, self._start = h, start
+        return filter1d(h, self.sigma, 0, self.method)[lo - start:hi - start]
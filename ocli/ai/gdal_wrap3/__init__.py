@@ -9,6 +9,7 @@ from osgeo import gdal
 from osgeo.gdalconst import GA_ReadOnly, GCI_GrayIndex
 
 from ocli.ai.recipe import Recipe
+from ocli.util import metrics
 
 MIN_RECIPE_VER = 1.3
 def _get_zoom(resolution: float):
@@ -203,6 +204,10 @@ class GDALWrap3(object):
     # noinspection PyUnresolvedReferences
     # @profile
     def make_cog(self, callback=None, warp_resampleAlg='near', overview_resampleAlg='nearest'):
+        with metrics.run('makecog', self.recipe.get('OUTDIR'), recipe=self.recipe.get('friendly_name')):
+            return self._make_cog(callback, warp_resampleAlg, overview_resampleAlg)
+
+    def _make_cog(self, callback=None, warp_resampleAlg='near', overview_resampleAlg='nearest'):
         _callback = callback if callback else self.translate_callback
         if not os.path.isfile(self.input_file):
             raise AssertionError("File does not not exists! %s", self.input_file)
@@ -303,11 +308,13 @@ class GDALWrap3(object):
 
         self.log.debug('translating.....')
 
-        cds = gdal.Translate(self.cog_file, dsw, options=op_t_1)  # type: gdal.Dataset
-        cds.BuildOverviews(overview_resampleAlg, levels, callback=self.warp_callback)
-        self.log.debug('flushing caches.....')
+        with metrics.span('translate'):
+            cds = gdal.Translate(self.cog_file, dsw, options=op_t_1)  # type: gdal.Dataset
+        with metrics.span('overviews', levels=len(levels)):
+            cds.BuildOverviews(overview_resampleAlg, levels, callback=self.warp_callback)
+            self.log.debug('flushing caches.....')
 
-        cds.FlushCache()
+            cds.FlushCache()
         # _info = gdal.Info(cds, format='json')  # use json to get dict
         self.log.debug('Done.')
         return True
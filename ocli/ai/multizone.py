@@ -0,0 +1,161 @@
+"""
+Multi-ROI single-pass prediction.
+
+Recipes of several ROIs on the same stack are grouped: overlapping (or close) zones are merged into tiles,
+every tile is assembled and predicted once (in OUTDIR common for all recipes, '.multizone/<tile>' subdirectory),
+then zone_tnsr, zone_bd, zone_prob_pred and the tensor header of every ROI are cut from the tile results,
+so 'ai visualize zone', 'ai makecog zone' and previews work per ROI as usual.
+
+NOTE: filters (diffusion, gaussian) see the tile context, so pixels near ROI window edges
+could differ slightly from the single ROI run.
+"""
+import copy
+import logging
+import os
+from typing import List
+
+import numpy as np
+
+from ocli.ai import pyramid, tensor_store
+from ocli.ai.Envi import Envi, header_transform_map_for_zone
+from ocli.ai.assemble import Assemble
+from ocli.ai.process import Process
+from ocli.ai.recipe import Recipe
+from ocli.ai.util import Filenames
+
+log = logging.getLogger('multizone')
+
+""" recipe keys which should be the same for all recipes processed together """
+SHARED_KEYS = ['DATADIR', 'channels', 'products', 'PREDICTOR_DIR', 'learn_channels', 'predict_gauss',
+               'gauss_method', 'predict_folded', 'tensor_quantize', 'tensor_format', 'timeseries']
+""" zones closer than this (pixels) are merged into one tile """
+MERGE_MARGIN = 64
+TILES_DIR = '.multizone'
+
+
+def _box(zone) -> tuple:
+    z = np.array(zone, dtype=np.int64)
+    return int(z[0][0]), int(z[0][1]), int(z[1][0]), int(z[1][1])
+
+
+def merge_zones(zones: List, margin=MERGE_MARGIN) -> (List[tuple], List[int]):
+    """ merge overlapping zones into tiles
+
+    :param zones: list of [[y0, x0], [y1, x1]]
+    :param margin: zones with gap less than margin are merged
+    :return: (tiles as (y0, x0, y1, x1), tile number for every zone)
+    """
+    tiles = [_box(z) for z in zones]
+    members = [[i] for i in range(len(tiles))]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(tiles)):
+            for j in range(i + 1, len(tiles)):
+                a, b = tiles[i], tiles[j]
+                if a[0] - margin < b[2] and b[0] - margin < a[2] and a[1] - margin < b[3] and b[1] - margin < a[3]:
+                    tiles[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    members[i] += members[j]
+                    del tiles[j], members[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    tile_of = [0] * len(zones)
+    for t, m in enumerate(members):
+        for i in m:
+            tile_of[i] = t
+    return tiles, tile_of
+
+
+def check_recipes(recipes: List[Recipe]):
+    if not recipes:
+        raise AssertionError('No recipes')
+    for r in recipes:
+        if r.get('zone') is None:
+            raise AssertionError(f"Recipe {r.file if isinstance(r.file, str) else ''} has no zone")
+        for k in SHARED_KEYS:
+            if r.get(k) != recipes[0].get(k):
+                raise AssertionError(f"Recipes could not be processed together: '{k}' differs")
+
+
+def tile_recipe(recipe: Recipe, tile: tuple, outdir: str) -> Recipe:
+    _r = copy.deepcopy(dict(recipe))
+    _r['zone'] = [[tile[0], tile[1]], [tile[2], tile[3]]]
+    _r['OUTDIR'] = outdir
+    return Recipe(_r)
+
+
+def _cut(src: str, dst: str, y: int, x: int, shape: tuple):
+    """ stored values are cut, quantised tensor keeps gains/offsets of the tile header """
+    arr = tensor_store.open_tensor(src, raw=True)
+    part = np.ascontiguousarray(arr[y:y + shape[0], x:x + shape[1]])
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tensor_store.save_tensor(dst, part, tensor_store.tensor_format(src))
+    return part
+
+
+class MultiZone(object):
+    """ assemble and predict ROI zones of one stack in a single pass
+
+    :param recipes: ROI recipes, zone mode
+    :param envi: Envi used to read stack headers
+    """
+    log = logging.getLogger('multizone')
+
+    def __init__(self, recipes: List[Recipe], envi: Envi, margin=MERGE_MARGIN):
+        check_recipes(recipes)
+        self.recipes = recipes
+        self.envi = envi
+        self.tiles, self.tile_of = merge_zones([r['zone'] for r in recipes], margin)
+        _root = os.path.commonpath([os.path.abspath(r['OUTDIR']) for r in recipes])
+        self.tiles_dir = os.path.join(_root, TILES_DIR)
+
+    def tile_outdir(self, tile: tuple) -> str:
+        return os.path.join(self.tiles_dir, '_'.join(str(v) for v in tile))
+
+    @property
+    def saved_ratio(self) -> float:
+        """ 1 - (tile pixels / sum of zone pixels) """
+        zones = sum((b[2] - b[0]) * (b[3] - b[1]) for b in (_box(r['zone']) for r in self.recipes))
+        tiles = sum((t[2] - t[0]) * (t[3] - t[1]) for t in self.tiles)
+        return 1 - tiles / zones if zones else 0
+
+    def run(self, progress=None) -> int:
+        """ assemble and predict every tile with recipes predictor, then split results per ROI
+
+        :param progress: callback(total, current, msg)
+        """
+        self.log.info(f"{len(self.recipes)} zones merged into {len(self.tiles)} tiles, "
+                      f"pixels saved {self.saved_ratio:.0%}")
+        for t, tile in enumerate(self.tiles):
+            _tr = tile_recipe(self.recipes[0], tile, self.tile_outdir(tile))
+            self.log.info(f"tile {t + 1}/{len(self.tiles)} {tile}")
+            if Assemble('zone', _tr, self.envi).run(progress) != 0:
+                raise RuntimeError(f"Could not assemble tile {tile}")
+            if Process('zone', 'predict', _tr).run(callback=progress) != 0:
+                raise RuntimeError(f"Could not process tile {tile}")
+            for i, r in enumerate(self.recipes):
+                if self.tile_of[i] == t:
+                    self.split(_tr, tile, r)
+        return 0
+
+    def split(self, tile_recipe: Recipe, tile: tuple, recipe: Recipe):
+        """ cut ROI zone results from tile results """
+        src = Filenames('zone', tile_recipe)
+        dst = Filenames('zone', recipe)
+        z = _box(recipe['zone'])
+        y, x = z[0] - tile[0], z[1] - tile[1]
+        shape = (z[2] - z[0], z[3] - z[1])
+        _cut(src.tnsr, dst.tnsr, y, x, shape)
+        _cut(src.bd, dst.bd, y, x, shape)
+        _cut(src.prob_pred, dst.prob_pred, y, x, shape)
+        _, hdict = self.envi.read_header(src.tnsr_hdr, is_fullpath=True)
+        hdict['map info'] = header_transform_map_for_zone(hdict, zoneY=y, zoneX=x)
+        hdict['lines'] = shape[0]
+        hdict['samples'] = shape[1]
+        self.envi.save_dict_to_hdr(dst.tnsr_hdr, hdict)
+        """ header is saved first, overviews of quantised tensor are built from its float values """
+        pyramid.remove_overviews(dst.tnsr)
+        pyramid.build_overviews(dst.tnsr)
+        self.log.info(f"zone {z} results saved to {recipe['OUTDIR']}")
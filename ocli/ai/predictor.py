@@ -0,0 +1,236 @@
+"""
+Predictor (gm.pkl + tnorm.npy) registry.
+
+Predictors are loaded once per process and kept in memory, registry key is file path + mtime/size,
+if file was touched but content is the same (sha1) cached predictor is reused.
+Lightweight metadata sidecar (gm.meta.json) lets validation check predictor without unpickling the model.
+
+Folded predictor (load_predictor(..., folded=True)) classifies raw tensor values:
+normalisation x' = (x - mean) / std is affine and gaussian filter is linear, so it is folded into GM means and
+covariances once (means = mean + std * means', covariances = D * covariances' * D, D = diag(std)),
+log-likelihood of all components is shifted by the same constant, so predict_proba is not changed.
+
+Stored values of quantised tensor (value = stored * gain + offset, see ocli.ai.tensor_store) are affine too:
+load_predictor(..., scale=(gain, offset)) returns predictor of stored values with
+mean' = (mean - offset) / gain, std' = std / gain, so prediction does not dequantise the tensor.
+"""
+import json
+import logging
+import os
+from copy import deepcopy
+from hashlib import sha1
+from pickle import dump, loads
+from typing import Dict, Optional
+
+import numpy as np
+
+log = logging.getLogger('predictor')
+
+GM_FILE = 'gm.pkl'
+TNORM_FILE = 'tnorm.npy'
+META_FILE = 'gm.meta.json'
+""" gm path -> (stat key, sha1, Predictor) """
+_registry = {}
+
+
+def _stat_key(fname) -> tuple:
+    st = os.stat(fname)
+    return st.st_mtime_ns, st.st_size
+
+
+class Predictor(object):
+    """ fitted GaussianMixture with normalisation params
+
+    :param gm: sklearn GaussianMixture
+    :param tnorm: (n_features, 2) array of [mean, std] used for tensor normalisation
+    """
+
+    def __init__(self, gm, tnorm: np.ndarray, digest: str = None):
+        self.gm = gm
+        self.tnorm = np.array(tnorm, dtype=np.float64)
+        self.tnorm.setflags(write=False)
+        self.digest = digest
+        self.n_components = int(gm.n_components)
+        self.n_features = int(gm.means_.shape[1])
+        """ normalisation params ready to broadcast over (H,W,C) tensor """
+        self.mean = self.tnorm[np.newaxis, np.newaxis, :, 0]
+        self.std = self.tnorm[np.newaxis, np.newaxis, :, 1]
+        """ True if gm classifies not normalised values """
+        self.is_folded = False
+        self._folded = None
+        self._scaled = {}
+
+    @property
+    def meta(self) -> Dict:
+        return {
+            'n_components': self.n_components,
+            'n_features': self.n_features,
+            'tnorm_channels': int(self.tnorm.shape[0]),
+            'covariance_type': self.gm.covariance_type,
+            'sha1': self.digest,
+        }
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        return self.gm.predict_proba(x)
+
+    def folded(self) -> 'Predictor':
+        """ predictor of raw values with normalisation folded into the model, computed once,
+        self if covariances could not be folded ('spherical' with different std of channels)
+        """
+        if self.is_folded:
+            return self
+        if self._folded is None:
+            gm = fold_normalisation(self.gm, self.tnorm)
+            if gm is None:
+                log.debug(f"{self.gm.covariance_type} covariances could not be folded, predictor is not folded")
+                self._folded = self
+            else:
+                tnorm = np.zeros_like(self.tnorm)
+                tnorm[:, 1] = 1
+                self._folded = Predictor(gm, tnorm, self.digest)
+                self._folded.is_folded = True
+        return self._folded
+
+
+    def scaled(self, gain: np.ndarray, offset: np.ndarray) -> 'Predictor':
+        """ predictor of stored values of quantised tensor, computed once per (gain, offset)
+
+        :param gain: gain of every feature (learn channel)
+        :param offset: offset of every feature
+        """
+        if self.is_folded:
+            raise AssertionError("Folded predictor could not be scaled, scale it before folding")
+        gain = np.asarray(gain, dtype=np.float64)
+        offset = np.asarray(offset, dtype=np.float64)
+        if gain.shape != (self.tnorm.shape[0],) or offset.shape != gain.shape:
+            raise AssertionError(f"Predictor of {self.tnorm.shape[0]} channels got {gain.size} gains"
+                                 f" and {offset.size} offsets")
+        if not (gain > 0).all():
+            raise AssertionError(f"Quantised tensor gains should be positive: {gain}")
+        key = (gain.tobytes(), offset.tobytes())
+        if key not in self._scaled:
+            tnorm = np.empty_like(self.tnorm)
+            tnorm[:, 0] = (self.tnorm[:, 0] - offset) / gain
+            tnorm[:, 1] = self.tnorm[:, 1] / gain
+            self._scaled[key] = Predictor(self.gm, tnorm, self.digest)
+        return self._scaled[key]
+
+
+def fold_normalisation(gm, tnorm: np.ndarray):
+    """ copy of GaussianMixture of normalised features as mixture of raw features, see module doc
+
+    :return: folded GaussianMixture or None if covariances could not be folded
+    """
+    mean = np.asarray(tnorm[:gm.means_.shape[1], 0], dtype=np.float64)
+    std = np.asarray(tnorm[:gm.means_.shape[1], 1], dtype=np.float64)
+    ct = gm.covariance_type
+    if ct == 'spherical' and not np.allclose(std, std[0]):
+        return None
+    f = deepcopy(gm)
+    f.means_ = mean + std * gm.means_
+    if ct == 'full':
+        f.covariances_ = gm.covariances_ * std[np.newaxis, :, np.newaxis] * std[np.newaxis, np.newaxis, :]
+        f.precisions_cholesky_ = gm.precisions_cholesky_ / std[np.newaxis, :, np.newaxis]
+        f.precisions_ = gm.precisions_ / std[np.newaxis, :, np.newaxis] / std[np.newaxis, np.newaxis, :]
+    elif ct == 'tied':
+        f.covariances_ = gm.covariances_ * std[:, np.newaxis] * std[np.newaxis, :]
+        f.precisions_cholesky_ = gm.precisions_cholesky_ / std[:, np.newaxis]
+        f.precisions_ = gm.precisions_ / std[:, np.newaxis] / std[np.newaxis, :]
+    elif ct == 'diag':
+        f.covariances_ = gm.covariances_ * std ** 2
+        f.precisions_cholesky_ = gm.precisions_cholesky_ / std
+        f.precisions_ = gm.precisions_ / std ** 2
+    else:
+        f.covariances_ = gm.covariances_ * std[0] ** 2
+        f.precisions_cholesky_ = gm.precisions_cholesky_ / std[0]
+        f.precisions_ = gm.precisions_ / std[0] ** 2
+    return f
+
+
+def meta_file_name(predictor_dir: str) -> str:
+    return os.path.join(predictor_dir, META_FILE)
+
+
+def write_metadata(predictor_dir: str, p: Predictor):
+    """ save metadata sidecar, gm.pkl and tnorm.npy stats are saved to detect outdated sidecar """
+    meta = dict(p.meta)
+    meta['gm_stat'] = list(_stat_key(os.path.join(predictor_dir, GM_FILE)))
+    meta['tnorm_stat'] = list(_stat_key(os.path.join(predictor_dir, TNORM_FILE)))
+    try:
+        with open(meta_file_name(predictor_dir), 'w') as _f:
+            json.dump(meta, _f, indent=4)
+    except OSError as e:
+        log.warning(f"Could not save predictor metadata: {e}")
+
+
+def save_predictor(predictor_dir: str, gm, tnorm: np.ndarray) -> Predictor:
+    """ save gm.pkl, tnorm.npy and metadata, register saved predictor """
+    os.makedirs(predictor_dir, exist_ok=True)
+    gm_file = os.path.join(predictor_dir, GM_FILE)
+    np.save(os.path.join(predictor_dir, TNORM_FILE), tnorm)
+    with open(gm_file, 'wb') as _f:
+        dump(gm, _f)
+    with open(gm_file, 'rb') as _f:
+        digest = sha1(_f.read()).hexdigest()
+    p = Predictor(gm, tnorm, digest)
+    _registry[gm_file] = ((_stat_key(gm_file), _stat_key(os.path.join(predictor_dir, TNORM_FILE))), digest, p)
+    write_metadata(predictor_dir, p)
+    return p
+
+
+def load_predictor(predictor_dir: str, folded=False, scale: Optional[tuple] = None) -> Predictor:
+    """ registered predictor, loaded from disk only if files were changed
+
+    :param folded: return predictor of not normalised values, see Predictor.folded()
+    :param scale: (gain, offset) of features, predictor of stored values of quantised tensor, see Predictor.scaled()
+    """
+    gm_file = os.path.join(predictor_dir, GM_FILE)
+    tnorm_file = os.path.join(predictor_dir, TNORM_FILE)
+    key = (_stat_key(gm_file), _stat_key(tnorm_file))
+    _c = _registry.get(gm_file)
+    if _c and _c[0] == key:
+        return _adapt(_c[2], folded, scale)
+    with open(gm_file, 'rb') as _f:
+        raw = _f.read()
+    digest = sha1(raw).hexdigest()
+    tnorm = np.load(tnorm_file)
+    if _c and _c[1] == digest and np.array_equal(_c[2].tnorm, tnorm):
+        log.debug(f"predictor {predictor_dir} touched but not changed")
+        p = _c[2]
+    else:
+        log.info(f"loading predictor {predictor_dir}")
+        p = Predictor(loads(raw), tnorm, digest)
+    _registry[gm_file] = (key, digest, p)
+    _meta = read_metadata(predictor_dir, load=False)
+    if _meta is None:
+        write_metadata(predictor_dir, p)
+    return _adapt(p, folded, scale)
+
+
+def _adapt(p: Predictor, folded: bool, scale: Optional[tuple]) -> Predictor:
+    if scale is not None:
+        p = p.scaled(*scale)
+    return p.folded() if folded else p
+
+
+def read_metadata(predictor_dir: str, load=True) -> Optional[Dict]:
+    """ predictor metadata: n_components, n_features, tnorm_channels ...
+
+    :param load: if sidecar is missed or outdated load predictor (and write sidecar)
+    :return: metadata or None if sidecar is not valid and load is False
+    """
+    try:
+        with open(meta_file_name(predictor_dir), 'r') as _f:
+            meta = json.load(_f)
+        if tuple(meta['gm_stat']) == _stat_key(os.path.join(predictor_dir, GM_FILE)) and \
+                tuple(meta['tnorm_stat']) == _stat_key(os.path.join(predictor_dir, TNORM_FILE)):
+            return meta
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    if not load:
+        return None
+    return load_predictor(predictor_dir).meta
+
+
+def clear_registry():
+    _registry.clear()
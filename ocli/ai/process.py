@@ -1,16 +1,18 @@
 import json
 import logging
 import os
-from pickle import dump, load
 
 import numpy as np
-from scipy.ndimage.filters import gaussian_filter
 from sklearn.cluster import MiniBatchKMeans
 from sklearn.mixture import GaussianMixture as GM
 from sklearn.utils import shuffle
 
+from ocli.ai import tensor_store
+from ocli.ai import predictor as predictor_registry
+from ocli.ai.filter.gauss import FIR, StripGaussian, gaussian_block
 from ocli.ai.recipe import Recipe
 from ocli.ai.util import Filenames
+from ocli.util import metrics
 
 
 class Process(object):
@@ -63,6 +65,11 @@ class Process(object):
     def __fit(self,tnsr):
         pass
     def run(self, precision=np.uint8, clipping=True, callback=None):
+        with metrics.run('process', self.WORKDIR, mode=self.mode, type=self.type,
+                         recipe=self.recipe.get('friendly_name')):
+            return self._run(precision, clipping, callback)
+
+    def _run(self, precision=np.uint8, clipping=True, callback=None):
         self._progress_cb = callback
         if self.type not in ('fit', 'predict', 'fitpredict'):
             self.log.error("Bad mode '%s'. Allowed  [fit|predict|fitpredict]", self.mode)
@@ -87,11 +94,20 @@ class Process(object):
         self._restart_porgress(3)
         self.progress('loading tensor', 1)
 
-        tnsr = np.load(tnsr_file) # type: np.ndarray
+        """ only learn channels are read (chunked tensor decompresses only their chunks),
+        prediction reads stored values of quantised tensor, gains and offsets are folded into predictor
+        """
+        scale = None
+        with metrics.span('load', file='tnsr') as _load:
+            tnsr = tensor_store.open_tensor(tnsr_file, raw=self.type == 'predict')[..., cselect]  # type: np.ndarray
+            if self.type == 'predict' and tnsr.dtype.kind == 'u':
+                q = tensor_store.read_quantization(tnsr_file)
+                if q is not None:
+                    scale = tuple(v[list(cselect)] for v in q)
+                    _load.tags['quantized'] = tnsr.dtype.name
+            bad_data = np.load(bad_data_file)
         self.log.info(f"tensor loaded from {tnsr_file}")
-        bad_data = np.load(bad_data_file)
         # TODO do not make tnsr_copy (tnsr_or) better open it again
-        tnsr = tnsr[..., cselect]
         self.log.debug({'tnsr.shape': tnsr.shape})
         if self.type == 'fitpredict' or self.type == 'fit':
             n_clusters = self.recipe['num_clusters']
@@ -99,14 +115,16 @@ class Process(object):
             if self.type == 'fitpredict':
                 tnsr_or = tnsr.copy()
             tnorm = np.empty((tnsr.shape[-1], 2))
-            for n in range(tnsr.shape[-1]):  # type: int
-                tnorm[n, 0] = tnsr[..., n].mean()
-                tnsr[..., n] -= tnorm[n, 0]
-                tnorm[n, 1] = tnsr[..., n].std()
-                tnsr[..., n] /= tnorm[n, 1]
-                # tnsr[bad_data,n] = tnorm[n,0]
-                if gauss_sz:
-                    tnsr[..., n] = gaussian_filter(tnsr[..., n], gauss_sz)
+            with metrics.span('normalise'):
+                for n in range(tnsr.shape[-1]):  # type: int
+                    tnorm[n, 0] = tnsr[..., n].mean()
+                    tnsr[..., n] -= tnorm[n, 0]
+                    tnorm[n, 1] = tnsr[..., n].std()
+                    tnsr[..., n] /= tnorm[n, 1]
+                    # tnsr[bad_data,n] = tnorm[n,0]
+            if gauss_sz:
+                with metrics.span('gauss'):
+                    gaussian_block(tnsr, gauss_sz, self.recipe.get('gauss_method', FIR), out=tnsr)
 
             tnsr_learn = tnsr[~bad_data, :].reshape((-1, tnsr.shape[-1]))
             self.progress(f'KMeans clusters: {n_clusters}', 1)
@@ -114,36 +132,42 @@ class Process(object):
             self.log.info(f'KMeans clusters: {n_clusters}')
             tnsr_learn = shuffle(tnsr_learn)
 
-            predictor = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1000000, compute_labels=False).fit(tnsr_learn)
-            os.makedirs(os.path.dirname(tnorm_file), exist_ok=True)
-            np.save(tnorm_file, tnorm)
-            self.log.info(f"tnorm file saved to {gm_file}")
+            with metrics.span('kmeans'):
+                predictor = MiniBatchKMeans(n_clusters=n_clusters, batch_size=1000000,
+                                            compute_labels=False).fit(tnsr_learn)
             cc = np.array(predictor.cluster_centers_)
             # self.log.debug(cc)
             self.progress('Fitting model', 1)
             gm = GM(cc.shape[0], max_iter=10, means_init=cc, tol=0.01)
             self.log.info(f"fitting GM {cc.shape}")
-            gm.fit(shuffle(tnsr_learn)[:(4000000 if self.mode == 'full' else 2000000)])
-            os.makedirs(os.path.dirname(gm_file), exist_ok=True)
-            dump(gm, open(gm_file, 'wb'))
-            self.log.info(f"gm file saved to {gm_file}")
+            with metrics.span('gm_fit'):
+                gm.fit(shuffle(tnsr_learn)[:(4000000 if self.mode == 'full' else 2000000)])
+            with metrics.span('save', file='predictor'):
+                predictor_registry.save_predictor(os.path.dirname(gm_file), gm, tnorm)
+            self.log.info(f"gm file saved to {gm_file}, tnorm file saved to {tnorm_file}")
             self._generate_config(n_clusters, save=True)
             if self.type == 'fitpredict':
                 tnsr = tnsr_or
             else:
                 return 0
         self._restart_porgress(1)
-        self.progress('loading tensor', 0)
-        tnorm = np.load(tnorm_file)
-        self.progress('tensor loaded', 1)
-        # predictor = load(open(DATADIR+'predictor.pkl','rb'))
-        gm = load(open(gm_file, 'rb'))  # type: GM
+        self.progress('loading predictor', 0)
+        """ predictor is loaded once per process, see ocli.ai.predictor
+        folded predictor classifies raw values, so strips are not copied and normalised
+        """
+        with metrics.span('load', file='predictor'):
+            _p = predictor_registry.load_predictor(os.path.dirname(gm_file),
+                                                   folded=self.recipe.get('predict_folded', True), scale=scale)
+        self.progress('predictor loaded', 1)
+        gm = _p.gm  # type: GM
         Ncc = len(gm.weights_)
 
         # TODO make in on-dist memmap file
         prob_pred = np.empty(tnsr.shape[:-1] + (Ncc,), dtype=precision)
 
         gauss_sz = self.recipe['predict_gauss']
+        """ strips are read with halo rows for gaussian, halo rows are filtered once and are not classified """
+        strip_gauss = StripGaussian(gauss_sz, self.recipe.get('gauss_method', FIR)) if gauss_sz else None
         """
         TODO
         ns param should be auto-selected cause tstr defined by it and 
@@ -158,64 +182,81 @@ class Process(object):
                 ns 100 exec 7.5 sec
                 ns 50  exec 
         some magic: on win if ppstr.nbytes close to 32M we have best time
-        ppstr.nbytes = (ns+2*d)*width*K * float64.size
+        ppstr.nbytes = ns*width*K * float64.size
         where K  - number of clusters = gm.n_components
               width is image width
-        ns = 32M/(W*K*8) -2d
+        ns = 32M/(W*K*8)
         ********************************************
         32M - this is like sum of CPU L3 caches
         since intel 8-gen CPU could have 'smart'
         L3 cache its not clear how to get this value
         ********************************************
         """
-        d = int(gauss_sz * 2.5)+2  # number of _strings_ to read
-        ns = np.math.ceil(
-            (9 * 6) * 1024 * 1024 / (tnsr.shape[1] * gm.n_components * np.dtype(np.float64).itemsize)) - 2 * d
+        d = strip_gauss.halo if strip_gauss else 0  # number of _strings_ to read
+        ns = max(1, np.math.ceil(
+            (9 * 6) * 1024 * 1024 / (tnsr.shape[1] * gm.n_components * np.dtype(np.float64).itemsize)))
         self.log.info(f"computed step = {ns} for width {tnsr.shape[1]} and num clusters {gm.n_components}")
         # ns=27
         clip_val = 255 * 0.2 if precision == np.uint8 else 0.01
-        # preallocate memory
-        ppstr = np.zeros((tnsr.shape[1] * (ns + 2 * d), gm.n_components), dtype=np.float64)
         iters = tnsr.shape[0]
         self._restart_porgress(iters)
+        _normalise = metrics.span('normalise', strips=True)
+        _gauss = metrics.span('gauss', strips=True)
+        _predict = metrics.span('predict_proba', strips=True)
+        """ only valid pixels are classified, strips without valid pixels are skipped """
+        valid_total = 0
+        skipped_strips = 0
         for i in range(0, iters, ns):
             self.progress(f'Predicting {i} of {iters}', i)
+            hi = min(i + ns, iters)
             d1 = min(d, i)
-            d2 = max(0, min(tnsr.shape[0] - i - ns, d))
-            tstr = tnsr[i - d1:i + ns + d2, :, :].copy()
-            bdstr = bad_data[i - d1:i + ns + d2, :]
-
-            strshape = tstr.shape
-            tstr -= tnorm[np.newaxis, np.newaxis, :, 0]
-            tstr /= tnorm[np.newaxis, np.newaxis, :, 1]
+            d2 = min(iters - hi, d)
+            valid = ~bad_data[i:hi, :]
+            nvalid = int(np.count_nonzero(valid))
+            if not nvalid:
+                prob_pred[i:hi, ...] = 0
+                skipped_strips += 1
+                continue
+            valid_total += nvalid
+            if _p.is_folded:
+                tstr = tnsr[i - d1:hi + d2, :, :]
+            else:
+                """ float copy, stored values of quantised tensor are converted strip by strip """
+                tstr = tnsr[i - d1:hi + d2, :, :].astype(np.float32)
+                with _normalise:
+                    tstr -= _p.mean
+                    tstr /= _p.std
             # tstr[bdstr, :] = tnorm[:,0]
-            if gauss_sz:
-                for n in range(tstr.shape[-1]):
-                    tstr[..., n] = gaussian_filter(tstr[..., n], gauss_sz)
+            if strip_gauss:
+                with _gauss:
+                    tstr = strip_gauss(tstr, i - d1, i, hi)
 
-            ppstr = gm.predict_proba(tstr.reshape((-1, strshape[-1])))  # type: np.array
+            with _predict:
+                ppstr = gm.predict_proba(tstr[valid])  # type: np.array
             self.log.debug(
                 f'{i} of {iters}: GM ppstr.nbytes {ppstr.nbytes} ppstr.shape {ppstr.shape} tstr.size {tstr.nbytes} tsrt.shape {tstr.shape}')
             if precision == np.uint8:
-                ppstr = (ppstr * 255).astype(np.uint8).reshape(strshape[:-1] + (Ncc,))
+                ppstr = (ppstr * 255).astype(np.uint8)
             else:
-                ppstr = ppstr.astype(np.float32).reshape(strshape[:-1] + (Ncc,))
-
-            # prob_pred[i:i+ns,...] = ppstr
-            ppstr = np.where(bdstr[..., np.newaxis], 0, ppstr)
+                ppstr = ppstr.astype(np.float32)
             if clipping:
                 ppstr[ppstr < clip_val] = 0
-            if d2 == 0:
-                prob_pred[i:i + ns, ...] = ppstr[d1:, ...]
-            else:
-                prob_pred[i:i + ns, ...] = ppstr[d1:-d2, ...]
+            """ scatter back, bad pixels are 0 """
+            _out = prob_pred[i:hi, ...]
+            _out[...] = 0
+            _out[valid] = ppstr
+        skipped = 1 - valid_total / bad_data.size if bad_data.size else 0.
+        _predict.tags.update(skipped=round(skipped, 4), skipped_strips=skipped_strips)
+        self.log.info(f"classified {valid_total} of {bad_data.size} pixels, skipped {skipped:.1%}"
+                      f" ({skipped_strips} strips without valid pixels)")
         self.progress(f'Predicted ', iters)
         ############### saving results
         if not os.path.exists(self.WORKDIR):
             os.makedirs(self.WORKDIR)
         self._restart_porgress(1)
         self.progress(f'Saving results', 0)
-        np.save(prob_pred_file, prob_pred)
+        with metrics.span('save', file='prob_pred'):
+            tensor_store.save_tensor(prob_pred_file, prob_pred, self.recipe.get('tensor_format'))
         self.progress(f'Saved {prob_pred_file}', 1)
         self.log.info("Process results saved as '%s'", prob_pred_file)
 
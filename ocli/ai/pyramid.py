@@ -0,0 +1,139 @@
+"""
+Reduced resolution overviews (2x, 4x, 8x, ...) for tensors, stack bands and prediction images.
+
+Overviews are stored near the source file as plain numpy files:
+    zone_tnsr.npy      -> zone_tnsr.ovr2.npy, zone_tnsr.ovr4.npy ...
+    <stack_band>.img   -> <stack_band>.ovr2.npy ...
+    zone_pred8c.img    -> zone_pred8c.ovr2.npy ... (written by Visualize and ComposeImage, as previewed)
+every level is a block-mean of the previous one, remainder rows/cols are dropped.
+"""
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from ocli.ai import tensor_store
+
+log = logging.getLogger('pyramid')
+
+OVERVIEW_LEVELS = (2, 4, 8, 16, 32)
+""" coarsest level still should have at least OVERVIEW_MIN_SIZE pixels on the shortest side """
+OVERVIEW_MIN_SIZE = 128
+""" default preview resolution (longest side in pixels), matplotlib 10x10 inches figure at 100 dpi"""
+PREVIEW_RESOLUTION = 1000
+""" rows of the source read at once while building the first level """
+_STRIP_ROWS = 1024
+
+
+def overview_path(fname: str, factor: int) -> str:
+    """ overview file name for the given source file and reduction factor
+
+    :param fname: source file name WITH extension (.npy or .img)
+    :param factor:  reduction factor
+    """
+    base, _ = os.path.splitext(fname)
+    return f"{base}.ovr{factor}.npy"
+
+
+def _reduce(arr: np.ndarray, factor: int) -> np.ndarray:
+    """ block mean of 2D (HxW) or 3D (HxWxC) array, remainder is dropped """
+    h = (arr.shape[0] // factor) * factor
+    w = (arr.shape[1] // factor) * factor
+    a = np.asarray(arr[:h, :w], dtype=np.float32)
+    a = a.reshape((h // factor, factor, w // factor, factor) + a.shape[2:])
+    return a.mean(axis=(1, 3))
+
+
+def _cast(arr: np.ndarray, dtype) -> np.ndarray:
+    if np.issubdtype(dtype, np.integer):
+        return np.rint(arr).astype(dtype)
+    return arr.astype(dtype)
+
+
+def build_overviews(fname: str, arr: Optional[np.ndarray] = None,
+                    levels=OVERVIEW_LEVELS, min_size=OVERVIEW_MIN_SIZE) -> List[int]:
+    """ write overview levels for array stored in fname
+
+    :param fname: source file name (overview names are derived from it)
+    :param arr: array-like (could be memmap), if None fname is loaded as numpy memmap
+    :param levels: reduction factors, each should be 2x of previous one
+    :param min_size: do not create levels with shortest side less than min_size
+    :return: list of created factors
+    """
+    if arr is None:
+        arr = tensor_store.open_tensor(fname)
+    dtype = arr.dtype.newbyteorder('=')
+    created = []
+    levels = [f for f in levels if min(arr.shape[:2]) // f >= min_size]
+    if not levels:
+        log.debug(f"{fname}: image {arr.shape[:2]} is too small for overviews")
+        return created
+    """ first level is computed by strips to keep memory low on memmaps """
+    first = levels[0]
+    step = max(first, (_STRIP_ROWS // first) * first)
+    rows = (arr.shape[0] // first) * first
+    ovr = np.concatenate([_reduce(arr[i:min(i + step, rows)], first) for i in range(0, rows, step)], axis=0)
+    prev_factor = first
+    for factor in levels:
+        if factor != first:
+            ovr = _reduce(ovr, factor // prev_factor)
+            prev_factor = factor
+        np.save(overview_path(fname, factor), _cast(ovr, dtype))
+        created.append(factor)
+    log.info(f"{fname}: overviews {created} created")
+    return created
+
+
+def available_overviews(fname: str) -> List[int]:
+    """ up to date (newer than source) overview factors, ascending """
+    mtime = tensor_store.tensor_mtime(fname)
+    if mtime is None:
+        return []
+    res = []
+    for factor in OVERVIEW_LEVELS:
+        _f = overview_path(fname, factor)
+        if os.path.isfile(_f) and os.path.getmtime(_f) >= mtime:
+            res.append(factor)
+    return res
+
+
+def remove_overviews(fname: str):
+    for factor in OVERVIEW_LEVELS:
+        _f = overview_path(fname, factor)
+        if os.path.isfile(_f):
+            os.remove(_f)
+
+
+def select_overview(fname: str, shape, slice_range, resolution: Optional[int]) -> int:
+    """ coarsest available factor which still gives at least  resolution pixels on the longest side
+
+    :param fname: source file name
+    :param shape: full resolution shape  (H,W,...)
+    :param slice_range: (minY, minX, maxY, maxX) or (-1,...) for whole image
+    :param resolution: requested resolution in pixels, None or 0 - full resolution
+    :return: reduction factor, 1 - full resolution
+    """
+    if not resolution:
+        return 1
+    if slice_range[0] != -1:
+        size = max(slice_range[2] - slice_range[0], slice_range[3] - slice_range[1])
+    else:
+        size = max(shape[0], shape[1])
+    factor = 1
+    for f in available_overviews(fname):
+        if size // f >= resolution:
+            factor = f
+    return factor
+
+
+def overview_slice(slice_range, factor):
+    """ convert full resolution slice_range into overview coordinates """
+    if slice_range[0] == -1 or factor == 1:
+        return slice_range
+    return tuple(int(v) // factor for v in slice_range)
+
+
+def open_overview(fname: str, factor: int) -> np.ndarray:
+    """ memmap of the overview level """
+    return np.load(overview_path(fname, factor), mmap_mode='r')
@@ -1,12 +1,6 @@
 import json
 import logging
 import os
-from jsonschema import Draft7Validator, draft7_format_checker
-import json
-import logging
-import os
-
-from jsonschema import Draft7Validator, draft7_format_checker
 
 ENV_RECIPE = 'RECIPE'  # name of environment variable with json string
 
@@ -70,29 +64,18 @@ class Recipe(dict):
 
     def validate_schema(self):
         """
-        Draft7 formats: https://json-schema.org/understanding-json-schema/reference/string.html
-        for additional format validation refer https://python-jsonschema.readthedocs.io/en/stable/validate/
-        for ex. enable uri checks:  sudo -H pip3 install   rfc3987
-        :return:
+        validate recipe by SCHEMA_RECIPE, validator is compiled once per process (see ocli.ai.schema)
+        :return: None if recipe is valid, 1 otherwise
         """
         try:
-            import jsonsempai
-            with jsonsempai.imports():
-                from ocli.ai import recipe_schema
-            # my_path = os.path.abspath(os.path.dirname(__file__))
-            # path = os.path.join(my_path, "recipe_schema.json")
-            # f = open(path, 'r')
-            # schema = json.load(f)
-            # f.close()
-            schema = recipe_schema.properties.envelope
-            v = Draft7Validator(schema, format_checker=draft7_format_checker)
-            errors = sorted(v.iter_errors(self.recipe), key=lambda e: e.path)
+            from ocli.ai.schema import validate, SCHEMA_RECIPE
+            errors = validate(self.recipe, (SCHEMA_RECIPE,))
             if not len(errors):
                 self.log.info(f"recipe {self.file}: syntax is valid")
                 return None
             for error in errors:
-                self.log.error(f'{error.message} in {list(error.path)}')
-                return 1
+                self.log.error(error)
+            return 1
         except Exception as e:
             self.log.error(f'Could not perform validation: {e}')
             return 1
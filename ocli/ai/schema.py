@@ -0,0 +1,95 @@
+"""
+Recipe JSON-schema registry.
+
+Schemas are json files of packages, named like modules: 'ocli.ai.recipe_head_schema' is ocli/ai/recipe_head_schema.json,
+recipe schema is 'properties.envelope' of the file.
+Every schema file is loaded once per process, every combination of schemas
+(head + template schemas, later ones update earlier) is merged and compiled to Draft7Validator once.
+
+Draft7 formats: https://json-schema.org/understanding-json-schema/reference/string.html
+for additional format validation refer https://python-jsonschema.readthedocs.io/en/stable/validate/
+for ex. enable uri checks:  sudo -H pip3 install   rfc3987
+"""
+import collections.abc
+import json
+import logging
+import pkgutil
+from copy import deepcopy
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from jsonschema import Draft7Validator, draft7_format_checker
+
+log = logging.getLogger('schema')
+
+""" head fields, required by all tasks """
+SCHEMA_HEAD = 'ocli.ai.recipe_head_schema'
+""" full processing recipe """
+SCHEMA_RECIPE = 'ocli.ai.recipe_schema'
+
+
+def _merge(d: dict, u: dict) -> dict:
+    for k, v in u.items():
+        if isinstance(v, collections.abc.Mapping):
+            d[k] = _merge(d.get(k, {}), v)
+        else:
+            d[k] = v
+    return d
+
+
+@lru_cache(maxsize=None)
+def load_schema(name: str) -> dict:
+    """ recipe schema ('properties.envelope') of schema file, do not modify result
+
+    :param name: module-like name of json file, see SCHEMA_HEAD
+    """
+    package, _, resource = name.rpartition('.')
+    try:
+        raw = pkgutil.get_data(package, resource + '.json')
+    except (OSError, ImportError) as e:
+        raise AssertionError(f"Could not load schema '{name}': {e}")
+    if raw is None:
+        raise AssertionError(f"Could not load schema '{name}'")
+    return json.loads(raw.decode('utf-8'))['properties']['envelope']
+
+
+@lru_cache(maxsize=None)
+def get_validator(*names: str) -> Draft7Validator:
+    """ compiled validator of merged schemas, later schemas update earlier ones """
+    if not names:
+        raise AssertionError('At least one schema is required')
+    schema = {}
+    for n in names:
+        _merge(schema, deepcopy(load_schema(n)))
+    Draft7Validator.check_schema(schema)
+    log.debug(f"schema {' + '.join(names)} compiled")
+    return Draft7Validator(schema, format_checker=draft7_format_checker)
+
+
+def format_error(e) -> str:
+    if e.absolute_path:
+        return f'Recipe schema  "{".".join(str(p) for p in e.absolute_path)}" invalid : {e.message}'
+    return f"Recipe schema  {e.message}"
+
+
+def validate(recipe: Dict, names: Tuple[str, ...] = (SCHEMA_RECIPE,)) -> List[str]:
+    """ list of errors, empty for valid recipe """
+    v = get_validator(*names)
+    return [format_error(e) for e in sorted(v.iter_errors(recipe), key=lambda e: [str(p) for p in e.path])]
+
+
+def validate_many(recipes: Dict[str, Dict], names: Tuple[str, ...] = (SCHEMA_RECIPE,)) -> Dict[str, List[str]]:
+    """ {recipe name: list of errors} for many recipes, validator is compiled once """
+    return {k: validate(r, names) for k, r in recipes.items()}
+
+
+def aggregate(reports: Dict[str, List[str]]) -> List[list]:
+    """ [error, number of recipes, recipe names] rows, most frequent first
+
+    :param reports: result of validate_many()
+    """
+    _e = {}
+    for k, errors in reports.items():
+        for e in sorted(set(errors)):
+            _e.setdefault(e, []).append(k)
+    return sorted([[e, len(keys), keys] for e, keys in _e.items()], key=lambda x: -x[1])
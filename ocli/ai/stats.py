@@ -0,0 +1,225 @@
+"""
+Streaming band statistics for previews: histogram, min/max/mean/variance and approximate percentiles.
+
+Every band is read once by chunks of rows (memmaps and chunked tensors are not materialised),
+bands are processed in threads (numpy and zlib release GIL).
+Histogram has fixed number of fine bins over a range which is doubled when a chunk does not fit it
+(pairs of bins are merged, so counts stay exact), preview histogram and percentiles are computed from fine bins.
+
+Results are cached in sidecar <fname>.stats.json, cache is valid while source mtime is the same.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+log = logging.getLogger('stats')
+
+""" fine bins of streaming histogram, should be even """
+HIST_BINS = 4096
+CHUNK_ROWS = 512
+WORKERS = min(8, os.cpu_count() or 1)
+STATS_EXT = '.stats.json'
+PERCENTILES = (2, 50, 98)
+
+
+class BandStats(object):
+    """ one-pass statistics of band values, NaN and inf are skipped """
+
+    def __init__(self, bins=HIST_BINS):
+        self.bins = bins
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.lo = None
+        self.width = None
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def _grow(self, mn, mx):
+        """ double bin width until [mn, mx] fits the range """
+        while mn < self.lo or mx >= self.lo + self.width * self.bins:
+            merged = self.counts[0::2] + self.counts[1::2]
+            self.counts = np.zeros(self.bins, dtype=np.int64)
+            if mn < self.lo:
+                self.lo -= self.width * self.bins
+                self.counts[self.bins // 2:] = merged
+            else:
+                self.counts[:self.bins // 2] = merged
+            self.width *= 2
+
+    def add(self, x: np.ndarray):
+        x = np.asarray(x).reshape(-1)
+        x = x[np.isfinite(x)]
+        if not x.size:
+            return
+        mn, mx = float(x.min()), float(x.max())
+        """ moments of chunk are merged (Chan et al.) """
+        n = x.size
+        mean = float(x.mean(dtype=np.float64))
+        m2 = float(((x - mean) ** 2).sum(dtype=np.float64))
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        if self.lo is None:
+            span = mx - mn
+            self.lo = mn
+            self.width = span * (1 + 1e-6) / self.bins if span > 0 else max(abs(mn), 1.) * 1e-6
+            self.min, self.max = mn, mx
+        else:
+            self.min, self.max = min(self.min, mn), max(self.max, mx)
+        self._grow(mn, mx)
+        idx = ((x - self.lo) / self.width).astype(np.int64)
+        self.counts += np.bincount(np.clip(idx, 0, self.bins - 1), minlength=self.bins)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / self.count if self.count else float('nan')
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+    def percentile(self, q: float) -> float:
+        """ approximate, linear inside of fine bin """
+        if not self.count:
+            return float('nan')
+        cum = np.cumsum(self.counts)
+        target = q / 100. * self.count
+        i = int(np.searchsorted(cum, target))
+        i = min(i, self.bins - 1)
+        prev = cum[i - 1] if i else 0
+        frac = (target - prev) / self.counts[i] if self.counts[i] else 0.
+        return float(np.clip(self.lo + (i + frac) * self.width, self.min, self.max))
+
+    def histogram(self, bins: int) -> (np.ndarray, np.ndarray):
+        """ (counts, edges) of bins equal bins over [min, max] """
+        if not self.count:
+            return np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)
+        edges = np.linspace(self.min, self.max if self.max > self.min else self.min + 1, bins + 1)
+        """ values are uniform inside of fine bin: cumulative counts are interpolated at edges """
+        cum = np.concatenate(([0], np.cumsum(self.counts)))
+        fine = self.lo + np.arange(self.bins + 1) * self.width
+        counts = np.diff(np.round(np.interp(edges, fine, cum)))
+        counts[-1] += self.count - counts.sum()
+        return counts.astype(np.int64), edges
+
+    def describe(self) -> Dict:
+        res = {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean, 'std': self.std}
+        for q in PERCENTILES:
+            res[f'p{q}'] = self.percentile(q)
+        return res
+
+    def to_dict(self) -> Dict:
+        nz = np.nonzero(self.counts)[0]
+        return {
+            'bins': self.bins, 'count': self.count, 'mean': self.mean, 'm2': self.m2,
+            'min': self.min, 'max': self.max, 'lo': self.lo, 'width': self.width,
+            'nonzero': nz.tolist(), 'counts': self.counts[nz].tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> 'BandStats':
+        s = cls(d['bins'])
+        for k in ('count', 'mean', 'm2', 'min', 'max', 'lo', 'width'):
+            setattr(s, k, d[k])
+        s.counts[np.array(d['nonzero'], dtype=np.int64)] = d['counts']
+        return s
+
+
+class BandWindow(object):
+    """ lazy 2D window of one band of (lines, samples, bands) array-like (memmap, ChunkedArray, QuantizedArray)
+
+    :param window: (y0, x0, y1, x1) or None - whole band
+    """
+
+    def __init__(self, arr, band: int = None, window=None):
+        self.arr = arr
+        self.band = band
+        y0, x0, y1, x1 = window if window is not None else (0, 0, arr.shape[0], arr.shape[1])
+        self.y0, self.x0 = y0, x0
+        self.shape = (y1 - y0, x1 - x0)
+
+    def rows(self, r0: int, r1: int) -> np.ndarray:
+        key = (slice(self.y0 + r0, self.y0 + r1), slice(self.x0, self.x0 + self.shape[1]))
+        if self.band is not None:
+            key += (self.band,)
+        return np.asarray(self.arr[key])
+
+
+def band_stats(band: BandWindow, transform: Callable = None, rows=CHUNK_ROWS, bins=HIST_BINS) -> BandStats:
+    """ stream band by chunks of rows
+
+    :param transform: function applied to every chunk (clip, log, normalisation)
+    """
+    st = BandStats(bins)
+    for r in range(0, band.shape[0], rows):
+        x = band.rows(r, min(r + rows, band.shape[0]))
+        st.add(transform(x) if transform else x)
+    return st
+
+
+def stream_stats(bands: List[BandWindow], transforms: List[Optional[Callable]] = None,
+                 rows=CHUNK_ROWS, workers=WORKERS) -> List[BandStats]:
+    """ statistics of bands, bands are processed in parallel """
+    transforms = transforms if transforms else [None] * len(bands)
+    if len(bands) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda bt: band_stats(bt[0], bt[1], rows), zip(bands, transforms)))
+    return [band_stats(b, t, rows) for b, t in zip(bands, transforms)]
+
+
+def sidecar_name(fname: str) -> str:
+    return fname + STATS_EXT
+
+
+def cached_stats(fname: str, mtime: Optional[float], keys: List[str],
+                 compute: Callable[[List[int]], List[BandStats]]) -> List[BandStats]:
+    """ statistics from sidecar of fname, missed ones are computed and saved
+
+    :param mtime: source mtime, None - do not use cache
+    :param keys: cache key of every band (band, window, transform ...)
+    :param compute: function computing statistics for list of key indexes
+    """
+    if mtime is None:
+        return compute(list(range(len(keys))))
+    _f = sidecar_name(fname)
+    cache = {}
+    try:
+        with open(_f, 'r') as _c:
+            _d = json.load(_c)
+        if _d.get('mtime') == mtime:
+            cache = _d.get('stats', {})
+    except (OSError, ValueError):
+        pass
+    res = {}
+    for k in keys:
+        if k in cache:
+            try:
+                res[k] = BandStats.from_dict(cache[k])
+            except (KeyError, TypeError, ValueError):
+                pass
+    todo = [i for i, k in enumerate(keys) if k not in res]
+    if todo:
+        for i, s in zip(todo, compute(todo)):
+            res[keys[i]] = s
+            cache[keys[i]] = s.to_dict()
+        try:
+            with open(_f + '.tmp', 'w') as _c:
+                json.dump({'mtime': mtime, 'stats': cache}, _c)
+            os.replace(_f + '.tmp', _f)
+        except OSError as e:
+            log.debug(f"Could not save statistics cache {_f}: {e}")
+    else:
+        log.debug(f"statistics of {fname} from cache")
+    return [res[k] for k in keys]
+
+
+def window_key(window) -> str:
+    return 'all' if window is None else ','.join(str(int(v)) for v in window)
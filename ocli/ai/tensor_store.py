@@ -0,0 +1,423 @@
+"""
+Tensor (*_tnsr.npy, *_prob_pred.npy) storage.
+
+Two formats are supported:
+    npy     - plain numpy file, pixel interleaved (default)
+    chunked - directory near the npy file (zone_tnsr.npy -> zone_tnsr.zarr) with zlib compressed
+              (rows x cols x 1 band) chunks, layout is Zarr v2 compatible (.zarray + 'i.j.k' chunk files)
+
+Band subset and window reads of chunked tensor decompress only chunks they touch,
+chunk-aligned tiles could be written in parallel.
+Readers should use open_tensor(fname) with the npy file name, whichever format is present (newer if both) is opened.
+Format is selected by 'tensor_format' recipe key.
+
+Tensor could be stored quantised ('tensor_quantize' recipe key: uint8 | uint16): every band is scaled to the integer
+range by its min/max, value = stored * gain + offset, gains and offsets are saved in the ENVI sidecar
+(<fname>.hdr, 'data gain values', 'data offset values'), open_tensor() returns float32 array-like view of it.
+"""
+import json
+import logging
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Optional, Union
+
+import numpy as np
+
+log = logging.getLogger('tensor-store')
+
+FORMATS = ('npy', 'chunked')
+DEFAULT_FORMAT = 'npy'
+CHUNKED_EXT = '.zarr'
+META_FILE = '.zarray'
+""" rows, cols of one chunk, every band is stored in separate chunks """
+CHUNK_SIZE = (512, 512)
+COMPRESSION_LEVEL = 1
+""" zlib releases GIL, so chunks are (de)compressed in threads """
+WORKERS = min(8, os.cpu_count() or 1)
+""" quantised storage dtypes and ENVI data type codes """
+QUANTIZE = {'uint8': np.uint8, 'uint16': np.uint16}
+ENVI_DATA_TYPES = {np.dtype(np.uint8): 1, np.dtype(np.uint16): 12, np.dtype(np.float32): 4, np.dtype(np.float64): 5}
+HDR_EXT = '.hdr'
+HDR_GAIN = 'data gain values'
+HDR_OFFSET = 'data offset values'
+
+
+def chunked_path(fname: str) -> str:
+    """ chunked store directory for the npy file name """
+    return os.path.splitext(fname)[0] + CHUNKED_EXT
+
+
+def _mtime(path) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def tensor_format(fname: str) -> Optional[str]:
+    """ format of the stored tensor, None if tensor does not exist """
+    npy = _mtime(fname)
+    chunked = _mtime(os.path.join(chunked_path(fname), META_FILE))
+    if chunked is None:
+        return None if npy is None else 'npy'
+    if npy is None or chunked >= npy:
+        return 'chunked'
+    return 'npy'
+
+
+def tensor_exists(fname: str) -> bool:
+    return tensor_format(fname) is not None
+
+
+def tensor_mtime(fname: str) -> Optional[float]:
+    fmt = tensor_format(fname)
+    if fmt == 'chunked':
+        return _mtime(os.path.join(chunked_path(fname), META_FILE))
+    return _mtime(fname) if fmt else None
+
+
+class ChunkedArray(object):
+    """ array-like reader/writer of chunked tensor store
+
+    supports basic slicing and integer lists in any axis: arr[y0:y1, x0:x1, [b1, b2]],
+    lists are applied per axis independently (outer indexing), that is the same as numpy for single list
+    """
+    log = logging.getLogger('tensor-store')
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(os.path.join(path, META_FILE), 'r') as _f:
+                meta = json.load(_f)
+        except FileNotFoundError:
+            raise AssertionError(f"Chunked tensor '{path}' not found")
+        if meta.get('compressor', {}).get('id') != 'zlib' or meta.get('order', 'C') != 'C':
+            raise AssertionError(f"Chunked tensor '{path}': only zlib compressed C-ordered chunks are supported")
+        self.meta = meta
+        self.shape = tuple(meta['shape'])
+        self.chunks = tuple(meta['chunks'])
+        self.dtype = np.dtype(meta['dtype'])
+        self.fill_value = meta.get('fill_value') or 0
+        self.level = meta['compressor'].get('level', COMPRESSION_LEVEL)
+
+    @classmethod
+    def create(cls, path: str, shape, dtype, chunks=None, level=COMPRESSION_LEVEL):
+        """ create empty store, existing store is removed
+
+        :param chunks: chunk shape, default is CHUNK_SIZE x 1 band
+        """
+        if chunks is None:
+            chunks = CHUNK_SIZE + (1,) * (len(shape) - 2)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        meta = {
+            'zarr_format': 2,
+            'shape': [int(s) for s in shape],
+            'chunks': [int(min(c, max(s, 1))) for c, s in zip(chunks, shape)],
+            'dtype': np.dtype(dtype).str,
+            'compressor': {'id': 'zlib', 'level': level},
+            'fill_value': 0,
+            'order': 'C',
+            'filters': None,
+        }
+        with open(os.path.join(path, META_FILE), 'w') as _f:
+            json.dump(meta, _f, indent=4)
+        return cls(path)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _chunk_file(self, cid) -> str:
+        return os.path.join(self.path, '.'.join(str(c) for c in cid))
+
+    def read_chunk(self, cid) -> np.ndarray:
+        try:
+            with open(self._chunk_file(cid), 'rb') as _f:
+                raw = zlib.decompress(_f.read())
+        except FileNotFoundError:
+            return np.full(self.chunks, self.fill_value, dtype=self.dtype)
+        return np.frombuffer(raw, dtype=self.dtype).reshape(self.chunks)
+
+    def write_chunk(self, cid, data: np.ndarray):
+        """ write whole chunk, edge chunks are padded up to chunk shape """
+        if data.shape != self.chunks:
+            _d = np.full(self.chunks, self.fill_value, dtype=self.dtype)
+            _d[tuple(slice(0, s) for s in data.shape)] = data
+            data = _d
+        _fn = self._chunk_file(cid)
+        with open(_fn + '.tmp', 'wb') as _f:
+            _f.write(zlib.compress(np.ascontiguousarray(data, dtype=self.dtype).tobytes(), self.level))
+        os.replace(_fn + '.tmp', _fn)
+
+    def _selection(self, key) -> (list, list):
+        """ per-axis index arrays and axes to drop (integer index) """
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [n for n, k in enumerate(key) if k is Ellipsis][0]
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        key = key + (slice(None),) * (self.ndim - len(key))
+        if len(key) != self.ndim:
+            raise IndexError(f"too many indices for tensor of {self.ndim} dimensions")
+        sel, drop = [], []
+        for axis, (k, size) in enumerate(zip(key, self.shape)):
+            if isinstance(k, slice):
+                sel.append(np.arange(*k.indices(size)))
+            elif isinstance(k, (int, np.integer)):
+                if not -size <= k < size:
+                    raise IndexError(f"index {k} is out of bounds for axis {axis} with size {size}")
+                sel.append(np.array([k % size]))
+                drop.append(axis)
+            else:
+                ix = np.asarray(k, dtype=np.intp).reshape(-1)
+                if ix.size and (ix.min() < -size or ix.max() >= size):
+                    raise IndexError(f"index is out of bounds for axis {axis} with size {size}")
+                sel.append(ix % size)
+        return sel, drop
+
+    @staticmethod
+    def _groups(ix: np.ndarray, chunk: int) -> list:
+        """ [(chunk number, output positions, positions in chunk)], contiguous runs are slices """
+        res = []
+        cids = ix // chunk
+        for c in np.unique(cids):
+            pos = np.nonzero(cids == c)[0]
+            local = ix[pos] - c * chunk
+            if pos.size > 1 and (np.diff(pos) == 1).all() and (np.diff(local) == 1).all():
+                res.append((int(c), slice(pos[0], pos[-1] + 1), slice(local[0], local[-1] + 1)))
+            elif pos.size == 1:
+                res.append((int(c), slice(pos[0], pos[0] + 1), slice(local[0], local[0] + 1)))
+            else:
+                res.append((int(c), pos, local))
+        return res
+
+    def __getitem__(self, key) -> np.ndarray:
+        sel, drop = self._selection(key)
+        out = np.empty(tuple(len(s) for s in sel), dtype=self.dtype)
+        if out.size:
+            groups = [self._groups(s, c) for s, c in zip(sel, self.chunks)]
+
+            def _read(g):
+                cid = tuple(_g[0] for _g in g)
+                data = self.read_chunk(cid)
+                dst = tuple(_g[1] for _g in g)
+                src = tuple(_g[2] for _g in g)
+                if any(not isinstance(s, slice) for s in src):
+                    out[np.ix_(*[np.arange(s.start, s.stop) if isinstance(s, slice) else s for s in dst])] = \
+                        data[np.ix_(*[np.arange(s.start, s.stop) if isinstance(s, slice) else s for s in src])]
+                else:
+                    out[dst] = data[src]
+
+            todo = list(product(*groups))
+            if len(todo) > 1 and WORKERS > 1:
+                with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+                    list(executor.map(_read, todo))
+            else:
+                for g in todo:
+                    _read(g)
+        if drop:
+            out = out[tuple(0 if n in drop else slice(None) for n in range(self.ndim))]
+        return out
+
+    def __array__(self, dtype=None):
+        arr = self[...]
+        return arr if dtype is None else arr.astype(dtype)
+
+    def write(self, arr: np.ndarray, offset=None, workers=WORKERS):
+        """ write array at offset (row, col), partly covered chunks are read and updated
+
+        parallel writers should write chunk-aligned tiles, partly covered chunks are not locked
+        """
+        offset = tuple(offset or ()) + (0,) * (self.ndim - len(offset or ()))
+        if any(o + s > t for o, s, t in zip(offset, arr.shape, self.shape)):
+            raise AssertionError(f"Tile {arr.shape} at {offset} does not fit tensor {self.shape}")
+        ranges = [range(o // c, (o + s + c - 1) // c) if s else range(0) for o, s, c in zip(offset, arr.shape, self.chunks)]
+
+        def _write(cid):
+            c0 = [c * n for c, n in zip(cid, self.chunks)]
+            c1 = [min(c + n, t) for c, n, t in zip(c0, self.chunks, self.shape)]
+            lo = [max(a, o) for a, o in zip(c0, offset)]
+            hi = [min(b, o + s) for b, o, s in zip(c1, offset, arr.shape)]
+            src = tuple(slice(l - o, h - o) for l, h, o in zip(lo, hi, offset))
+            if lo == c0 and hi == c1:
+                data = arr[src]
+            else:
+                data = self.read_chunk(cid).copy()
+                data[tuple(slice(l - c, h - c) for l, h, c in zip(lo, hi, c0))] = arr[src]
+            self.write_chunk(cid, data)
+
+        todo = list(product(*ranges))
+        if len(todo) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(_write, todo))
+        else:
+            for cid in todo:
+                _write(cid)
+
+
+class QuantizedArray(object):
+    """ read-only float32 view of quantised tensor, value = stored * gain + offset of the band
+
+    :param raw: stored array-like (memmap or ChunkedArray) of (lines, samples, bands)
+    """
+
+    def __init__(self, raw, gain: np.ndarray, offset: np.ndarray):
+        if len(gain) != raw.shape[-1] or len(offset) != raw.shape[-1]:
+            raise AssertionError(f"Quantised tensor of {raw.shape[-1]} bands has {len(gain)} gains"
+                                 f" and {len(offset)} offsets")
+        self.raw = raw
+        self.gain = np.asarray(gain, dtype=np.float32)
+        self.offset = np.asarray(offset, dtype=np.float32)
+        self.shape = tuple(raw.shape)
+        self.dtype = np.dtype(np.float32)
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _band_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = [n for n, k in enumerate(key) if k is Ellipsis][0]
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1:]
+        bk = (key + (slice(None),) * (self.ndim - len(key)))[self.ndim - 1]
+        """ tuple in index is a list of bands """
+        return list(bk) if isinstance(bk, tuple) else bk
+
+    def __getitem__(self, key) -> np.ndarray:
+        bk = self._band_key(key)
+        res = np.asarray(self.raw[key]).astype(np.float32)
+        res *= self.gain[bk]
+        res += self.offset[bk]
+        return res
+
+    def __array__(self, dtype=None):
+        arr = self[...]
+        return arr if dtype is None else arr.astype(dtype)
+
+
+def quantize(arr: np.ndarray, dtype) -> (np.ndarray, np.ndarray, np.ndarray):
+    """ scale every band of (lines, samples, bands) array to the integer range
+
+    :param dtype: uint8 | uint16
+    :return: (quantised array, gains, offsets)
+    """
+    if dtype not in QUANTIZE:
+        raise AssertionError(f"Unknown tensor quantisation '{dtype}', allowed: {tuple(QUANTIZE)}")
+    dtype = QUANTIZE[dtype]
+    top = np.iinfo(dtype).max
+    nb = arr.shape[-1]
+    q = np.empty(arr.shape, dtype=dtype)
+    gain = np.ones(nb, dtype=np.float64)
+    offset = np.zeros(nb, dtype=np.float64)
+    for b in range(nb):
+        lo, hi = float(np.nanmin(arr[..., b])), float(np.nanmax(arr[..., b]))
+        offset[b] = lo
+        if hi > lo:
+            gain[b] = (hi - lo) / top
+        _b = (arr[..., b] - lo) / gain[b]
+        np.rint(_b, out=_b)
+        q[..., b] = np.clip(np.nan_to_num(_b, copy=False), 0, top)
+    return q, gain, offset
+
+
+def _hdr_values(value: str) -> np.ndarray:
+    return np.array([float(v) for v in value.strip('{} ').split(',')], dtype=np.float64)
+
+
+def read_quantization(fname: str) -> Optional[tuple]:
+    """ (gain, offset) from tensor ENVI sidecar, None if tensor is not quantised """
+    from ocli.ai.Envi import parse_header
+    if not os.path.isfile(fname + HDR_EXT):
+        return None
+    _, hdict = parse_header(fname + HDR_EXT)
+    if HDR_GAIN not in hdict:
+        return None
+    gain = _hdr_values(hdict[HDR_GAIN])
+    offset = _hdr_values(hdict[HDR_OFFSET]) if HDR_OFFSET in hdict else np.zeros_like(gain)
+    return gain, offset
+
+
+def open_tensor(fname: str, raw=False) -> Union[np.ndarray, ChunkedArray, QuantizedArray]:
+    """ read-only array-like tensor: numpy memmap, ChunkedArray or QuantizedArray of them
+
+    :param fname: npy file name (see ocli.ai.util.Filenames)
+    :param raw: stored array, quantised tensor is not converted to float
+    """
+    fmt = tensor_format(fname)
+    if fmt == 'chunked':
+        arr = ChunkedArray(chunked_path(fname))
+    elif fmt is None:
+        raise FileNotFoundError(f"Tensor {fname} not found")
+    else:
+        arr = np.load(fname, mmap_mode='r')
+    if raw or arr.dtype.kind != 'u' or arr.ndim != 3:
+        return arr
+    q = read_quantization(fname)
+    return arr if q is None else QuantizedArray(arr, *q)
+
+
+def load_tensor(fname: str) -> np.ndarray:
+    """ whole tensor in memory """
+    arr = open_tensor(fname)
+    if isinstance(arr, np.ndarray):
+        return np.array(arr)
+    return arr[...]
+
+
+def remove_tensor(fname: str):
+    if os.path.isfile(fname):
+        os.remove(fname)
+    if os.path.isdir(chunked_path(fname)):
+        shutil.rmtree(chunked_path(fname))
+
+
+def save_tensor(fname: str, arr: np.ndarray, fmt: Optional[str] = None, chunks=None,
+                quantization: Optional[str] = None) -> dict:
+    """ save tensor, stored tensor of other format is removed
+
+    :param fname: npy file name
+    :param fmt: npy | chunked, None - DEFAULT_FORMAT
+    :param chunks: chunk shape for chunked format
+    :param quantization: uint8 | uint16, None - save as is
+    :return: ENVI header fields of stored data: data type, gains and offsets of quantised tensor
+    """
+    fmt = fmt if fmt else DEFAULT_FORMAT
+    if fmt not in FORMATS:
+        raise AssertionError(f"Unknown tensor format '{fmt}', allowed: {FORMATS}")
+    hdr = {}
+    if quantization:
+        arr, gain, offset = quantize(arr, quantization)
+        hdr[HDR_GAIN] = '{' + ','.join(f'{g:.9g}' for g in gain) + '}'
+        hdr[HDR_OFFSET] = '{' + ','.join(f'{o:.9g}' for o in offset) + '}'
+    if arr.dtype in ENVI_DATA_TYPES:
+        hdr['data type'] = ENVI_DATA_TYPES[arr.dtype]
+    remove_tensor(fname)
+    if fmt == 'npy':
+        np.save(fname, arr)
+    else:
+        ChunkedArray.create(chunked_path(fname), arr.shape, arr.dtype, chunks=chunks).write(arr)
+        """ meta is touched after chunks, so store mtime is the time of the complete write """
+        os.utime(os.path.join(chunked_path(fname), META_FILE))
+    log.debug(f"tensor {arr.shape} saved to {fname} ({fmt}{', ' + quantization if quantization else ''})")
+    return hdr
@@ -0,0 +1,216 @@
+"""
+Incremental time-series cube of preprocessed stack channels.
+
+Cube directory layout:
+    meta.json           shape, channels, dates (in append order), window
+    <date>.npy          (H,W,C) float32 preprocessed channels of one date (one time chunk)
+    <date>.bd.npy       (H,W) bad data mask of one date
+    sum.npy             (H,W,C) float64 running sum over dates in window
+    sumsq.npy           (H,W,C) float64 running sum of squares
+    bad.npy             (H,W) uint16 number of dates with bad data in the pixel
+
+Appending a date adds it to running sums, if window is set the oldest date is subtracted and its chunks are removed,
+so mean/std of *_avg products are updated in O(1) dates per new date.
+Channels are preprocessed the same way as Assemble does for sigma_avg/coh_avg (clip, log10, fix_pixels),
+anisotropic diffusion is applied by Assemble on the mean.
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ocli.ai.Envi import Envi
+
+log = logging.getLogger('timeseries')
+
+META_FILE = 'meta.json'
+""" cube channel -> recipe channels averaged into it for one date """
+CHANNELS = {
+    'sigma': 'sigma_avg',
+    'coh': 'coh_avg',
+}
+
+
+def _preprocess(channel, arr) -> (np.ndarray, np.ndarray):
+    from ocli.ai.assemble import preprocess_sigma, preprocess_coh
+    if channel == 'sigma':
+        return preprocess_sigma(arr)
+    if channel == 'coh':
+        return preprocess_coh(arr)
+    raise AssertionError(f"Unknown time-series channel '{channel}'")
+
+
+class TimeSeriesCube(object):
+    """ on-disk cube with running statistics
+
+    :param path: cube directory
+    """
+    log = logging.getLogger('timeseries')
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(os.path.join(path, META_FILE), 'r') as _f:
+                self.meta = json.load(_f)
+        except FileNotFoundError:
+            raise AssertionError(f"Time-series cube '{path}' not found")
+
+    @classmethod
+    def create(cls, path: str, shape, channels=('sigma', 'coh'), window: Optional[int] = None, zone=None):
+        """ create empty cube
+
+        :param shape: (H, W) of the stack or zone
+        :param channels: cube channels, see CHANNELS
+        :param window: keep statistics for last 'window' dates, None - all dates
+        :param zone: zone the cube was created for (informative)
+        """
+        for c in channels:
+            if c not in CHANNELS:
+                raise AssertionError(f"Unknown time-series channel '{c}'")
+        os.makedirs(path, exist_ok=True)
+        if os.path.isfile(os.path.join(path, META_FILE)):
+            raise AssertionError(f"Time-series cube '{path}' already exists")
+        h, w = int(shape[0]), int(shape[1])
+        np.save(os.path.join(path, 'sum.npy'), np.zeros((h, w, len(channels)), dtype=np.float64))
+        np.save(os.path.join(path, 'sumsq.npy'), np.zeros((h, w, len(channels)), dtype=np.float64))
+        np.save(os.path.join(path, 'bad.npy'), np.zeros((h, w), dtype=np.uint16))
+        meta = {
+            'shape': [h, w],
+            'channels': list(channels),
+            'dates': [],
+            'window': window,
+            'zone': zone,
+        }
+        with open(os.path.join(path, META_FILE), 'w') as _f:
+            json.dump(meta, _f, indent=4)
+        return cls(path)
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(self.meta['shape'])
+
+    @property
+    def channels(self) -> List[str]:
+        return self.meta['channels']
+
+    @property
+    def dates(self) -> List[str]:
+        return self.meta['dates']
+
+    @property
+    def count(self) -> int:
+        return len(self.dates)
+
+    def _save_meta(self):
+        _tmp = os.path.join(self.path, META_FILE + '.tmp')
+        with open(_tmp, 'w') as _f:
+            json.dump(self.meta, _f, indent=4)
+        os.replace(_tmp, os.path.join(self.path, META_FILE))
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _update(self, chunk: np.ndarray, bd: np.ndarray, sign: int):
+        """ add (sign=1) or subtract (sign=-1) one date from running sums, row strips to keep memory low """
+        _sum = np.load(self._file('sum.npy'), mmap_mode='r+')
+        _sq = np.load(self._file('sumsq.npy'), mmap_mode='r+')
+        _bad = np.load(self._file('bad.npy'), mmap_mode='r+')
+        step = 512
+        for i in range(0, chunk.shape[0], step):
+            c = chunk[i:i + step].astype(np.float64)
+            _sum[i:i + step] += sign * c
+            _sq[i:i + step] += sign * c * c
+            if sign > 0:
+                _bad[i:i + step] += bd[i:i + step]
+            else:
+                _bad[i:i + step] -= bd[i:i + step]
+        for a in (_sum, _sq, _bad):
+            a.flush()
+        del _sum, _sq, _bad
+
+    def append(self, date: str, bands: Dict[str, List[np.ndarray]]):
+        """ add one date
+
+        :param date: date key (like '20200101'), should be unique
+        :param bands: {cube channel: list of raw bands}, bands of one channel are averaged
+        """
+        if date in self.dates:
+            raise AssertionError(f"Date {date} is already in time-series cube")
+        chunk = np.empty(self.shape + (len(self.channels),), dtype=np.float32)
+        bd = np.zeros(self.shape, dtype=bool)
+        for n, c in enumerate(self.channels):
+            _b = bands.get(c)
+            if not _b:
+                raise AssertionError(f"No '{c}' bands for date {date}")
+            acc = np.zeros(self.shape, dtype=np.float32)
+            for arr in _b:
+                if arr.shape[:2] != self.shape:
+                    raise AssertionError(f"Band shape {arr.shape} does not fit time-series cube {self.shape}")
+                a, _bd = _preprocess(c, np.array(arr, dtype=np.float32))
+                acc += a
+                bd |= _bd
+            chunk[..., n] = acc / len(_b)
+        np.save(self._file(f'{date}.npy'), chunk)
+        np.save(self._file(f'{date}.bd.npy'), bd)
+        self._update(chunk, bd, 1)
+        self.meta['dates'].append(date)
+        self._save_meta()
+        window = self.meta.get('window')
+        while window and self.count > window:
+            self.drop(self.dates[0], remove_files=True)
+        self.log.info(f"date {date} appended, {self.count} dates in cube")
+
+    def drop(self, date: str, remove_files=False):
+        """ subtract date from running statistics """
+        if date not in self.dates:
+            raise AssertionError(f"Date {date} is not in time-series cube")
+        chunk = np.load(self._file(f'{date}.npy'), mmap_mode='r')
+        bd = np.load(self._file(f'{date}.bd.npy'))
+        self._update(chunk, bd, -1)
+        del chunk
+        self.meta['dates'].remove(date)
+        self._save_meta()
+        if remove_files:
+            os.remove(self._file(f'{date}.npy'))
+            os.remove(self._file(f'{date}.bd.npy'))
+
+    def _channel(self, channel) -> int:
+        try:
+            return self.channels.index(channel)
+        except ValueError:
+            raise AssertionError(f"No '{channel}' channel in time-series cube")
+
+    def mean(self, channel: str) -> np.ndarray:
+        if not self.count:
+            raise AssertionError('Time-series cube is empty')
+        _sum = np.load(self._file('sum.npy'), mmap_mode='r')
+        return (_sum[..., self._channel(channel)] / self.count).astype(np.float32)
+
+    def std(self, channel: str) -> np.ndarray:
+        n = self._channel(channel)
+        m = self.mean(channel).astype(np.float64)
+        _sq = np.load(self._file('sumsq.npy'), mmap_mode='r')
+        return np.sqrt(np.maximum(_sq[..., n] / self.count - m * m, 0)).astype(np.float32)
+
+    def bad_data(self) -> np.ndarray:
+        """ pixels which are bad in any date of the window """
+        return np.load(self._file('bad.npy')) > 0
+
+    def date(self, date: str, channel: str) -> np.ndarray:
+        """ preprocessed channel of one date (memmap) """
+        return np.load(self._file(f'{date}.npy'), mmap_mode='r')[..., self._channel(channel)]
+
+
+def append_recipe(cube: TimeSeriesCube, date: str, recipe, envi: Envi, mode='zone'):
+    """ append date from recipe stack: channels listed in sigma_avg/coh_avg of the recipe
+
+    :param mode: zone | full
+    """
+    file_loader = envi.get_file_loader(mode, np.array(recipe['zone']) if mode == 'zone' else None)
+    bands = {}
+    for c in cube.channels:
+        names = recipe['channels'].get(CHANNELS[c], [])
+        bands[c] = [file_loader(name)[0] for name in names]
+    cube.append(date, bands)
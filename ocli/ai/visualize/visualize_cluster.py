@@ -6,6 +6,7 @@ import numpy as np
 # from memory_profiler import profile
 from skimage import img_as_ubyte
 
+from ocli.ai import pyramid, tensor_store
 from ocli.ai.Envi import Envi
 from ocli.ai.recipe import Recipe
 from ocli.ai.util import Filenames
@@ -39,7 +40,7 @@ class Visualize(object):
         :param th_np_hdr_file:  ENVI header file WITH EXTENSION from which to grab geometry and projection
         :param te_out_img_file: output ENVI file name WITHOUT EXTENSION
         """
-        _in = np.load(the_np_file, mmap_mode='r')
+        _in = tensor_store.open_tensor(the_np_file)
         self.log.info(f'data loaded from {the_np_file}, shape is {_in.shape}')
         full_shape, hdict = self.envi.read_header(the_np_hdr_file, 'r')
         self.log.info(f'producing cluster visualisation {self.mode} {full_shape} from {the_np_file}')
@@ -68,13 +69,16 @@ class Visualize(object):
         }
         self.envi.save_dict_to_hdr(the_out_img_file + '.hdr', hdr)
         self.log.info(f'ENVI HDR done, file {the_out_img_file}')
-        img_as_ubyte(_in).tofile(the_out_img_file + '.img')
+        _img = img_as_ubyte(np.asarray(_in))
+        _img.tofile(the_out_img_file + '.img')
+        pyramid.remove_overviews(the_out_img_file + '.img')
+        pyramid.build_overviews(the_out_img_file + '.img', _img)
         self.log.info(f'ENVI cluster visualization done, IMG file {the_out_img_file}')
 
     def run(self):
         the_np_file = self.filenames.prob_pred
         the_np_hdr_file = self.filenames.tnsr_hdr
-        if not os.path.isfile(the_np_file):
+        if not tensor_store.tensor_exists(the_np_file):
             raise AssertionError(
                 f"Could not locate numpy data file '{the_np_file}' file! check recipe and produced data")
         if not os.path.isfile(the_np_hdr_file):
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 # todo pass recipe as JSON object
+from ocli.ai import pyramid, tensor_store
 from ocli.ai.Envi import Envi
 from ocli.ai.recipe import Recipe
 from ocli.ai.util import Filenames
@@ -38,7 +39,7 @@ class Visualize(object):
             return -1
         file_name = self.filenames.prob_pred
         self.log.debug("loading %s", file_name)
-        pred = np.load(file_name)
+        pred = tensor_store.load_tensor(file_name)
         self.log.debug({'shape': pred.shape, 'stype': pred.dtype})
 
         vis = np.zeros(pred.shape[:-1], dtype=np.uint8)
@@ -120,9 +121,12 @@ class Visualize(object):
         imgc[0, 0, :] = np.array((0, 0, 0), dtype=np.uint8)
         imgc[-1, -1, :] = np.array((255, 255, 255), dtype=np.uint8)
         fname = self.filenames.pred8c
-        self.envi.save(fname, imgc.astype(np.uint8), hdict['map info'],
+        imgc = imgc.astype(np.uint8)
+        self.envi.save(fname, imgc, hdict['map info'],
                        hdict['coordinate system string'],
                        chnames=['R', 'G', 'B'], desc='clustered, colors')
+        pyramid.remove_overviews(self.filenames.pred8c_img)
+        pyramid.build_overviews(self.filenames.pred8c_img, imgc)
         self.log.info(f"image {fname} saved ")
 
         # plt.imshow(vis, cmap=cmap)
@@ -1,17 +1,14 @@
 import importlib
 import json
 import os
-import pickle
 import re
 from json import JSONDecodeError
 from pathlib import Path
 from pprint import pprint
-from typing import Dict, List
-
-import jsonsempai
-import numpy
-from jsonschema import Draft7Validator, draft7_format_checker
+from typing import Dict, List, Tuple
 
+from ocli.ai import predictor
+from ocli.ai.schema import validate
 from ocli.logger import getLogger
 from ocli.project import _local_eodata_relative_path
 
@@ -22,6 +19,7 @@ from ocli.sent1 import pairs
 
 log = getLogger()
 REQUIRED = "Required by " + __name__
+SCHEMA_CLUSTER = __name__ + '.recipe_schema'
 
 TASK_KIND_CLUSTER = {
     'kind': 'cluster',
@@ -181,31 +179,42 @@ def get_predictor_config_json_template():
         del conf[k]
     return  conf
 
-def validate_schema(schema: Dict, recipe: Dict):
+
+""" stack path -> (mtime, files) """
+_STACK_FILES = {}
+
+
+def list_stack(path) -> List[str]:
+    """ stack directory listing, re-read only if directory is modified """
+    if not os.path.isdir(path):
+        return []
+    mtime = os.path.getmtime(path)
+    _cached = _STACK_FILES.get(path)
+    if _cached is None or _cached[0] != mtime:
+        _cached = (mtime, os.listdir(path))
+        _STACK_FILES[path] = _cached
+    return _cached[1]
+
+
+def validate_schema(schema: Tuple[str, ...], recipe: Dict):
+    """
+    :param schema: names of schemas (see ocli.ai.schema) to merge cluster schema to
+    """
     errors = []
 
     try:
-
-        with jsonsempai.imports():
-            from ocli.aikp.cluster import recipe_schema
-        deep_update(schema, recipe_schema.properties.envelope)
-        v = Draft7Validator(schema, format_checker=draft7_format_checker)
-        _errors = sorted(v.iter_errors(recipe), key=lambda e: e.path)
-        errors.extend([
-            f'Recipe schema  "{".".join(e.absolute_path)}" invalid : {e.message}' if e.absolute_path else f"Recipe schema  {e.message}"
-            for e in _errors])
+        errors.extend(validate(recipe, tuple(schema) + (SCHEMA_CLUSTER,)))
         try:
-            _t = numpy.load(os.path.join(recipe['PREDICTOR_DIR'], 'tnorm.npy'))
+            """ metadata sidecar, predictor is unpickled only if sidecar is missed or outdated """
+            _meta = predictor.read_metadata(recipe['PREDICTOR_DIR'])
             _mlc = max(recipe['learn_channels'])
-            if _t.shape[0] < _mlc:
+            if _meta['tnorm_channels'] < _mlc:
+                errors.append(
+                    f"Predictor is invalid: learning chanel {_mlc} could not be used with tnorm.npy shape [0..{_meta['tnorm_channels'] - 1}]")
+            if recipe['num_clusters'] != _meta['n_components']:
                 errors.append(
-                    f"Predictor is invalid: learning chanel {_mlc} could not be used with tnorm.npy shape [0..{_t.shape[0] - 1}]")
-            with open(os.path.join(recipe['PREDICTOR_DIR'], 'gm.pkl'), 'rb') as _f:
-                _t = pickle.load(_f)
-                if recipe['num_clusters'] != _t.n_components:
-                    errors.append(
-                        f"Predictor is invalid: gm.pkl has {_t.n_components} clusters, \
-                            recipe has {recipe['num_clusters']} clusters ")
+                    f"Predictor is invalid: gm.pkl has {_meta['n_components']} clusters, \
+                        recipe has {recipe['num_clusters']} clusters ")
 
         except Exception as e:
             errors.append(f"Predictor is invalid: Could not validate tnorm.npy: {e}")
@@ -220,15 +229,12 @@ def update_recipe(task: Task, recipe):
 
     deep_update(recipe, RECIPE_CLUSTER_TPL)
 
-    files=[]
     try:
         path     = task.get_stack_path(full=True)
     except AssertionError as e:
         errors.append(str(e))
         return errors
-    if os.path.isdir(path):
-        # raise AssertionError(f"Task stack directory '{path}' not found")
-        files = os.listdir(path)
+    files = list_stack(path)
     __resolve_files(FILE_PATTERN,files,recipe)
     recipe['PREDICTOR_DIR'] = task.config['predictor']
     recipe['COS']['bucket'] = task.config['cos_bucket']
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Tuple
 
 from ocli.aikp import cluster
 from ocli.aikp import get_tsar_defaults
@@ -22,7 +22,7 @@ def update_recipe(task: Task,recipe:Dict):
     errors=cluster.update_recipe(task,recipe)
     return errors
 
-def validate_schema(schema:Dict,recipe:Dict):
+def validate_schema(schema:Tuple[str, ...],recipe:Dict):
     errors=cluster.validate_schema(schema,recipe)
     return errors
 
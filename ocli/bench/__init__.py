@@ -0,0 +1,28 @@
+"""
+Benchmarks on synthetic data
+
+each module provides run_*() function returning dict with measured values and click command `main`,
+run as:
+    python -m ocli.bench.<module> --help
+"""
+import time
+
+
+class Timer(object):
+    """ wall-clock timer context manager """
+
+    def __init__(self):
+        self.start = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def rate(count, elapsed):
+    """ items per second """
+    return count / elapsed if elapsed > 0 else float('inf')
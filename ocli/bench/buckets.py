@@ -0,0 +1,89 @@
+"""
+bucket.create_list benchmark on synthetic product lists
+
+    python -m ocli.bench.buckets -n 10000 -n 100000 --verify-max 10000
+"""
+import random
+from datetime import datetime, timedelta
+
+import click
+import geopandas as gpd
+from shapely.geometry import box
+from tabulate import tabulate
+
+from ocli.bench import Timer, rate
+from ocli.project import bucket
+
+
+def make_product_list(n: int, seed=0) -> gpd.GeoDataFrame:
+    """ synthetic products list similar to pairs cache: repeated 12-days acquisitions
+    with a few seconds jitter over several orbit keys
+    """
+    rnd = random.Random(seed)
+    keys = max(1, n // 300)
+    t0 = datetime(2017, 1, 1)
+    rows = []
+    for i in range(n):
+        k = rnd.randrange(keys)
+        platform = 'S1A' if k % 2 else 'S1B'
+        orbit = k % 175 + 1
+        """ key time-of-day and frame along the orbit """
+        frame = rnd.randrange(4)
+        start = t0 + timedelta(days=12 * rnd.randrange(120) + k % 12,
+                               seconds=(k * 997) % 86400 + frame * 25 + rnd.uniform(-8, 8))
+        x, y = (k * 7) % 340 - 170, (k * 3) % 140 - 70 + frame
+        rows.append(dict(
+            productId=f"{i:04X}"[-4:],
+            title=f"{platform}_IW_SLC__1SDV_{start:%Y%m%dT%H%M%S}_{i:06d}",
+            startDate=start,
+            platform=platform,
+            sensorMode='IW',
+            productType='SLC',
+            polarisation='VV VH',
+            swath='IW',
+            relativeOrbitNumber=orbit,
+            geometry=box(x, y, x + 2.5, y + 1.7),
+        ))
+    return gpd.GeoDataFrame(rows, geometry='geometry', crs={'init': 'epsg:4326'})
+
+
+def same_assignments(a: gpd.GeoDataFrame, b: gpd.GeoDataFrame) -> bool:
+    cols = ['productId', 'startDate', 'bucket', 'processed', 'cycle_dt']
+    return a[cols].astype(str).equals(b[cols].astype(str))
+
+
+def run_buckets(sizes=(10000, 100000), verify_max=10000) -> list:
+    res = []
+    for n in sizes:
+        df = make_product_list(n)
+        with Timer() as t:
+            _bk = bucket.create_list(df, buckets_dir='')
+        r = {
+            'products': n,
+            'buckets': _bk['bucket'].nunique(),
+            'seconds': round(t.elapsed, 3),
+            'products/sec': round(rate(n, t.elapsed), 1),
+            'loop seconds': None,
+            'identical': None,
+        }
+        if n <= verify_max:
+            with Timer() as tl:
+                _ref = bucket._create_list_loop(df, buckets_dir='')
+            r['loop seconds'] = round(tl.elapsed, 3)
+            r['identical'] = same_assignments(_bk, _ref)
+        res.append(r)
+    return res
+
+
+@click.command()
+@click.option('-n', 'sizes', type=click.INT, multiple=True, default=[10000, 100000], show_default=True,
+              help='number of synthetic products, multiple allowed')
+@click.option('--verify-max', type=click.INT, default=10000, show_default=True,
+              help='compare with row-by-row implementation for lists up to this size')
+def main(sizes, verify_max):
+    """ bucket assignment throughput """
+    click.echo(tabulate(run_buckets(sizes, verify_max), headers='keys'))
+
+
+if __name__ == '__main__':
+    main()
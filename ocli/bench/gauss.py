@@ -0,0 +1,98 @@
+"""
+Gaussian smoothing of tensors benchmark: per-band scipy calls vs batched block filters (ocli.ai.filter.gauss)
+
+    python -m ocli.bench.gauss -s 2048 --sigma 2 --sigma 3 --sigma 8
+
+'whole' is learn path (whole tensor), 'strips' is prediction loop (strips of --rows rows with halo),
+error is max abs difference from per-band gaussian_filter of whole tensor
+"""
+import click
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from tabulate import tabulate
+
+from ocli.ai.filter.gauss import FIR, IIR, StripGaussian, gaussian_block
+from ocli.bench import Timer, rate
+
+
+def per_band(tnsr: np.ndarray, sigma) -> np.ndarray:
+    res = tnsr.copy()
+    for n in range(tnsr.shape[-1]):
+        res[..., n] = gaussian_filter(tnsr[..., n], sigma)
+    return res
+
+
+def strips_per_band(tnsr: np.ndarray, sigma, rows) -> np.ndarray:
+    """ prediction loop before block filters: every strip with halo is filtered band by band """
+    res = np.empty_like(tnsr)
+    d = int(sigma * 2.5) + 2
+    for i in range(0, tnsr.shape[0], rows):
+        hi = min(i + rows, tnsr.shape[0])
+        d1, d2 = min(d, i), min(tnsr.shape[0] - hi, d)
+        res[i:hi] = per_band(tnsr[i - d1:hi + d2], sigma)[d1:d1 + hi - i]
+    return res
+
+
+def strips_block(tnsr: np.ndarray, sigma, rows, method=FIR) -> np.ndarray:
+    res = np.empty_like(tnsr)
+    sg = StripGaussian(sigma, method)
+    d = sg.halo
+    for i in range(0, tnsr.shape[0], rows):
+        hi = min(i + rows, tnsr.shape[0])
+        d1, d2 = min(d, i), min(tnsr.shape[0] - hi, d)
+        res[i:hi] = sg(tnsr[i - d1:hi + d2], i - d1, i, hi)
+    return res
+
+
+def run_gauss(size=1024, bands=8, sigma=2., rows=100, seed=0) -> list:
+    tnsr = np.random.default_rng(seed).normal(size=(size, size, bands)).astype(np.float32)
+    with Timer() as t:
+        ref = per_band(tnsr, sigma)
+    base = t.elapsed
+    cases = [
+        ('whole', 'per-band', lambda: ref),
+        ('whole', 'block fir', lambda: gaussian_block(tnsr, sigma, FIR)),
+        ('whole', 'block iir', lambda: gaussian_block(tnsr, sigma, IIR)),
+        ('strips', 'per-band', lambda: strips_per_band(tnsr, sigma, rows)),
+        ('strips', 'block fir', lambda: strips_block(tnsr, sigma, rows, FIR)),
+        ('strips', 'block iir', lambda: strips_block(tnsr, sigma, rows, IIR)),
+    ]
+    res = []
+    strips_base = None
+    for path, name, fn in cases:
+        if path == 'whole' and name == 'per-band':
+            elapsed, out = base, ref
+        else:
+            with Timer() as t:
+                out = fn()
+            elapsed = t.elapsed
+        if path == 'strips' and name == 'per-band':
+            strips_base = elapsed
+        res.append({
+            'path': path,
+            'method': name,
+            'sigma': sigma,
+            'seconds': round(elapsed, 3),
+            'Mpx/s': round(rate(size * size / 1e6, elapsed), 2),
+            'speedup': round((strips_base if path == 'strips' else base) / elapsed, 2),
+            'max error': float(np.abs(out - ref).max()),
+        })
+    return res
+
+
+@click.command()
+@click.option('-s', '--size', type=click.INT, default=1024, show_default=True, help='tensor size, pixels')
+@click.option('-b', '--bands', type=click.INT, default=8, show_default=True)
+@click.option('--sigma', 'sigmas', type=click.FLOAT, multiple=True, default=(2., 3.), show_default=True,
+              help='gaussian sigma, multiple allowed')
+@click.option('--rows', type=click.INT, default=100, show_default=True, help='prediction strip rows')
+def main(size, bands, sigmas, rows):
+    """ gaussian smoothing of tensor """
+    res = []
+    for s in sigmas:
+        res += run_gauss(size, bands, s, rows)
+    click.echo(tabulate(res, headers='keys'))
+
+
+if __name__ == '__main__':
+    main()
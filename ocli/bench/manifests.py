@@ -0,0 +1,138 @@
+"""
+manifest.safe bulk ingestion benchmark
+
+    python -m ocli.bench.manifests -n 2000 -w 0 -w 4
+"""
+import os
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+import click
+from tabulate import tabulate
+
+from ocli.bench import Timer, rate
+from ocli.sent1.catalog import ingest_manifests
+
+MANIFEST_TPL = """<?xml version="1.0" encoding="UTF-8"?>
+<xfdu:XFDU xmlns:xfdu="urn:ccsds:schema:xfdu:1" xmlns:gml="http://www.opengis.net/gml"
+  xmlns:safe="http://www.esa.int/safe/sentinel-1.0"
+  xmlns:s1sarl1="http://www.esa.int/safe/sentinel-1.0/sentinel-1/sar/level-1" version="esa/safe/sentinel-1.0/sentinel-1/sar/level-1/slc/standard/iwdp">
+  <metadataSection>
+    <metadataObject ID="acquisitionPeriod"><metadataWrap><xmlData>
+      <safe:acquisitionPeriod><safe:startTime>{start}</safe:startTime><safe:stopTime>{stop}</safe:stopTime></safe:acquisitionPeriod>
+    </xmlData></metadataWrap></metadataObject>
+    <metadataObject ID="platform"><metadataWrap><xmlData>
+      <safe:platform>
+        <safe:nssdcIdentifier>2014-016A</safe:nssdcIdentifier>
+        <safe:familyName>SENTINEL-1</safe:familyName>
+        <safe:number>{number}</safe:number>
+        <safe:instrument>
+          <safe:familyName abbreviation="SAR">Synthetic Aperture Radar</safe:familyName>
+          <safe:extension><s1sarl1:instrumentMode><s1sarl1:mode>IW</s1sarl1:mode><s1sarl1:swath>IW1</s1sarl1:swath><s1sarl1:swath>IW2</s1sarl1:swath><s1sarl1:swath>IW3</s1sarl1:swath></s1sarl1:instrumentMode></safe:extension>
+        </safe:instrument>
+      </safe:platform>
+    </xmlData></metadataWrap></metadataObject>
+    <metadataObject ID="generalProductInformation"><metadataWrap><xmlData>
+      <s1sarl1:standAloneProductInformation>
+        <s1sarl1:productClass>S</s1sarl1:productClass>
+        <s1sarl1:productClassDescription>SAR Standard L1 Product</s1sarl1:productClassDescription>
+        <s1sarl1:productComposition>Slice</s1sarl1:productComposition>
+        <s1sarl1:productType>SLC</s1sarl1:productType>
+        <s1sarl1:transmitterReceiverPolarisation>VV</s1sarl1:transmitterReceiverPolarisation>
+        <s1sarl1:transmitterReceiverPolarisation>VH</s1sarl1:transmitterReceiverPolarisation>
+      </s1sarl1:standAloneProductInformation>
+    </xmlData></metadataWrap></metadataObject>
+    <metadataObject ID="measurementOrbitReference"><metadataWrap><xmlData>
+      <safe:orbitReference>
+        <safe:orbitNumber type="start">{orbit}</safe:orbitNumber>
+        <safe:relativeOrbitNumber type="start">{relative_orbit}</safe:relativeOrbitNumber>
+      </safe:orbitReference>
+    </xmlData></metadataWrap></metadataObject>
+    <metadataObject ID="measurementFrameSet"><metadataWrap><xmlData>
+      <safe:frameSet><safe:frame><safe:footPrint srsName="http://www.opengis.net/gml/srs/epsg.xml#4326">
+        <gml:coordinates>{coordinates}</gml:coordinates>
+      </safe:footPrint></safe:frame></safe:frameSet>
+    </xmlData></metadataWrap></metadataObject>
+  </metadataSection>
+  {padding}
+</xfdu:XFDU>
+"""
+""" real manifests have ~ 20KB of dataObjectSection, keep size realistic """
+_PADDING = '<dataObjectSection>' + ''.join(
+    f'<dataObject ID="d{i}"><byteStream mimeType="text/xml" size="1000"><fileLocation locatorType="URL" '
+    f'href="./annotation/s1a-iw1-slc-vv-{i:04}.xml"/><checksum checksumName="MD5">{"0" * 32}</checksum>'
+    f'</byteStream></dataObject>' for i in range(100)) + '</dataObjectSection>'
+
+
+def make_synthetic_safe(root: str, n: int, seed=0) -> list:
+    """ create n SAFE directories with manifest.safe and empty annotation files
+
+    :return: list of SAFE directories
+    """
+    rnd = random.Random(seed)
+    paths = []
+    t0 = datetime(2019, 1, 1)
+    for i in range(n):
+        number = rnd.choice('AB')
+        start = t0 + timedelta(hours=i, seconds=rnd.randint(0, 59))
+        stop = start + timedelta(seconds=27)
+        orbit = 25000 + i
+        _s, _e = start.strftime('%Y%m%dT%H%M%S'), stop.strftime('%Y%m%dT%H%M%S')
+        name = f"S1{number}_IW_SLC__1SDV_{_s}_{_e}_{orbit:06d}_{i % 0xFFFFFF:06X}_{i % 0xFFFF:04X}.SAFE"
+        lon, lat = rnd.uniform(-170, 170), rnd.uniform(-70, 70)
+        coords = f"{lat},{lon} {lat + 1.5},{lon + 0.3} {lat + 1.7},{lon - 2.5} {lat + 0.2},{lon - 2.8}"
+        path = os.path.join(root, str(start.year), f"{start.month:02}", f"{start.day:02}", name)
+        os.makedirs(os.path.join(path, 'annotation'), exist_ok=True)
+        for iw in ('iw1', 'iw2', 'iw3'):
+            open(os.path.join(path, 'annotation', f"s1{number.lower()}-{iw}-slc-vv-{_s}.xml"), 'w').close()
+        with open(os.path.join(path, 'manifest.safe'), 'w') as _f:
+            _f.write(MANIFEST_TPL.format(
+                start=start.isoformat() + '.000000', stop=stop.isoformat() + '.000000',
+                number=number, orbit=orbit, relative_orbit=rnd.randint(1, 175),
+                coordinates=coords, padding=_PADDING,
+            ))
+        paths.append(path)
+    return paths
+
+
+def run_manifests(n=1000, workers=(0, None), root=None) -> list:
+    """ ingest n synthetic manifests with each of workers settings
+
+    :return: list of dicts {workers, manifests, parsed, seconds, manifests/sec}
+    """
+    _tmp = root if root else tempfile.mkdtemp(prefix='ocli-bench-')
+    try:
+        paths = make_synthetic_safe(_tmp, n)
+        res = []
+        for w in workers:
+            with Timer() as t:
+                df = ingest_manifests(paths, workers=w)
+            res.append({
+                'workers': 'in-process' if w == 0 else (w if w else os.cpu_count()),
+                'manifests': n,
+                'parsed': len(df),
+                'seconds': round(t.elapsed, 3),
+                'manifests/sec': round(rate(n, t.elapsed), 1),
+            })
+        return res
+    finally:
+        if not root:
+            shutil.rmtree(_tmp, ignore_errors=True)
+
+
+@click.command()
+@click.option('-n', 'n', type=click.INT, default=1000, show_default=True, help='number of synthetic manifests')
+@click.option('-w', '--workers', type=click.INT, multiple=True, default=[0, -1], show_default=True,
+              help='process pool size, 0 - in-process, -1 - CPU count; multiple allowed')
+@click.option('--root', type=click.Path(file_okay=False), default=None,
+              help='directory for synthetic products (default: temporary, removed after run)')
+def main(n, workers, root):
+    """ manifest.safe bulk ingestion throughput """
+    res = run_manifests(n, workers=[None if w < 0 else w for w in workers], root=root)
+    click.echo(tabulate(res, headers='keys'))
+
+
+if __name__ == '__main__':
+    main()
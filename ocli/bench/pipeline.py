@@ -0,0 +1,185 @@
+"""
+Pipeline stages benchmark on synthetic stacks (see ocli.bench.synthetic)
+
+    python -m ocli.bench.pipeline -s 512 -s 1024 -s 2048
+    python -m ocli.bench.pipeline -s 1024 --stage assemble --stage predict --keep /tmp/bench
+
+for every scene size: stack is generated, then every stage is run on it and
+wall time, throughput (Mpx/s), peak of memory allocated by the stage (tracemalloc, numpy buffers included)
+and checksum of stage output are reported.
+Global numpy random state is seeded before every stage, so checksums are comparable between runs
+and could be used to check that optimisation does not change results.
+Stages with missing optional dependencies (skimage for visualize, gdal for makecog) are reported as skipped.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+import click
+import numpy as np
+from tabulate import tabulate
+
+from ocli.bench import Timer, rate
+from ocli.bench import synthetic
+
+STAGES = ('fix_pixels', 'diffusion', 'assemble', 'fit', 'predict', 'visualize', 'makecog')
+SIZES = (512, 1024)
+
+
+def checksum_array(arr: np.ndarray) -> str:
+    return hashlib.sha1(np.ascontiguousarray(arr).tobytes()).hexdigest()[:12]
+
+
+def checksum_file(fname: str) -> str:
+    h = hashlib.sha1()
+    with open(fname, 'rb') as _f:
+        for chunk in iter(lambda: _f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+class Bench(object):
+    """ synthetic stack of one size with recipe, stages are methods stage_<name> returning checksum """
+
+    def __init__(self, root: str, size: int, dates=2, bad_density=0.001, seed=0, predictor_dir=None):
+        self.size = size
+        self.seed = seed
+        self.bad_density = bad_density
+        self.root = os.path.join(root, f'{size}')
+        stack = os.path.join(self.root, 'stack')
+        self.names = synthetic.make_stack(stack, (size, size), dates, bad_density, seed)
+        self.recipe = synthetic.make_recipe(stack, os.path.join(self.root, 'out'), predictor_dir, self.names)
+        self._band = None
+
+    @property
+    def pixels(self):
+        return self.size * self.size
+
+    def _sigma(self):
+        """ first sigma band, clipped and log10 as in Assemble """
+        from ocli.ai.Envi import Envi
+        if self._band is None:
+            self._band, _ = Envi(self.recipe, None).load(self.names['sigma'][0])
+        s = np.log10(np.clip(self._band, 1e-6, 10))
+        return s, (self._band < 1e-6) | (self._band > 10)
+
+    def stage_fix_pixels(self):
+        from ocli.ai.filter.fix_pixels import fix_pixels
+        s, bad = self._sigma()
+        fix_pixels(s, bad)
+        return checksum_array(s)
+
+    def stage_diffusion(self):
+        from ocli.ai.filter.anisotropic_diffusion import anisotropic_diffusion
+        s, _ = self._sigma()
+        niter, kappa = self.recipe['products']['sigma']
+        return checksum_array(anisotropic_diffusion(s, niter, kappa, 0.1, option=1))
+
+    def stage_assemble(self):
+        from ocli.ai import tensor_store
+        from ocli.ai.Envi import Envi
+        from ocli.ai.assemble import Assemble
+        a = Assemble('full', self.recipe, Envi(self.recipe, None))
+        if a.run():
+            raise RuntimeError('Assemble failed')
+        return checksum_array(tensor_store.load_tensor(a.filenames.tnsr))
+
+    def stage_fit(self):
+        """ predictor is fitted into own directory, shared predictor of predict stage is kept """
+        from ocli.ai.predictor import load_predictor
+        from ocli.ai.process import Process
+        recipe = synthetic.make_recipe(self.recipe['DATADIR'], self.recipe['OUTDIR'],
+                                       os.path.join(self.root, 'predictor'), self.names)
+        os.makedirs(recipe['PREDICTOR_DIR'], exist_ok=True)
+        if Process('full', 'fit', recipe).run():
+            raise RuntimeError('Process fit failed')
+        return checksum_array(load_predictor(recipe['PREDICTOR_DIR']).gm.means_)
+
+    def stage_predict(self):
+        from ocli.ai import tensor_store
+        from ocli.ai.process import Process
+        p = Process('full', 'predict', self.recipe)
+        if p.run():
+            raise RuntimeError('Process predict failed')
+        return checksum_array(tensor_store.load_tensor(p.filenames.prob_pred))
+
+    def stage_visualize(self):
+        from ocli.ai.Envi import Envi
+        from ocli.ai.visualize.visualize_cluster import Visualize
+        v = Visualize('full', self.recipe, Envi(self.recipe, None))
+        v.run()
+        return checksum_file(v.filenames.pred8c_img)
+
+    def stage_makecog(self):
+        from ocli.ai.gdal_wrap3 import GDALWrap3
+        from ocli.ai.util import Filenames
+        f = Filenames('full', self.recipe)
+        GDALWrap3(self.recipe, f.pred8c_img, f.out_tiff, f.out_cog_tiff).make_cog()
+        return checksum_file(f.out_cog_tiff)
+
+    def run_stage(self, stage: str) -> dict:
+        res = {'stage': stage, 'size': self.size}
+        np.random.seed(self.seed)
+        tracemalloc.start()
+        try:
+            with Timer() as t:
+                res['checksum'] = getattr(self, 'stage_' + stage)()
+            res['seconds'] = round(t.elapsed, 3)
+            res['Mpx/s'] = round(rate(self.pixels / 1e6, t.elapsed), 3)
+            res['peak MB'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        except ImportError as e:
+            res['checksum'] = f'skipped: {e}'
+        finally:
+            tracemalloc.stop()
+        return res
+
+
+def run_pipeline(root: str, sizes=SIZES, stages=STAGES, dates=2, bad_density=0.001, seed=0) -> list:
+    """ run stages for every size, stages are run in STAGES order as every stage uses output of previous one
+
+    :param root: working directory
+    """
+    stages = [s for s in STAGES if s in stages]
+    predictor_dir = None
+    if {'predict', 'visualize', 'makecog'} & set(stages):
+        predictor_dir = synthetic.make_predictor(root, dates=dates, seed=seed)
+    res = []
+    for size in sizes:
+        b = Bench(root, size, dates, bad_density, seed, predictor_dir)
+        """ stages working on assembled tensor and predictions need previous stages outputs """
+        _run = list(stages)
+        if 'assemble' not in _run and {'fit', 'predict', 'visualize', 'makecog'} & set(_run):
+            b.run_stage('assemble')
+        if 'predict' not in _run and {'visualize', 'makecog'} & set(_run):
+            b.run_stage('predict')
+        for stage in _run:
+            res.append(b.run_stage(stage))
+    return res
+
+
+@click.command()
+@click.option('-s', '--size', 'sizes', type=click.INT, multiple=True, default=SIZES, show_default=True,
+              help='scene size, pixels, multiple allowed')
+@click.option('--stage', 'stages', type=click.Choice(STAGES), multiple=True, default=STAGES, show_default=True,
+              help='stages to run, multiple allowed')
+@click.option('--dates', type=click.INT, default=2, show_default=True, help='number of acquisitions')
+@click.option('--bad', 'bad_density', type=click.FLOAT, default=0.001, show_default=True,
+              help='bad pixels density')
+@click.option('--seed', type=click.INT, default=0, show_default=True)
+@click.option('--keep', type=click.Path(file_okay=False), default=None,
+              help='working directory to keep generated data, temporary directory is removed by default')
+def main(sizes, stages, dates, bad_density, seed, keep):
+    """ pipeline stages throughput on synthetic stacks """
+    root = keep if keep else tempfile.mkdtemp(prefix='ocli-bench-')
+    try:
+        res = run_pipeline(root, sizes, stages, dates, bad_density, seed)
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+    click.echo(tabulate(res, headers='keys'))
+
+
+if __name__ == '__main__':
+    main()
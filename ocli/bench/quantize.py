@@ -0,0 +1,132 @@
+"""
+Quantised tensor storage check: size, read time and change of cluster assignments against float32 tensor
+
+    python -m ocli.bench.quantize -s 1024
+    python -m ocli.bench.quantize -r /path/to/task/recipe.json --mode zone
+
+with recipe the assembled tensor (OUTDIR) and predictor (PREDICTOR_DIR) of the task are used, results of the task
+are not touched: every variant is stored and predicted in a temporary directory.
+Task tensor should be assembled without tensor_quantize, it is the float32 reference.
+'changed' is part of valid (not bad data) pixels assigned to another cluster than with float32 tensor.
+"""
+import os
+import shutil
+import tempfile
+
+import click
+import numpy as np
+from tabulate import tabulate
+
+from ocli.ai import tensor_store
+from ocli.ai.Envi import Envi, parse_header
+from ocli.ai.recipe import Recipe
+from ocli.ai.util import Filenames
+from ocli.bench import Timer, rate
+from ocli.bench import synthetic
+
+VARIANTS = ('float32', 'uint16', 'uint8')
+
+
+def _tensor_bytes(fname: str) -> int:
+    if tensor_store.tensor_format(fname) == 'chunked':
+        _d = tensor_store.chunked_path(fname)
+        return sum(os.path.getsize(os.path.join(_d, f)) for f in os.listdir(_d))
+    return os.path.getsize(fname)
+
+
+def _save_variant(envi: Envi, tnsr: np.ndarray, hdict: dict, bd: np.ndarray, dst: Filenames, variant: str,
+                  fmt=None):
+    os.makedirs(dst.OUTDIR, exist_ok=True)
+    hdr = dict(hdict)
+    hdr.pop(tensor_store.HDR_GAIN, None)
+    hdr.pop(tensor_store.HDR_OFFSET, None)
+    hdr.update(tensor_store.save_tensor(dst.tnsr, tnsr, fmt, quantization=None if variant == 'float32' else variant))
+    envi.save_dict_to_hdr(dst.tnsr_hdr, hdr)
+    np.save(dst.bd, bd)
+
+
+def run_quantize(recipe: Recipe, mode='full', root=None, variants=VARIANTS) -> list:
+    """ store tensor of the recipe in every variant, predict and compare with float32 variant
+
+    :param root: working directory, temporary if None
+    """
+    from ocli.ai.process import Process
+    _root = root if root else tempfile.mkdtemp(prefix='ocli-quantize-')
+    try:
+        src = Filenames(mode, recipe)
+        if tensor_store.read_quantization(src.tnsr) is not None:
+            raise AssertionError(f"Tensor {src.tnsr} is quantised, assemble it without tensor_quantize for reference")
+        envi = Envi(recipe, None)
+        tnsr = tensor_store.load_tensor(src.tnsr).astype(np.float32, copy=False)
+        bd = np.load(src.bd)
+        _, hdict = parse_header(src.tnsr_hdr)
+        res = []
+        ref = None
+        for v in ('float32',) + tuple(v for v in variants if v != 'float32'):
+            r = Recipe(dict(recipe, OUTDIR=os.path.join(_root, v)))
+            dst = Filenames(mode, r)
+            _save_variant(envi, tnsr, hdict, bd, dst, v, recipe.get('tensor_format'))
+            with Timer() as t_read:
+                _t = tensor_store.load_tensor(dst.tnsr)
+            with Timer() as t_predict:
+                if Process(mode, 'predict', r).run():
+                    raise RuntimeError(f"Process predict of {v} tensor failed")
+            labels = tensor_store.load_tensor(dst.prob_pred).argmax(axis=-1)[~bd]
+            if ref is None:
+                ref = labels
+            res.append({
+                'tensor': v,
+                'MB': round(_tensor_bytes(dst.tnsr) / 2 ** 20, 2),
+                'read seconds': round(t_read.elapsed, 3),
+                'read MB/s': round(rate(tnsr.nbytes / 2 ** 20, t_read.elapsed), 1),
+                'predict seconds': round(t_predict.elapsed, 3),
+                'max value error': float(np.abs(_t - tnsr).max()),
+                'changed': float((labels != ref).mean()) if labels.size else 0.,
+            })
+        return [r for r in res if r['tensor'] in variants]
+    finally:
+        if not root:
+            shutil.rmtree(_root, ignore_errors=True)
+
+
+def synthetic_recipe(root: str, size: int, seed=0) -> Recipe:
+    """ assembled synthetic stack with fitted predictor """
+    from ocli.ai.Envi import Envi
+    from ocli.ai.assemble import Assemble
+    pred = synthetic.make_predictor(root, seed=seed)
+    names = synthetic.make_stack(os.path.join(root, 'stack'), (size, size), seed=seed + 1)
+    recipe = synthetic.make_recipe(os.path.join(root, 'stack'), os.path.join(root, 'out'), pred, names)
+    if Assemble('full', recipe, Envi(recipe, None)).run():
+        raise RuntimeError('Assemble failed')
+    return recipe
+
+
+@click.command()
+@click.option('-r', '--recipe', 'recipe_file', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='task recipe with assembled tensor and predictor, synthetic stack is used if not set')
+@click.option('--mode', type=click.Choice(['full', 'zone']), default='full', show_default=True)
+@click.option('-s', '--size', type=click.INT, default=1024, show_default=True, help='synthetic scene size, pixels')
+@click.option('--variant', 'variants', type=click.Choice(VARIANTS), multiple=True, default=VARIANTS,
+              show_default=True, help='tensor storage, multiple allowed')
+@click.option('--keep', type=click.Path(file_okay=False), default=None,
+              help='working directory to keep data, temporary directory is removed by default')
+def main(recipe_file, mode, size, variants, keep):
+    """ quantised tensor storage check """
+    root = keep if keep else tempfile.mkdtemp(prefix='ocli-quantize-')
+    try:
+        if recipe_file:
+            recipe = Recipe(recipe_file)
+        else:
+            recipe = synthetic_recipe(os.path.join(root, 'synthetic'), size)
+            mode = 'full'
+        res = run_quantize(recipe, mode, os.path.join(root, 'variants'), variants)
+    except AssertionError as e:
+        raise click.UsageError(str(e))
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+    click.echo(tabulate(res, headers='keys'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+CLI startup benchmark based on python -X importtime
+
+    python -m ocli.bench.startup
+    python -m ocli.bench.startup -c "--help" -c "task --help" --budget 0.5
+
+every command is run in a fresh interpreter, exit code is 1 if import time of the CLI exceeds the budget
+or any of HEAVY_MODULES is loaded before the command needs it, so it could be used as CI check
+"""
+import json
+import subprocess
+import sys
+
+import click
+from tabulate import tabulate
+
+from ocli.bench import Timer
+
+STARTUP_MODULE = 'ocli.cli.cli'
+""" seconds, cumulative import time of STARTUP_MODULE """
+STARTUP_BUDGET = 0.5
+""" modules which should be imported only by commands using them """
+HEAVY_MODULES = ('geopandas', 'pandas', 'gdal', 'osgeo', 'sklearn', 'scipy', 'matplotlib', 'spectral',
+                 'boto3', 'skimage', 'cartopy', 'prompt_toolkit', 'click_repl', 'dateparser', 'pygments')
+""" commands which should not load HEAVY_MODULES """
+LIGHT_COMMANDS = ('--help', 'task --help', 'roi --help', 'ai --help')
+
+_SCRIPT = """
+import json, sys
+sys.argv = ['ocli'] + {args!r}
+from ocli.cli.cli import loop
+try:
+    loop()
+except SystemExit:
+    pass
+sys.stderr.write('OCLI_MODULES ' + json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)) + '\\n')
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """ [{'module', 'self', 'cumulative', 'depth'}] from -X importtime output, times in seconds """
+    res = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _self, _cum, _name = line[len('import time:'):].split('|')
+        res.append({
+            'module': _name.strip(),
+            'self': int(_self) / 1e6,
+            'cumulative': int(_cum) / 1e6,
+            'depth': (len(_name) - len(_name.lstrip()) - 1) // 2,
+        })
+    return res
+
+
+def run_command(args: str) -> dict:
+    """ run CLI command in fresh interpreter with -X importtime """
+    script = _SCRIPT.format(args=args.split(), heavy=HEAVY_MODULES)
+    with Timer() as t:
+        p = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    imports = parse_importtime(p.stderr)
+    heavy = []
+    for line in p.stderr.splitlines():
+        if line.startswith('OCLI_MODULES '):
+            heavy = json.loads(line[len('OCLI_MODULES '):])
+    startup = [i['cumulative'] for i in imports if i['module'] == STARTUP_MODULE]
+    return {
+        'command': args,
+        'failed': p.returncode != 0,
+        'wall seconds': round(t.elapsed, 3),
+        'import seconds': round(startup[0], 3) if startup else None,
+        'heavy modules': heavy,
+        'imports': imports,
+    }
+
+
+def run_startup(commands=LIGHT_COMMANDS, repeat=3) -> list:
+    """ best of repeat runs for every command """
+    res = []
+    for c in commands:
+        runs = [run_command(c) for _ in range(repeat)]
+        res.append(min(runs, key=lambda r: r['wall seconds']))
+    return res
+
+
+def check_budget(results: list, budget=STARTUP_BUDGET) -> list:
+    """ list of violations, empty if all commands fit the budget """
+    errors = []
+    for r in results:
+        if r['failed']:
+            errors.append(f"'{r['command']}': command failed")
+        elif r['import seconds'] is None:
+            errors.append(f"'{r['command']}': {STARTUP_MODULE} was not imported")
+        elif r['import seconds'] > budget:
+            errors.append(f"'{r['command']}': import time {r['import seconds']}s exceeds budget {budget}s")
+        if r['heavy modules']:
+            errors.append(f"'{r['command']}': heavy modules imported on startup: {', '.join(r['heavy modules'])}")
+    return errors
+
+
+def slowest(result: dict, top=10) -> list:
+    """ slowest top-level packages by cumulative time """
+    _i = [i for i in result['imports'] if i['depth'] <= 1]
+    return sorted(_i, key=lambda i: -i['cumulative'])[:top]
+
+
+@click.command()
+@click.option('-c', '--command', 'commands', multiple=True, default=LIGHT_COMMANDS, show_default=True,
+              help='CLI arguments, multiple allowed')
+@click.option('--budget', type=click.FLOAT, default=STARTUP_BUDGET, show_default=True,
+              help='max import time of the CLI, seconds')
+@click.option('--repeat', type=click.INT, default=3, show_default=True, help='best of N runs')
+@click.option('--top', type=click.INT, default=10, show_default=True, help='show N slowest imports')
+def main(commands, budget, repeat, top):
+    """ CLI startup time """
+    res = run_startup(commands, repeat)
+    click.echo(tabulate([{k: v for k, v in r.items() if k != 'imports'} for r in res], headers='keys'))
+    if top:
+        click.echo()
+        click.echo(tabulate([[i['module'], i['self'], i['cumulative']] for i in slowest(res[0], top)],
+                            headers=['module', 'self', 'cumulative']))
+    errors = check_budget(res, budget)
+    for e in errors:
+        click.secho(e, fg='red', err=True)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
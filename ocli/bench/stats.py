@@ -0,0 +1,102 @@
+"""
+Band statistics for histogram previews: flattened band + scipy describe vs streaming statistics (ocli.ai.stats)
+
+    python -m ocli.bench.stats -s 4096 -b 8
+    python -m ocli.bench.stats -s 4096 --format chunked --quantize uint16
+
+tensor is stored as by Assemble, 'cached' is repeated preview with sidecar statistics,
+error is max difference of min/max/mean/std relative to band std and share of histogram counts moved to other bins
+(values of quantised tensors are discrete, so counts of streamed histogram could move to a neighbouring bin).
+"""
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+import click
+import numpy as np
+from scipy.stats import describe
+from tabulate import tabulate
+
+from ocli.ai import tensor_store
+from ocli.ai.stats import BandWindow, cached_stats, sidecar_name, stream_stats, window_key
+from ocli.bench import Timer, rate
+
+BINS = 100
+
+
+def flattened(fname: str, bands: int, bins=BINS) -> list:
+    """ preview before streaming statistics: every band is read whole """
+    ary = tensor_store.open_tensor(fname)
+    res = []
+    for b in range(bands):
+        _a = np.asarray(ary[..., b], dtype=np.float32).reshape(-1)
+        _d = describe(_a)
+        res.append((_d, np.histogram(_a, bins=bins)[0]))
+    return res
+
+
+def streamed(fname: str, bands: int) -> list:
+    ary = tensor_store.open_tensor(fname)
+
+    def _compute(idx):
+        return stream_stats([BandWindow(ary, i) for i in idx])
+
+    return cached_stats(fname, tensor_store.tensor_mtime(fname), [f"{b}|{window_key(None)}" for b in range(bands)],
+                        _compute)
+
+
+def _measure(fn) -> (object, float, float):
+    tracemalloc.start()
+    try:
+        with Timer() as t:
+            res = fn()
+        return res, t.elapsed, tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def run_stats(root: str, size=2048, bands=8, fmt=None, quantization=None, seed=0) -> list:
+    rng = np.random.default_rng(seed)
+    tnsr = rng.normal(size=(size, size, bands)).astype(np.float32) * np.arange(1, bands + 1, dtype=np.float32)
+    fname = os.path.join(root, 'tnsr.npy')
+    tensor_store.save_tensor(fname, tnsr, fmt, quantization=quantization)
+    del tnsr
+    ref, t_ref, m_ref = _measure(lambda: flattened(fname, bands))
+    res = [{'method': 'flattened', 'seconds': round(t_ref, 3), 'Mpx/s': round(rate(size * size / 1e6, t_ref), 2),
+            'peak MB': round(m_ref, 1)}]
+    for name in ('streamed', 'cached'):
+        if name == 'streamed' and os.path.exists(sidecar_name(fname)):
+            os.remove(sidecar_name(fname))
+        st, t, m = _measure(lambda: streamed(fname, bands))
+        err, moved = 0., 0.
+        for (_d, _h), s in zip(ref, st):
+            _std = np.sqrt(_d.variance)
+            err = max(err, *(abs(a - b) / _std for a, b in
+                             ((s.min, _d.minmax[0]), (s.max, _d.minmax[1]), (s.mean, _d.mean), (s.std, _std))))
+            moved = max(moved, np.abs(s.histogram(BINS)[0] - _h).sum() / 2 / _d.nobs)
+        res.append({'method': name, 'seconds': round(t, 3), 'Mpx/s': round(rate(size * size / 1e6, t), 2),
+                    'peak MB': round(m, 1), 'speedup': round(t_ref / t, 2),
+                    'max error': float(err), 'moved': float(moved)})
+    return res
+
+
+@click.command()
+@click.option('-s', '--size', type=click.INT, default=2048, show_default=True, help='tensor size, pixels')
+@click.option('-b', '--bands', type=click.INT, default=8, show_default=True)
+@click.option('--format', 'fmt', type=click.Choice(tensor_store.FORMATS), default=None,
+              help='tensor storage format')
+@click.option('--quantize', 'quantization', type=click.Choice(tensor_store.QUANTIZE), default=None,
+              help='quantised tensor storage')
+def main(size, bands, fmt, quantization):
+    """ band statistics for histogram previews """
+    root = tempfile.mkdtemp(prefix='ocli-stats-')
+    try:
+        res = run_stats(root, size, bands, fmt, quantization)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    click.echo(tabulate(res, headers='keys'))
+
+
+if __name__ == '__main__':
+    main()
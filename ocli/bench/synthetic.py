@@ -0,0 +1,181 @@
+"""
+Synthetic Sentinel-1 like stacks for offline benchmarks
+
+stack is a directory of single band float32 ENVI files named as SNAP stack products, so cluster template
+patterns (Sigma*, coh*) match them:
+    Sigma0_IW2_VV_mst_<date>, Sigma0_IW2_VH_mst_<date>   - speckled backscatter, linear scale
+    coh_IW2_VV_<date>_<date>, coh_IW2_VH_<date>_<date>     - coherence in [0,1]
+
+scene is a mosaic of 'fields' with own mean backscatter and coherence,
+sigma0 has gamma distributed speckle (ENL looks), bad pixels (sigma0 = 0, coherence > 1) are spread with given density
+
+    python -m ocli.bench.synthetic /tmp/stack -s 1024 --dates 3
+"""
+import os
+from datetime import date, timedelta
+
+import click
+import numpy as np
+
+from ocli.ai.Envi import Envi
+from ocli.ai.recipe import Recipe
+
+""" sigma0 of fields, dB """
+SIGMA_DB = (-25., -5.)
+""" VH is weaker than VV, dB """
+VH_OFFSET_DB = -7.
+ENL = 4.5
+FIELD_SIZE = 64
+PIXEL_SIZE = 1e-4
+ORIGIN = (10., 50.)
+MAP_INFO = '{Geographic Lat/Lon, 1.0, 1.0, %f, %f, %g, %g, WGS84, units=Degrees}'
+COORD_STRING = ('{GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",SPHEROID["WGS_1984",6378137.0,298.257223563]],'
+                'PRIMEM["Greenwich",0.0],UNIT["Degree",0.0174532925199433]]}')
+
+
+def _fields(shape, rng, low, high, field_size=FIELD_SIZE) -> np.ndarray:
+    """ piecewise constant image of field values """
+    gy, gx = -(-shape[0] // field_size), -(-shape[1] // field_size)
+    f = rng.uniform(low, high, size=(gy, gx)).astype(np.float32)
+    return np.repeat(np.repeat(f, field_size, axis=0), field_size, axis=1)[:shape[0], :shape[1]]
+
+
+def make_sigma(shape, rng, base_db: np.ndarray, looks=ENL) -> np.ndarray:
+    """ linear sigma0 with multiplicative gamma speckle """
+    speckle = rng.gamma(looks, 1. / looks, size=shape).astype(np.float32)
+    return (10 ** (base_db / 10.) * speckle).astype(np.float32)
+
+
+def make_coh(shape, rng, base: np.ndarray, looks=10) -> np.ndarray:
+    """ coherence estimate: field coherence with beta distributed estimation noise """
+    a = np.maximum(base * looks, 0.05)
+    b = np.maximum((1 - base) * looks, 0.05)
+    return rng.beta(a, b).astype(np.float32)
+
+
+def add_bad_pixels(arr: np.ndarray, rng, density: float, value: float) -> int:
+    """ spread bad pixels (single and small 3x3 clusters), return number of bad pixels """
+    if density <= 0:
+        return 0
+    n = int(arr.size * density)
+    idx = rng.integers(0, arr.size, size=n)
+    arr.reshape(-1)[idx] = value
+    """ every 10th bad pixel grows into 3x3 cluster, like border/no-data artefacts """
+    ys, xs = np.unravel_index(idx[::10], arr.shape)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            arr[np.clip(ys + dy, 0, arr.shape[0] - 1), np.clip(xs + dx, 0, arr.shape[1] - 1)] = value
+    return n
+
+
+def map_info(origin=ORIGIN, pixel_size=PIXEL_SIZE) -> str:
+    return MAP_INFO % (origin[0], origin[1], pixel_size, pixel_size)
+
+
+def make_stack(path: str, shape=(1024, 1024), dates=2, bad_density=0.001, seed=0, pols=('VV', 'VH')) -> dict:
+    """ write synthetic stack
+
+    :param shape: (lines, samples)
+    :param dates: number of acquisitions, dates-1 coherence pairs
+    :param bad_density: part of bad pixels in every band
+    :return: {'sigma': [names], 'coh': [names]}
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    envi = Envi({'DATADIR': path}, None)
+    _mi = map_info()
+    sigma_db = _fields(shape, rng, *SIGMA_DB)
+    coh_base = _fields(shape, rng, 0.1, 0.95)
+    d0 = date(2020, 1, 1)
+    days = [d0 + timedelta(days=12 * i) for i in range(dates)]
+    names = {'sigma': [], 'coh': []}
+    for pol in pols:
+        _db = sigma_db + (VH_OFFSET_DB if pol == 'VH' else 0.)
+        for d in days:
+            """ small change of the scene between acquisitions """
+            s = make_sigma(shape, rng, _db + rng.normal(0, 0.5, size=shape).astype(np.float32))
+            add_bad_pixels(s, rng, bad_density, 0.)
+            n = f"Sigma0_IW2_{pol}_mst_{d:%d%b%Y}"
+            envi.save(os.path.join(path, n), s, _mi, COORD_STRING, chnames=n, interleave='bsq')
+            names['sigma'].append(n)
+        for d1, d2 in zip(days[:-1], days[1:]):
+            c = make_coh(shape, rng, coh_base)
+            add_bad_pixels(c, rng, bad_density, 1.5)
+            n = f"coh_IW2_{pol}_{d1:%d%b%Y}_{d2:%d%b%Y}"
+            envi.save(os.path.join(path, n), c, _mi, COORD_STRING, chnames=n, interleave='bsq')
+            names['coh'].append(n)
+    return names
+
+
+def make_recipe(stack_path: str, out_path: str, predictor_path: str, names: dict, zone=None,
+                num_clusters=8, **kwargs) -> Recipe:
+    """ recipe for synthetic stack with cluster template defaults, kwargs override recipe keys """
+    recipe = {
+        'version': 1.4,
+        'type': 'Cluster',
+        'kind': 'cluster',
+        'class': 'S1',
+        'friendly_name': 'synthetic',
+        'DATADIR': stack_path,
+        'OUTDIR': out_path,
+        'PREDICTOR_DIR': predictor_path,
+        'COS': {'ResultKey': 'synthetic', 'bucket': None},
+        'products': {
+            'sigma': [15, 1.5],
+            'sigma_avg': [15, 1.5],
+            'coh': [20, 2],
+            'coh_avg': [20, 2],
+        },
+        'channels': {
+            'sigma': names['sigma'],
+            'sigma_avg': names['sigma'],
+            'coh': names['coh'],
+            'coh_avg': names['coh'],
+        },
+        'learn_channels': list(range(len(names['sigma']) + len(names['coh']) + 2)),
+        'learn_gauss': 3,
+        'predict_gauss': 2,
+        'num_clusters': num_clusters,
+        'band_meta': [{'band': i + 1, 'name': f'c{i + 1}', 'color': '#000000'} for i in range(num_clusters)],
+    }
+    if zone is not None:
+        recipe['zone'] = [list(zone[:2]), list(zone[2:])]
+    recipe.update(kwargs)
+    return Recipe(recipe)
+
+
+def make_predictor(root: str, shape=(256, 256), dates=2, num_clusters=8, seed=0) -> str:
+    """ predictor fitted on small synthetic stack, features match make_recipe() tensors of the same dates
+
+    :return: predictor directory
+    """
+    from ocli.ai.assemble import Assemble
+    from ocli.ai.process import Process
+    stack = os.path.join(root, 'predictor-stack')
+    pred = os.path.join(root, 'predictor')
+    os.makedirs(pred, exist_ok=True)
+    names = make_stack(stack, shape, dates=dates, seed=seed)
+    recipe = make_recipe(stack, os.path.join(root, 'predictor-out'), pred, names, num_clusters=num_clusters)
+    Assemble('full', recipe, Envi(recipe, None)).run()
+    """ KMeans and GM use global numpy random state """
+    np.random.seed(seed)
+    Process('full', 'fit', recipe).run()
+    return pred
+
+
+@click.command()
+@click.argument('path', type=click.Path(file_okay=False))
+@click.option('-s', '--size', type=click.INT, default=1024, show_default=True, help='scene size, pixels')
+@click.option('--dates', type=click.INT, default=2, show_default=True, help='number of acquisitions')
+@click.option('--bad', 'bad_density', type=click.FLOAT, default=0.001, show_default=True,
+              help='bad pixels density')
+@click.option('--seed', type=click.INT, default=0, show_default=True)
+def main(path, size, dates, bad_density, seed):
+    """ generate synthetic ENVI stack """
+    names = make_stack(path, (size, size), dates, bad_density, seed)
+    for k, v in names.items():
+        click.echo(f"{k}: {', '.join(v)}")
+
+
+if __name__ == '__main__':
+    main()
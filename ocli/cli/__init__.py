@@ -1,11 +1,10 @@
 import logging
 import os
 import sys
+from importlib import import_module
 from pathlib import Path
 from time import time
-import dateparser
 import click
-from pygments import highlight, lexers, formatters
 from tqdm import tqdm
 
 from ocli.util.date_parse import parse_to_utc_string
@@ -29,10 +28,50 @@ class AliasedGroup(click.Group):
         if not matches:
             return None
         elif len(matches) == 1:
-            return click.Group.get_command(self, ctx, matches[0])
+            return self.get_command(ctx, matches[0])
         ctx.fail('Too many matches: %s' % ', '.join(sorted(matches)))
 
 
+class LazyGroup(AliasedGroup):
+    """ group with subcommands imported on first use, so heavy modules are not loaded on CLI startup
+
+    :param lazy_commands: {command name: (module, attribute, short help)},
+        short help is shown in group help without importing the module
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super(LazyGroup, self).__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
+
+    def add_lazy_command(self, name, module, attribute, short_help=''):
+        self.lazy_commands[name] = (module, attribute, short_help)
+
+    def list_commands(self, ctx):
+        return sorted(set(super(LazyGroup, self).list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands:
+            module, attribute, _ = self.lazy_commands.pop(cmd_name)
+            self.add_command(getattr(import_module(module), attribute), cmd_name)
+        return super(LazyGroup, self).get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        """ same as click.Group.format_commands, lazy commands are not resolved """
+        commands = []
+        for name in self.list_commands(ctx):
+            if name in self.lazy_commands:
+                commands.append((name, self.lazy_commands[name][2]))
+            else:
+                cmd = self.commands.get(name)
+                if cmd is not None and not cmd.hidden:
+                    commands.append((name, cmd))
+        if commands:
+            limit = formatter.width - 6 - max(len(name) for name, _ in commands)
+            rows = [(name, cmd if isinstance(cmd, str) else cmd.get_short_help_str(limit)) for name, cmd in commands]
+            with formatter.section('Commands'):
+                formatter.write_dl(rows)
+
+
 class TqdmUpTo(tqdm):
     """Provides `update_to(n)` which uses `tqdm.update(delta_n)`."""
 
@@ -113,6 +152,7 @@ class Progress(object):
 
 
 def colorful_json(formatted_json):
+    from pygments import highlight, lexers, formatters
     return highlight(formatted_json, lexers.JsonLexer(), formatters.TerminalFormatter())
 
 
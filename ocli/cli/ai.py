@@ -2,24 +2,18 @@ import json
 import logging
 import os
 import shutil
+from importlib.util import find_spec
 from json import JSONDecodeError
 from pathlib import Path
 from pprint import pprint
 
 import click
-import gdal
 from tqdm import tqdm
 
-from ocli.ai.COS.s3_boto import COS
-from ocli.ai.Envi import Envi
-from ocli.ai.gdal_wrap3 import GDALWrap3
 from ocli.ai.recipe import Recipe
 from ocli.ai.util import Filenames
-from ocli.ai.visualize.visualize_cluster import Visualize
-from ocli.cli import output, pfac, colorful_json
+from ocli.cli import output, pfac, colorful_json, LazyGroup
 from ocli.cli.ai_options import option_locate_recipe, argument_zone, resolve_recipe, cos_key_option
-from ocli.cli.ai_preview import ai_preview
-from ocli.cli.ai_snap import cli_ai_snap
 from ocli.cli.output import OCLIException
 from ocli.cli.state import Repo, Task, pass_task, \
     pass_repo, option_less
@@ -27,20 +21,16 @@ from ocli.cli.state import Repo, Task, pass_task, \
 log = logging.getLogger()
 
 
-@click.group('ai')
+@click.group('ai', cls=LazyGroup, lazy_commands={
+    'snap': ('ocli.cli.ai_snap', 'cli_ai_snap', 'AI  processing'),
+    'preview': ('ocli.cli.ai_preview', 'ai_preview', ''),
+})
 def cli_ai():
     pass
 
 
-cli_ai.add_command(cli_ai_snap, 'snap')
-
-try:
-    from ocli.tilewise_processing.cli_ai import cli_ai_sarpy
-
-    cli_ai.add_command(cli_ai_sarpy, 'sarpy')
-except Exception as e:
-    log.exception(e)
-    pass
+if find_spec('ocli.tilewise_processing') is not None:
+    cli_ai.add_lazy_command('sarpy', 'ocli.tilewise_processing.cli_ai', 'cli_ai_sarpy')
 
 
 # ####################################### VISUALIZE #######################################################
@@ -51,6 +41,9 @@ except Exception as e:
 @pass_repo
 def ai_visualize(repo: Repo, task: Task, roi_id, recipe_path, zone):
     """visualize AI processing results"""
+    from ocli.ai.COS.s3_boto import COS
+    from ocli.ai.Envi import Envi
+    from ocli.ai.visualize.visualize_cluster import Visualize
     try:
         _recipe = recipe_path if recipe_path else resolve_recipe(repo, task, roi_id)
         recipe = Recipe(_recipe)
@@ -113,6 +106,8 @@ def ai_makecog(repo: Repo, task: Task, roi_id, recipe_path, json_only, quiet, no
         if --cos-key       starts with '+' value will be used as suffix for COS.ResultKey in GeoJSON
 
     """
+    import gdal
+    from ocli.ai.gdal_wrap3 import GDALWrap3
     driver = 'MAKECOG'
     if source:
         try:
@@ -237,6 +232,7 @@ def ai_upload(repo: Repo, task: Task, roi_id, recipe_path, cos_key, dry_run):
     if not cos_key.endswith('.tiff'):
         cos_key += '.tiff'
     log.info(f"About to upload {cog_file} as {cos_key} to bucket {recipe['COS'].get('bucket')} ")
+    from ocli.ai.COS.s3_boto import COS
     try:
         cos = COS(recipe)
     except SystemExit:
@@ -247,14 +243,16 @@ def ai_upload(repo: Repo, task: Task, roi_id, recipe_path, cos_key, dry_run):
             output.comment(f'Uploading "{cog_file}" as "{cos_key}" into bucket "{cos.bucket}"')
             output.comment(f'Uploading "{cog_file}.geojson" as "{cos_key}.geojson" into bucket "{cos.bucket}"')
         else:
-            filesize = os.stat(cog_file).st_size
-            with tqdm(total=filesize, unit='B', unit_scale=True, desc=cos_key) as t:
-                cos.upload_to_cos(cog_file, cos_key, hook(t))
-            if os.path.isfile(cog_file + '.geojson'):
-                filesize = os.stat(cog_file + '.geojson').st_size
-                with tqdm(total=filesize, unit='B', unit_scale=True, desc=cos_key + '.geojson') as t:
-                    cos.upload_to_cos(cog_file + '.geojson', cos_key + '.geojson', hook(t))
+            from ocli.util import metrics
+            with metrics.run('upload', recipe.get('OUTDIR'), recipe=recipe.get('friendly_name')):
+                filesize = os.stat(cog_file).st_size
+                with tqdm(total=filesize, unit='B', unit_scale=True, desc=cos_key) as t, \
+                        metrics.span('upload', file='cog'):
+                    cos.upload_to_cos(cog_file, cos_key, hook(t))
+                if os.path.isfile(cog_file + '.geojson'):
+                    filesize = os.stat(cog_file + '.geojson').st_size
+                    with tqdm(total=filesize, unit='B', unit_scale=True, desc=cos_key + '.geojson') as t, \
+                            metrics.span('upload', file='geojson'):
+                        cos.upload_to_cos(cog_file + '.geojson', cos_key + '.geojson', hook(t))
     except SystemExit as e:
         raise click.UsageError(e)
-
-cli_ai.add_command(ai_preview, 'preview')
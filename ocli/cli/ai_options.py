@@ -143,6 +143,13 @@ def option_hist(f):
     return f
 
 
+def option_resolution(f):
+    from ocli.ai.pyramid import PREVIEW_RESOLUTION
+    return click.option('--resolution', type=click.INT, default=PREVIEW_RESOLUTION, show_default=True,
+                        help="Preview resolution (longest side in pixels), coarsest suitable overview is used."
+                             " 0 - always use full resolution data")(f)
+
+
 def option_data_path(f):
     return click.option('-d', '--data-path', 'data_path', help='Path to data directory.',
                         default=None,
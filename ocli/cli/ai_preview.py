@@ -17,11 +17,12 @@ from ocli.ai.util import Filenames
 from ocli.cli import output
 from ocli.cli.ai_options import option_locate_recipe, option_list, option_slice, resolve_recipe, argument_zone, \
     option_save, option_tnorm, option_clip, option_hist, option_data_path, option_columns, option_bands, option_gauss, \
-    option_tensor_vis, option_stack_vis, COMMON_MATH_TENSOR_HELP, COMMON_MATH_STACK_HELP
+    option_tensor_vis, option_stack_vis, option_resolution, COMMON_MATH_TENSOR_HELP, COMMON_MATH_STACK_HELP
+from ocli.ai.pyramid import select_overview
 from ocli.cli.output import OCLIException
 from ocli.cli.state import Repo, Task, pass_task, pass_repo
 from ocli.preview import preview_stack, preview_tnsr, preview_cluster, create_stack_rgb, _vis_rgb, \
-    create_tensor_rgb, read_tensor
+    create_tensor_rgb, read_tensor, preview_hist, tensor_stats
 from ocli.util.docstring_parameter import docstring_parameter
 
 log = logging.getLogger()
@@ -166,6 +167,7 @@ def preview_math_options(f):
 
 
 def options_preview_stack(f):
+    f = option_resolution(f)
     f = option_save(f)
     f = option_hist(f)
     f = option_columns(f)
@@ -190,6 +192,7 @@ def options_preview_stack_math(f):
 
 
 def options_preview_tnsr(f):
+    f = option_resolution(f)
     f = argument_zone(f)
     f = option_data_path(f)
     f = option_save(f)
@@ -203,6 +206,7 @@ def options_preview_tnsr(f):
 
 
 def options_preview_tensor_math(f):
+    f = option_resolution(f)
     f = argument_zone(f)
     f = option_save(f)
     f = option_data_path(f)
@@ -219,6 +223,7 @@ def options_preview_tensor_math(f):
 
 
 def options_preview_cluster(f):
+    f = option_resolution(f)
     f = option_save(f)
     f = option_hist(f)
     f = option_columns(f)
@@ -243,7 +248,7 @@ def ai_preview():
 def ai_preview_stack(repo: Repo, task: Task, roi_id, recipe_path, slice_range,
                      show_list,
                      # rgb,
-                     band, columns, clip, hist, save, export, ylog):
+                     band, columns, clip, hist, save, export, ylog, resolution):
     """ Preview assembled tensor band
 
         ** use --clip <minl> <max> to apply np.log10(np.clip(.., 10**min, 10**max)) to stack values
@@ -290,7 +295,8 @@ def ai_preview_stack(repo: Repo, task: Task, roi_id, recipe_path, slice_range,
                                  clip=clip,
                                  columns=columns,
                                  hist=hist,
-                                 ylog=ylog
+                                 ylog=ylog,
+                                 resolution=None if hist else resolution
                                  )
             _show_plt(_plt, save=save)
         except AssertionError as e:
@@ -307,7 +313,7 @@ def ai_preview_cluster(repo: Repo, task: Task, roi_id, recipe_path, slice_range,
                        # threshold,
                        zone,
                        hist, ylog,
-                       save, export,
+                       save, export, resolution,
                        rgb=False
                        ):
     """ Preview assembled tensor band
@@ -347,7 +353,8 @@ def ai_preview_cluster(repo: Repo, task: Task, roi_id, recipe_path, slice_range,
                     band=band,
                     slice_region=slice_range,
                     columns=columns,
-                    rgb=rgb
+                    rgb=rgb,
+                    resolution=resolution
                     )
 
 
@@ -410,7 +417,7 @@ def ai_preview_tnsr(repo: Repo, task: Task, roi_id, recipe_path, show_list
                     , zone, slice_range
                     , band,
                     # rgb,
-                    columns, hist, tnorm, save, ylog, export, data_path):
+                    columns, hist, tnorm, save, ylog, export, data_path, resolution):
     """ Preview assembled tensor band
         \b
         * Windows WSL: follow https://www.scivision.dev/pyqtmatplotlib-in-windows-subsystem-for-linux/ instructions
@@ -445,14 +452,24 @@ def ai_preview_tnsr(repo: Repo, task: Task, roi_id, recipe_path, show_list
         band = list(band)
     if tnorm:
         tnorm = filenames.tnorm
+    band_names = df.iloc[band]['name'].tolist()
+    if hist and not export:
+        """ histograms are streamed from stored tensor, tensor is not loaded """
+        stats = tensor_stats(filenames, band, slice_range, tnorm)
+        ymin, xmin, ymax, xmax = slice_range if slice_range[0] != -1 else (0, 0, *e.shape[:2])
+        title = f"TENSOR {ymax - ymin}x{xmax - xmin} {'Normalized' if tnorm else ''}"
+        _show_plt(preview_hist(stats, band_names, columns, hist, title, ylog), save=save)
+        return
+    """ histograms and exported data are always  full resolution """
+    overview = select_overview(filenames.tnsr, e.shape, slice_range, None if (hist or export) else resolution)
     tnsr = read_tensor(band, df,
                        slice_range=slice_range,
                        filenames=filenames,
                        tnorm=tnorm,
                        gauss=None,
-                       split=False
+                       split=False,
+                       overview=overview
                        )
-    band_names = df.iloc[band]['name'].tolist()
     if export:
         georef = filenames.tnsr_hdr[:-4]
         _sqave_envy_tnsr(tnsr, export=export,
@@ -470,7 +487,8 @@ def ai_preview_tnsr(repo: Repo, task: Task, roi_id, recipe_path, show_list
                             slice_range=slice_range,
                             columns=columns,
                             title="Normalized" if tnorm else "",
-                            ylog=ylog
+                            ylog=ylog,
+                            overview=overview
                             )
         _show_plt(_plt, save=save)
 
@@ -485,7 +503,7 @@ def ai_preview_tensor_math(repo: Repo, task: Task, roi_id, recipe_path, slice_ra
                            band1, band2, band3,
                            vis_mode, data_path,
                            save, tnorm,
-                           zone, gauss, hist, ylog, export):
+                           zone, gauss, hist, ylog, export, resolution):
     """ Bands math for tansor
 
     {}
@@ -512,6 +530,7 @@ def ai_preview_tensor_math(repo: Repo, task: Task, roi_id, recipe_path, slice_ra
                                              gauss=gauss,
                                              vis_mode=vis_mode,
                                              slice_range=slice_range,
+                                             resolution=None if (hist or export) else resolution
                                              )
         if export:
             georef = filenames.tnsr_hdr[:-4]
@@ -1,12 +1,15 @@
 import logging
+import os
 
 import click
 
 from ocli.ai.COS.s3_boto import COS
 from ocli.ai.Envi import Envi
 from ocli.ai.assemble import Assemble
+from ocli.ai.multizone import MultiZone, MERGE_MARGIN
 from ocli.ai.process import Process
 from ocli.ai.recipe import Recipe
+from ocli.ai.visualize.visualize_cluster import Visualize
 from ocli.cli import output, pfac
 from ocli.cli.ai_options import option_locate_recipe, argument_zone, fast_option, resolve_recipe
 from ocli.cli.state import Repo, Task, pass_task, \
@@ -99,3 +102,89 @@ def ai_predict(repo: Repo, task: Task, roi_id, recipe_path, zone, pred_type):
         Process(zone, pred_type, recipe).run(callback=callback)
     pass
 
+
+
+# ############################### MULTI-ZONE ########################################
+
+@cli_ai_snap.command('multizone')
+@click.option('-r', '--roi', 'roi_ids', multiple=True, help='ROI name or ID, multiple allowed')
+@click.option('--recipe', 'recipe_paths', multiple=True,
+              type=click.Path(exists=True, file_okay=True, dir_okay=False, readable=True),
+              help='recipe file, multiple allowed')
+@click.option('--margin', type=click.INT, default=MERGE_MARGIN, show_default=True,
+              help='merge zones closer than margin (pixels) into one tile')
+@click.option('--visualize/--no-visualize', 'visualize', default=True, show_default=True,
+              help='make pred8c ENVI images for every ROI')
+@pass_task
+@pass_repo
+def ai_multizone(repo: Repo, task: Task, roi_ids, recipe_paths, margin, visualize):
+    """ assemble and predict zones of several ROIs on the same stack in one pass
+
+    overlapping zones are merged into tiles, each tile is assembled and predicted once,
+    ROI zone results are cut from tile results. Recipes should share stack, channels and predictor.
+    """
+    recipes = [Recipe(p) for p in recipe_paths] + [Recipe(resolve_recipe(repo, task, r)) for r in roi_ids]
+    if not recipes:
+        raise click.UsageError('At least one --roi or --recipe is required')
+    try:
+        cos = COS(recipes[0])
+    except SystemExit:
+        log.warning("Could not use COS")
+        output.warning("Could not use COS")
+        cos = None
+    envi = Envi(recipes[0], cos)
+    try:
+        mz = MultiZone(recipes, envi, margin=margin)
+        output.comment(f"{len(recipes)} zones, {len(mz.tiles)} tiles, pixels saved {mz.saved_ratio:.0%}")
+        with pfac(log, total=100, desc='Processing') as (_, callback):
+            mz.run(progress=callback)
+        if visualize:
+            for r in recipes:
+                Visualize('zone', r, envi).run()
+    except (AssertionError, RuntimeError) as e:
+        raise click.UsageError(f'{e}')
+
+
+# ############################### TIME-SERIES ########################################
+
+@cli_ai_snap.command('timeseries')
+@option_locate_recipe
+@argument_zone
+@click.argument('date', required=True)
+@click.option('--cube', 'cube_path', default=None,
+              help='time-series cube directory, default is "timeseries" key of recipe or OUTDIR/timeseries')
+@click.option('--window', type=click.INT, default=None,
+              help='create cube keeping statistics of last WINDOW dates only')
+@pass_task
+@pass_repo
+def ai_timeseries(repo: Repo, task: Task, roi_id, recipe_path, zone, date, cube_path, window):
+    """ append sigma_avg/coh_avg channels of recipe stack as DATE to time-series cube
+
+    cube is created on first append. Set "timeseries" recipe key to cube directory
+    so 'assemble' takes sigma_avg/coh_avg means from the cube instead of re-reading all stack dates
+    """
+    from ocli.ai.timeseries import TimeSeriesCube, append_recipe
+    _recipe = recipe_path if recipe_path else resolve_recipe(repo, task, roi_id)
+    recipe = Recipe(_recipe)
+    cube_path = cube_path if cube_path else recipe.get('timeseries', os.path.join(recipe['OUTDIR'], 'timeseries'))
+    envi = Envi(recipe, None)
+    try:
+        if os.path.isfile(os.path.join(cube_path, 'meta.json')):
+            cube = TimeSeriesCube(cube_path)
+        else:
+            if zone == 'zone':
+                if recipe.get('zone') is None:
+                    raise AssertionError('No zone info in recipe')
+                z = recipe['zone']
+                shape = (z[1][0] - z[0][0], z[1][1] - z[0][1])
+            else:
+                shape, _ = envi.read_header(recipe['channels']['sigma_avg'][0] + '.hdr')
+            channels = [c for c, k in (('sigma', 'sigma_avg'), ('coh', 'coh_avg')) if recipe['channels'].get(k)]
+            cube = TimeSeriesCube.create(cube_path, shape, channels=channels, window=window,
+                                         zone=recipe.get('zone') if zone == 'zone' else None)
+        append_recipe(cube, date, recipe, envi, mode=zone)
+    except (AssertionError, KeyError) as e:
+        raise click.UsageError(f'{e}')
+    output.comment(f"{cube.count} dates in time-series cube {cube_path}")
+    if recipe.get('timeseries') != cube_path:
+        output.comment(f'add "timeseries": "{cube_path}" to recipe to assemble averages from cube')
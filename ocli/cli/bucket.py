@@ -13,9 +13,8 @@ from ocli.cli.pruduct_s1 import pairs_load, _cache_pairs_file_name, products_lis
 from ocli.cli.roi import option_roi, resolve_roi
 from ocli.cli.state import Task, Repo, option_locate_task, option_less, pass_task, pass_repo
 from ocli.project import _local_eodata_relative_path
-from ocli.project import bucket
 from ocli.project.bucket import unitime_delta_factory
-from ocli.sent1 import pairs
+from ocli.project.bucket_index import load_bucket_index
 
 log = logging.getLogger()
 
@@ -36,13 +35,10 @@ def _task_ms(task: Task) -> (str, str):
 
 def _bkt_list(repo: Repo, master: str, slave: str, geometry: Polygon, fit: int) -> (GeoDataFrame, list):
     """ list avaliable buckets"""
-    _df = pairs.load_from_cache(cache_file_name=(_cache_pairs_file_name(repo)))
     try:
         if geometry.area == 0:
             raise AssertionError('ROI has zero area')
-        _df['fit'] = _df['geometry'].intersection(geometry).area / geometry.area
-
-        _bk = bucket.create_list(_df, buckets_dir='')  # type: GeoDataFrame
+        _bk = load_bucket_index(_cache_pairs_file_name(repo), geometry=geometry)  # type: GeoDataFrame
         if _bk is None or _bk.empty:
             raise AssertionError(f'No products found ')
 
@@ -89,9 +85,7 @@ def _bkt_info(repo: Repo, task: Task, geometry: Polygon,
     cache_file_name = _cache_pairs_file_name(repo)
     # TODO check ROI exists
 
-    _df = pairs.load_from_cache(cache_file_name=cache_file_name, geometry=geometry)
-
-    _bk = bucket.create_list(_df, buckets_dir='')
+    _bk = load_bucket_index(cache_file_name)
 
     if _bk is None or _bk.empty:
         raise AssertionError(f'No products could be found for ROI ')
@@ -237,7 +231,11 @@ def bkt_info(repo: Repo, task: Task, roi_id, less,
     geometry = _roi['geometry']
     output.comment(f"active task master: {_m}")
 
-    _df = pairs.load_from_cache(cache_file_name=(_cache_pairs_file_name(repo)))
+    if geometry.area == 0:
+        raise OCLIException('ROI has zero area')
+    _df = load_bucket_index(_cache_pairs_file_name(repo), geometry=geometry)
+    if _df is None:
+        raise OCLIException('No products found')
     _df = _df.set_index('productId')
     try:
         _ds = _df.loc[product_id][['startDate', 'platform']]
@@ -263,9 +261,6 @@ def bkt_info(repo: Repo, task: Task, roi_id, less,
 
     cols = ['productId', 'cycle_dt', 'startDate', 'platform', 'relativeOrbitNumber', 'polarisation', 'fit', 'task']
     try:
-        if geometry.area == 0:
-            raise AssertionError('ROI has zero area')
-        _df['fit'] = _df['geometry'].intersection(geometry).area / geometry.area
         _df['task'] = ''
         _df = _df.reset_index()
         _df = _df.set_index('title')
@@ -25,21 +25,24 @@ init_log(os.environ.get('TSAR_VERBOSE', 'WARNING'))  # to catch import errors et
 # del os.environ['PROJ_LIB']
 
 import click
-from prompt_toolkit.key_binding.bindings.auto_suggest import load_auto_suggest_bindings
-from prompt_toolkit.shortcuts import CompleteStyle
-
-from click_repl import repl
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from prompt_toolkit.history import FileHistory
 
 from ocli.cli.output import warning
-from ocli.cli import roi, bucket, task, AliasedGroup, ai, output
-from ocli.cli import pruduct_s1, workspace
+from ocli.cli import LazyGroup, output
+from ocli.cli import workspace
 from ocli.cli import CONTEXT_SETTINGS
 from ocli.cli.state import pass_repo, Repo
 
+""" command groups are imported on first use: name -> (module, group, short help) """
+LAZY_GROUPS = {
+    'product': ('ocli.cli.pruduct_s1', 'pairs_cli', 'Satellite products commands'),
+    'bucket': ('ocli.cli.bucket', 'bucket_cli', ''),
+    'roi': ('ocli.cli.roi', 'roi_cli', 'region of interest (ROI) commands'),
+    'task': ('ocli.cli.task', 'cli_task', 'Task manipulation'),
+    'ai': ('ocli.cli.ai', 'cli_ai', ''),
+}
+
 
-@click.group(context_settings=CONTEXT_SETTINGS, cls=AliasedGroup)
+@click.group(context_settings=CONTEXT_SETTINGS, cls=LazyGroup, lazy_commands=LAZY_GROUPS)
 @click.option('--verbose', '-v', type=click.Choice(['DEBUG', 'WARNING', 'INFO', 'ERROR', 'FATAL']), default='ERROR',
               help="Verbose level")
 @click.option('--config', nargs=1, multiple=True, metavar='KEY VALUE', help='Overrides a config key/value pair.')
@@ -80,24 +83,31 @@ def prompt_message_callback(repo):
 
 text_type = str
 
-kb = load_auto_suggest_bindings()
-try:
-    _b = kb.get_bindings_for_keys(('escape', 'f'))[0]
-    kb.add('c-right')(_b)
-    _e = kb.get_bindings_for_keys(('right',))[0]
-    kb.add('end')(_e)
-except IndexError:
-    warning('Internal: could not redeclare key bindings')
-except StopIteration:
-    pass
-
-prompt_kwargs = {
-    'complete_style': CompleteStyle.READLINE_LIKE,
-    'complete_while_typing': False,
-    'key_bindings': kb,
-    'history': FileHistory(os.path.join(os.getenv('HOME', '~'), '.ocli-history')),
-    'auto_suggest': AutoSuggestFromHistory(),
-}
+
+def repl_prompt_kwargs() -> dict:
+    """ prompt_toolkit is needed only for interactive console """
+    from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+    from prompt_toolkit.history import FileHistory
+    from prompt_toolkit.key_binding.bindings.auto_suggest import load_auto_suggest_bindings
+    from prompt_toolkit.shortcuts import CompleteStyle
+    kb = load_auto_suggest_bindings()
+    try:
+        _b = kb.get_bindings_for_keys(('escape', 'f'))[0]
+        kb.add('c-right')(_b)
+        _e = kb.get_bindings_for_keys(('right',))[0]
+        kb.add('end')(_e)
+    except IndexError:
+        warning('Internal: could not redeclare key bindings')
+    except StopIteration:
+        pass
+
+    return {
+        'complete_style': CompleteStyle.READLINE_LIKE,
+        'complete_while_typing': False,
+        'key_bindings': kb,
+        'history': FileHistory(os.path.join(os.getenv('HOME', '~'), '.ocli-history')),
+        'auto_suggest': AutoSuggestFromHistory(),
+    }
 
 
 def bottom_toolbar():
@@ -129,7 +139,9 @@ def repl_exit():
 @click.pass_context
 def ocli_repl(ctx, repo: Repo, fullscreen):
     """ start interactive console"""
+    from click_repl import repl
     repo.is_repl = True
+    prompt_kwargs = repl_prompt_kwargs()
     output.comment("""        
         use  ? command to OCLI help
         use :? command to show console help
@@ -151,13 +163,8 @@ def loop():
     cli.add_command(workspace.wp_activate)
     cli.add_command(workspace.wp_deactivate)
     cli.add_command(workspace.wp_info)
-    # mount group actions
+    # mount group actions, other groups are LAZY_GROUPS
     cli.add_command(workspace.cli)
-    cli.add_command(pruduct_s1.pairs_cli)
-    cli.add_command(bucket.bucket_cli)
-    cli.add_command(roi.roi_cli)
-    cli.add_command(task.cli_task)
-    cli.add_command(ai.cli_ai)
     try:
         from ocli.pro import cli as pro_cli
         pro_cli.mount_commands(cli)
@@ -7,7 +7,6 @@ from typing import List, Union
 
 import click
 import lxml
-from dateutil.parser import parse
 from geopandas import GeoDataFrame
 from geopandas.geoseries import Series
 from lxml import etree
@@ -19,18 +18,25 @@ from ocli.cli import output
 from ocli.cli.output import OCLIException
 from ocli.cli.roi import option_roi, resolve_roi
 from ocli.cli.state import pass_repo, Repo, option_less, option_limit, Task
-from ocli.project import bucket
-from ocli.sent1 import pairs, get_bucket, s1_prod_id
-from ocli.sent1.metadata_extractor import SentinelMetadataExtractor
+from ocli.project.bucket_index import load_bucket_index
+from ocli.sent1 import pairs
+from ocli.sent1.catalog import LocalCatalog
 
 log = logging.getLogger(__name__)
 
 
 def _cache_pairs_file_name(repo: Union[Repo,Task]):
     if isinstance(repo,Repo):
-        return os.path.join(repo.projects_home, repo.active_project, '.cache', 'sat_data', 'sar.shp')
+        return os.path.join(repo.projects_home, repo.active_project, '.cache', 'sat_data', 'sar.parquet')
     if isinstance(repo,Task):
-        return os.path.join(repo.projects_home, repo.project, '.cache', 'sat_data', 'sar.shp')
+        return os.path.join(repo.projects_home, repo.project, '.cache', 'sat_data', 'sar.parquet')
+
+
+def _cache_local_catalog_file_name(repo: Union[Repo, Task]):
+    """ project cache, user cache (~/.cache/ocli) if there is no active project """
+    if isinstance(repo, Repo) and not repo.active_project:
+        return os.path.join(os.path.expanduser('~'), '.cache', 'ocli', 'local.sqlite')
+    return os.path.join(os.path.dirname(_cache_pairs_file_name(repo)), 'local.sqlite')
 
 
 def get_xml_tree(manifest: bytes) -> Element:
@@ -41,54 +47,14 @@ def get_xml_tree(manifest: bytes) -> Element:
         raise AssertionError(f"{e}")
 
 
-def _list_local(path, limit) -> List:
-    extractor = SentinelMetadataExtractor()
-    _ds = []
-    i = 0
-    for path, subdirs, files in os.walk(path):
-        if 0 <= limit <= i:
-            break
-        if path.endswith('.SAFE'):
-            for name in files:
-                if name != 'manifest.safe':
-                    continue
-
-                if 0 <= limit <= i:
-                    break
-
-                try:
-                    with open(os.path.join(path, name), "rb") as _f:
-                        manifest = _f.read()
-                except FileNotFoundError as e:
-                    log.debug(f"Skipped {name}: {e}")
-                    continue
-                i += 1
-                extractor.root = get_xml_tree(manifest)
-                prodname = os.path.basename(path)
-                extractor.extractMetadataFromManifestFiles(prodname)
-                parsed = extractor.productMetadata
-                # pprint(parsed)
-                bn = get_bucket(
-                    buckets_dir='',
-                    # firstBurstIndex=firstBurstIndex,
-                    # lastBurstIndex=lastBurstIndex,
-                    mission=parsed['ProductClass'] + '1' + parsed['FamilyNameNumber'],
-                    sensorMode=parsed['InstrumentMode'],
-                    productType=parsed['ProductType'],
-                    relativeOrbitNumber=parsed['relativeOrbitNumber'],
-                    startDate=parse(parsed['StartTime']),
-                )
-                _ds.append(dict(
-                    productId=s1_prod_id(prodname),
-                    platform=parsed['ProductClass'] + '1' + parsed['FamilyNameNumber'],
-                    sensorMode=parsed['InstrumentMode'],
-                    relativeOrbitNumber=parsed['relativeOrbitNumber'],
-                    productType=parsed['ProductType'],
-                    startDate=parsed['StartTime'],
-                    backetname=bn,
-                    productname=prodname,
-                ))
-    return _ds
+def _list_local(repo: Repo, path, limit, **query) -> List:
+    """ list local SAFE products via  persistent catalogue, catalogue is synchronised with path first
+
+    :param query: LocalCatalog.query() filters
+    """
+    with LocalCatalog(_cache_local_catalog_file_name(repo)) as catalog:
+        catalog.update(path)
+        return catalog.query(root=path, limit=limit, **query)
 
 
 @click.group('product', cls=AliasedGroup)
@@ -105,8 +71,12 @@ def pairs_cli(repo, satellite):
 @click.option('-c', '--completion-date', help="MAX product's date", required=False, default=None)
 @click.option('--quiet', '-q', 'quiet', is_flag=True, required=False, default=False, help='do not show progress')
 @click.option('--update', '-u', 'reload', is_flag=True, required=False, default=False, help=' force load ')
+@click.option('--incremental', '-i', 'incremental', is_flag=True, required=False, default=False,
+              help='with --update load only products updated after newest cached one')
+@click.option('--workers', 'workers', type=click.IntRange(1, 16), default=pairs.FINDER_WORKERS, show_default=True,
+              help='concurrent finder requests')
 @pass_repo
-def pairs_load(repo: Repo, roi_id, reload, quiet, completion_date):
+def pairs_load(repo: Repo, roi_id, reload, quiet, completion_date, incremental=False, workers=pairs.FINDER_WORKERS):
     """ load data into DB """
     # todo convert name to ID
     if completion_date:
@@ -137,12 +107,14 @@ def pairs_load(repo: Repo, roi_id, reload, quiet, completion_date):
                             callback=None,
                             finder_conf=finder_conf,
                             cache_file_name=cache_file_name,
+                            incremental=incremental,
+                            workers=workers,
                             )
     else:
         with click.progressbar(length=100,
                                label='Loading sat products') as bar:
             def callback(total, step):
-                if bar.length != total:
+                if total and bar.length != total:
                     bar.length = total
                 bar.update(step)
 
@@ -150,7 +122,9 @@ def pairs_load(repo: Repo, roi_id, reload, quiet, completion_date):
                                 reload=reload,
                                 callback=callback,
                                 finder_conf=finder_conf,
-                                cache_file_name=cache_file_name
+                                cache_file_name=cache_file_name,
+                                incremental=incremental,
+                                workers=workers,
                                 )
     if d.empty:
         raise OCLIException('0 products loaded, product list is not updated!')
@@ -236,23 +210,24 @@ def pairs_list(repo: Repo, less, sort, limit, column, where, list_columns, roi_i
     cache_file_name = _cache_pairs_file_name(repo)
     log.debug(f'loading sta data from cache "{cache_file_name}"  ')
     try:
-        _df = pairs.load_from_cache(cache_file_name=cache_file_name)
         if list_columns:
+            _df = pairs.load_from_cache(cache_file_name=cache_file_name)
             k = _df.columns.tolist()
             output.table([[v] for v in k], headers=['available columns'])
         else:
-            _df = bucket.create_list(_df, buckets_dir='')
+            """ buckets and ROI fit are cached in bucket index until pairs cache is changed """
+            _df = load_bucket_index(cache_file_name, geometry=geometry)
+            if _df is None:
+                raise OCLIException('No products found')
             _f = list(column)
             _ds = _list_products(_df,
                                  where=where, sort=list(sort), limit=limit
                                  )
-            _ds['fit'] = _ds['geometry'].intersection(geometry).area / geometry.area
             _f.extend(['fit'])
             _ds = _ds[_f]
             if local_only:
-                _locals = [x['productId'] for x in _list_local(local_only, limit)]
-                mask = _ds['productId'].apply(lambda x: x in _locals)
-                _ds = _ds[mask]
+                _locals = {x['productId'] for x in _list_local(repo, local_only, -1)}
+                _ds = _ds[_ds['productId'].isin(_locals)]
             output.table(_ds, headers=['#', *_f], less=less)
             return _ds
     except ValueError as e:
@@ -269,13 +244,35 @@ def pairs_list(repo: Repo, less, sort, limit, column, where, list_columns, roi_i
 
 @pairs_cli.command('ls')
 @click.argument('path', type=click.Path())
+@click.option('--platform', type=click.Choice(['S1A', 'S1B']), default=None, help='filter by platform')
+@click.option('--orbit', 'relative_orbit', type=click.INT, default=None, help='filter by relative orbit number')
+@click.option('--swath', type=click.Choice(['IW1', 'IW2', 'IW3']), default=None, help='filter by swath')
+@click.option('--start', default=None, help='products started at or after date')
+@click.option('--end', default=None, help='products started before date')
+@option_roi
 @option_limit
 @option_less
 @pass_repo
-def pairs_list(repo: Repo, less, path, limit):
-    """ list directory with SAFE files and its  sub-directories and output products and bucket"""
+def pairs_list(repo: Repo, less, path, limit, platform, relative_orbit, swath, start, end, roi_id):
+    """ list directory with SAFE files and its  sub-directories and output products and bucket
+
+    local products are kept in catalogue (project cache or ~/.cache/ocli without active project),
+    only new or changed products are parsed
+    """
+    query = dict(platform=platform, relative_orbit=relative_orbit, swath=swath)
+    for k, v in (('start', start), ('end', end)):
+        if v:
+            """ manifest times are UTC without time zone """
+            query[k] = parse_to_utc_string(v)
+            if query[k] is None:
+                raise click.BadOptionUsage(k, f"Date {v} is invalid")
+            query[k] = query[k][:19]
+    if roi_id:
+        """ only explicit ROI, footprint filter is not applied for active one """
+        query['geometry'] = resolve_roi(roi_id, repo)[1]['geometry']
     try:
-        _ds = _list_local(path, limit)
+        _ds = _list_local(repo, path, limit, **query)
+        _ds = [{k: v for k, v in x.items() if k != 'path'} for x in _ds]
 
         output.table(_ds, less=less, headers='keys')
     except ValueError as e:
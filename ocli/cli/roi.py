@@ -6,7 +6,6 @@ from ocli.cli import AliasedGroup
 from ocli.cli import output
 from ocli.cli.output import warning
 from ocli.cli.state import option_repo_name, pass_repo, Repo, yes_or_confirm, option_yes, option_less
-from ocli.project.roi import get_roi
 
 log = logging.getLogger()
 
@@ -136,6 +135,7 @@ def roi_rename(repo, id, old_name, yes, new_name):
 @pass_repo
 def roi_add(repo: Repo, name, file, yes):
     """ add ROI to project database """
+    from ocli.project.roi import get_roi
     try:
         # log.debug(file.name)
         _r = get_roi(file.name)
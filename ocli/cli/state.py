@@ -5,6 +5,7 @@ import os
 import re
 import time
 import uuid
+from copy import deepcopy
 from datetime import datetime
 from functools import wraps
 from importlib import import_module
@@ -13,17 +14,12 @@ from shutil import copyfile
 from typing import List, Tuple, Dict
 
 import click
-import geopandas as gpd
-import jsonsempai
 import yaml
-from geopandas import GeoDataFrame
 
 from ocli.aikp import get_tsar_defaults
 from ocli.cli import get_main_rc_name, RC_FILE_NAME, default_main_config, default_project_config
 from ocli.cli.output import OCLIException
-from ocli.project import roi, _local_eodata_relative_path, slugify
-from ocli.sent1 import geoloc
-from ocli.sent1 import s1_prod_id, parse_title
+from ocli.project import _local_eodata_relative_path, slugify
 from ocli.util.date_parse import parse_to_utc_string
 from ocli.util.nested_set import nested_set
 
@@ -127,12 +123,13 @@ class Roi(object):
             if not self.path:
                 log.warning('Could not use ROI on not activated projects')
             # invalidate cache
+            from ocli.project import roi
             self._db = roi.get_db(self.path)
             if self._db is None:
                 log.error("Could not load ROI Database")
 
     @property
-    def db(self) -> GeoDataFrame:
+    def db(self) -> 'GeoDataFrame':
         self._get_db()
         return self._db
 
@@ -175,6 +172,7 @@ class Roi(object):
         elif _empty:
             log.warning('Could not save empty database')
         else:
+            from ocli.project import roi
             roi.save_db(self._db)
 
     def clear(self):
@@ -182,6 +180,7 @@ class Roi(object):
         if _nok:
             log.warning('Database is not opened')
         else:
+            from ocli.project import roi
             roi.delete_db(self._db)
 
 
@@ -680,9 +679,10 @@ class Task(object):
 
     @ensure_task_loaded
     def get_validation_data_frame(self) -> 'gpd.pd.DataFrame':
+        from pandas import DataFrame
         _cur = self.config
         headers = ['key', 'error', 'value']
-        _l = gpd.pd.DataFrame([[k, self.validate(k), _cur[k]] for k in _cur], columns=headers)
+        _l = DataFrame([[k, self.validate(k), _cur[k]] for k in _cur], columns=headers)
         _l.set_index('key', inplace=True)
         return _l
 
@@ -695,12 +695,36 @@ class Task(object):
             e = self.validate(k)
             if e:
                 raise RuntimeError(f"key '{k}' is invalid: {','.join(e)} ")
+        from ocli.sent1 import geoloc
         _df = geoloc.swath_table(
             _local_eodata_relative_path(self.config['eodata'], self.config[key + '_path']),
-            geometry
+            geometry,
+            cache_dir=self.get_geoloc_cache_path()
         )
         return _df
 
+    @ensure_task_loaded
+    def get_rois_fit_data_frame(self, rois: 'gpd.GeoSeries', key='master') -> 'gpd.pd.DataFrame':
+        """ burst/ROI intersection for many ROIs at once, see geoloc.swath_fit """
+        if key not in ['master', 'slave']:
+            raise AssertionError("key: only 'master' or 'salve are supported'")
+        for k in ['eodata', key + '_path']:
+            e = self.validate(k)
+            if e:
+                raise RuntimeError(f"key '{k}' is invalid: {','.join(e)} ")
+        from ocli.sent1 import geoloc
+        return geoloc.swath_fit(
+            _local_eodata_relative_path(self.config['eodata'], self.config[key + '_path']),
+            rois,
+            cache_dir=self.get_geoloc_cache_path()
+        )
+
+    def get_geoloc_cache_path(self):
+        """ directory for products burst geometry index """
+        if not self.projects_home or not self.project:
+            return None
+        return os.path.join(self.projects_home, self.project, '.cache', 'geoloc')
+
     @ensure_task_loaded
     def get_stack_path(self, full=False):
         """ return name of directory to save Stack results
@@ -750,6 +774,7 @@ class Task(object):
 
     @ensure_task_loaded
     def _compose_friendly_keys(self, roi_name):
+        from ocli.sent1 import s1_prod_id, parse_title
         e, master = self.get_valid_key('master')
         prod_fields = {'m_' + k: v for (k, v) in parse_title(master).items()}
         prod_fields = {**prod_fields, **{'m_' + k: v for (k, v) in parse_title(master).items()}}
@@ -818,7 +843,8 @@ class TaskTemplate:
     def update_recipe(self, task: Task, recipe: Dict) -> List:
         return []
 
-    def validate_schema(self, schema: Dict, recipe: Dict) -> List:
+    def validate_schema(self, schema: Tuple[str, ...], recipe: Dict) -> List:
+        """ :param schema: names of schemas to merge template schema to, see ocli.ai.schema """
         return []
 
     def validate_task(self, task: Task, key: str) -> (bool, List):
@@ -874,6 +900,8 @@ class TaskRecipe(object):
 
         self._task = task
         self.kind = task.config.get('kind')
+        """ own copy, class level template is shared between REPL runs and bulk generation """
+        self.recipe = deepcopy(RECIPE_HEAD_TPL)
         # if self.kind not in RECIPE_TPL:
         #     raise AssertionError(f'Task kind "{self.kind}" not supported')
         #
@@ -886,10 +914,16 @@ class TaskRecipe(object):
         # else:
         #     self.files = []
 
-    def generate_recipe(self, roi):
+    def generate_recipe(self, roi, task_errors: List[str] = None):
+        """
+        :param roi: ROI record
+        :param task_errors: result of task.validate_all() if task is already validated (bulk generation)
+        """
         errors = []
         task = self._task
-        errors += task.validate_all(ignore=['ai_results', 'stack_path'])
+        if task_errors is None:
+            task_errors = task.validate_all(ignore=['ai_results', 'stack_path'])
+        errors += task_errors
         try:
             _defs = get_tsar_defaults(task, 'recipe')
             deep_update(self.recipe, _defs)
@@ -989,13 +1023,11 @@ class TaskRecipe(object):
         for ex. enable uri checks:  sudo -H pip3 install   rfc3987
         :return: list of errors (empty for valid recipe)
         """
+        from ocli.ai.schema import SCHEMA_HEAD
         errors = []
         try:
-
-            with jsonsempai.imports():
-                from ocli.ai import recipe_head_schema
             task = self._task
-            schema = recipe_head_schema.properties.envelope
+            schema = (SCHEMA_HEAD,)
             template = task.config.get('template')
 
             _res = True
@@ -1011,7 +1043,7 @@ class TaskRecipe(object):
 
         except Exception as e:
             # log.exception(e)
-            errors.append('Could not perform validation: {e}')
+            errors.append(f'Could not perform validation: {e}')
 
         return errors
 
@@ -11,28 +11,19 @@ from functools import wraps
 from importlib import import_module
 from pathlib import Path
 from pprint import pprint
-
-import dpath.util
-
-from dpath.exceptions import PathNotFound
 from time import perf_counter
 from typing import List
 
 import click
-import geopandas as gpd
 
-from ocli.ai.Envi import zoneByRoi
 from ocli.cli import AliasedGroup, colorful_json
 from ocli.cli import output
 from ocli.cli.output import OCLIException
-from ocli.cli.pruduct_s1 import _cache_pairs_file_name
 from ocli.cli.roi import resolve_roi, option_roi
 from ocli.cli.state import option_yes, yes_or_confirm, pass_repo, Repo, option_repo_name, pass_task, Task, \
     option_locate_task, TaskRecipe, option_less, MutuallyExclusiveOption, TaskTemplate, TASK_HEAD
 from ocli.cli.validator import is_path_exists_or_creatable
 from ocli.project import _local_eodata_relative_path
-from ocli.project.stack import task_stack_snap
-from ocli.sent1 import pairs, s1_prod_id, parse_title
 
 log = logging.getLogger()
 
@@ -364,7 +355,10 @@ def task_preview(repo: Repo, task: Task, roi_id, swath, basemap,
 
     _id, _roi = resolve_roi(roi_id, repo)
     try:
+        import geopandas as gpd
+        from ocli.cli.pruduct_s1 import _cache_pairs_file_name
         from ocli.preview import preview_roi_swath, preview_roi
+        from ocli.sent1 import pairs
         if not swath:
             # show by product lists
             cache_file_name = _cache_pairs_file_name(repo)
@@ -433,6 +427,8 @@ def task_preview(repo: Repo, task: Task, roi_id, swath, basemap,
 @cli_task.command('show')
 @option_locate_task
 @click.option('--swath', is_flag=True, default=False, help='show ROI fit by swath/burst')
+@click.option('--all-rois', 'all_rois', is_flag=True, default=False,
+              help='with --swath show fit by swath for all project ROIs')
 @click.option('--recipe', is_flag=True, default=False, help='show ROI AI recipe file')
 @click.option('-k', '--key', 'recipe_key', required=False, type=click.STRING, help='show recipe key, dot delimited')
 @click.option('--no-color', 'no_color', is_flag=True, default=False, help='Disable terminal colors')
@@ -443,7 +439,7 @@ def task_preview(repo: Repo, task: Task, roi_id, swath, basemap,
 @pass_task
 @pass_repo
 @ensure_task_resolved
-def task_info(repo: Repo, task: Task, swath, roi_id,
+def task_info(repo: Repo, task: Task, swath, roi_id, all_rois,
               no_color,
               recipe,
               less, edit,
@@ -452,7 +448,7 @@ def task_info(repo: Repo, task: Task, swath, roi_id,
 
     \b
     --preview requires master and slave to be  in product list
-    --swath option requires master and slave metadata to be loaded
+    --swath option requires master and slave metadata to be loaded, --all-rois shows fit of every project ROI
     """
 
     # TODO -q option to return just valididty status
@@ -478,6 +474,8 @@ def task_info(repo: Repo, task: Task, swath, roi_id,
         except (AssertionError, FileNotFoundError) as e:
             raise OCLIException(f'"Could not resolve recipe file for roi "{_roi["name"]}" file: {e}"')
     elif recipe_key:
+        import dpath.util
+        import dpath.exceptions
         try:
             _id, _roi = resolve_roi(roi_id, repo)
             r = TaskRecipe(task=task)
@@ -487,9 +485,30 @@ def task_info(repo: Repo, task: Task, swath, roi_id,
             _part = dpath.util.get(j, recipe_key, separator='.')
             output.comment(f'key "{recipe_key}" in {fname}:')
             pprint(_part)
-        except (AssertionError, FileNotFoundError, KeyError, PathNotFound, IndexError) as e:
+        except (AssertionError, FileNotFoundError, KeyError, dpath.exceptions.PathNotFound, IndexError) as e:
             raise click.UsageError(f"could not get path in recipe json: {e}")
+    elif swath and all_rois:
+        import geopandas as gpd
+        db = repo.roi.db
+        rois = gpd.GeoSeries(db.geometry.values, index=range(len(db)), crs=db.crs)
+        try:
+            for key in ['master', 'slave']:
+                if key == 'slave' and task.config.get('slave') is None:
+                    break
+                _df = task.get_rois_fit_data_frame(rois, key=key)
+                fit = _df.pivot_table(index='roi', columns='swath', values='fit', aggfunc='sum')
+                fit = fit.reindex(index=rois.index, columns=['IW1', 'IW2', 'IW3']).fillna(0)
+                fit.insert(0, 'name', db['name'].values)
+                output.comment(f"{key.upper()}: total ROI coverage by Swath\n\n")
+                output.table(fit, headers=['#', 'ROI', 'IW1', 'IW2', 'IW3'])
+                output.comment("\n\n")
+        except RuntimeError as e:
+            raise click.BadArgumentUsage(str(e))
+        except Exception as e:
+            log.exception(e)
+            raise click.UsageError(str(e))
     elif swath:
+        import geopandas as gpd
         _id, _roi = resolve_roi(roi_id, repo)
         try:
             df_master = task.get_geometry_fit_data_frame(_roi.geometry, key='master')
@@ -542,6 +561,7 @@ def task_info(repo: Repo, task: Task, swath, roi_id,
             output.error(f"ai_results  {e}")
         if task.kind == 'cluster':
             if not task.validate_all(['master', 'slave']):
+                from ocli.sent1 import parse_title
                 S1_cycle_T = 24 * 3600 * 12
                 m = parse_title(task.config['master'])['completionDate']
                 s = parse_title(task.config['slave'])['completionDate']
@@ -682,6 +702,7 @@ def task_get(repo: Repo, task: Task, key, raw, roi_id, info):
             elif key == 'stack_results':
                 value = task.get_stack_path(full=True)
             elif key in ['master', 'slave']:
+                from ocli.sent1 import s1_prod_id
                 value = s1_prod_id(task.config[key])
             elif key in ['master_path', 'slave_path']:
                 value = _local_eodata_relative_path(task.config['eodata'], task.config[key])
@@ -741,6 +762,78 @@ def task_list(repo: Repo):
         output.table(_l, headers=['#', '', 'name', 'path'], showindex="always")
 
 
+# ######################### STATS ############################################
+def _task_metrics(task: Task) -> List[dict]:
+    """ metrics records of task: stack (task directory) and AI steps (ai results directory) """
+    from ocli.util.metrics import read_metrics
+    res = read_metrics(task.path)
+    try:
+        _ai = task.get_ai_results_path(full=True)
+    except (AssertionError, RuntimeError):
+        _ai = None
+    if _ai and os.path.isdir(_ai):
+        res += read_metrics(_ai)
+    for r in res:
+        r['task'] = task.name
+    return res
+
+
+@cli_task.command('stats')
+@option_repo_name
+@click.option('-t', '--task', 'task_masks', multiple=True,
+              help='task name or shell-like mask, multiple allowed, all project tasks if omitted')
+@click.option('--by', type=click.Choice(['span', 'step', 'task']), default='span', show_default=True,
+              help='group by step and span, step only or task and step')
+@click.option('--json', 'as_json', is_flag=True, default=False, help='print aggregated records as JSON')
+@pass_repo
+def task_stats(repo: Repo, task_masks, by, as_json):
+    """ aggregate processing metrics of project tasks
+
+    \b
+    metrics are saved by stack and AI steps as JSON lines (metrics.jsonl)
+    in task directory and task AI results directory
+    """
+    from fnmatch import fnmatch
+    from ocli.util.metrics import aggregate, RUN_SPAN
+    _path = repo.get_project_path()
+    if not os.path.isdir(_path):
+        raise click.BadOptionUsage('project', f"Project '{repo.active_project}': Could not find directory '{_path}'")
+    records = []
+    for _, name, _ in Task.get_list(_path):
+        if task_masks and not any(fnmatch(name, m) for m in task_masks):
+            continue
+        task = Task()
+        task.projects_home = repo.projects_home
+        task.project = repo.active_project
+        task.name = name
+        try:
+            task.resolve()
+        except RuntimeError as e:
+            output.warning(f"task {name}: {e}")
+            continue
+        records += _task_metrics(task)
+    if not records:
+        output.comment('No metrics found')
+        return
+    if by == 'span':
+        _r = aggregate(records, by=('step', 'span'))
+    else:
+        _r = aggregate([r for r in records if r.get('span') == RUN_SPAN],
+                       by=('step',) if by == 'step' else ('task', 'step'))
+    if as_json:
+        click.echo(json.dumps(_r, indent=4))
+        return
+    _mb = 1024 * 1024
+    _cols = ['task', 'step', 'span'] if by == 'task' else ['step', 'span'] if by == 'span' else ['step']
+    _cols = [c for c in _cols if c in _r[0]]
+    output.table([[g[c] for c in _cols] +
+                  [g['runs'], g['count'], round(g['wall'], 2), round(g['wall mean'], 2), round(g['wall max'], 2),
+                   round(g['cpu'], 2), round(g['read_bytes'] / _mb, 1), round(g['written_bytes'] / _mb, 1),
+                   round(g['peak_rss'] / _mb, 1)] for g in _r],
+                 headers=_cols + ['runs', 'calls', 'wall s', 'mean s', 'max s', 'cpu s', 'read MB', 'written MB',
+                                  'peak RSS MB'])
+
+
 # ######################### LOAD #############################################
 def rsync_meta(options: List[str], remote_path: str, local_path: str):
     """ Download data with rsync command
@@ -1006,12 +1099,15 @@ def task_run_stack_snap(repo: Repo, task: Task, yes, dry_run, gpt_cache):
         if len(os.listdir(snap_path)) != 0 and not yes_or_confirm(yes,
                                                                   f"Stack directory '{snap_path}' exists. Override?"):
             return
-    task_stack_snap(task,
-                    dry_run=dry_run,
-                    gpt_cache=gpt_cache,
-                    cmd_dir=cmd_dir,
-                    log=click.echo
-                    )
+    from ocli.project.stack import task_stack_snap
+    from ocli.util import metrics
+    with metrics.run('stack', None if dry_run else task.path, processor='snap'):
+        task_stack_snap(task,
+                        dry_run=dry_run,
+                        gpt_cache=gpt_cache,
+                        cmd_dir=cmd_dir,
+                        log=click.echo
+                        )
 
 
 # ############################### STACK SARPY ################################
@@ -1054,6 +1150,7 @@ def task_run_stack_sarpy(repo: Repo, task: Task, yes, dry_run, decimation, no_cl
         output.info(f"Creating  products stack in  {snap_path}")
         os.makedirs(snap_path, exist_ok=True)
         from ocli.sarpy.cli import full_stack, single_stack
+        from ocli.util import metrics
         p0 = perf_counter()
         kw = dict(
             swath=[task.config['swath']],
@@ -1068,19 +1165,20 @@ def task_run_stack_sarpy(repo: Repo, task: Task, yes, dry_run, decimation, no_cl
             decimation_filter=decimation_filter,
         )
 
-        if single:
-            click.get_current_context().invoke(
-                single_stack,
-                master=_local_eodata_relative_path(_eodata, task.config['master_path']),
-                **kw
-            )
-        else:
-            click.get_current_context().invoke(
-                full_stack,
-                master=_local_eodata_relative_path(_eodata, task.config['master_path']),
-                slave=_local_eodata_relative_path(_eodata, task.config['slave_path']),
-                **kw
-            )
+        with metrics.run('stack', None if dry_run else task.path, processor='sarpy', single=single):
+            if single:
+                click.get_current_context().invoke(
+                    single_stack,
+                    master=_local_eodata_relative_path(_eodata, task.config['master_path']),
+                    **kw
+                )
+            else:
+                click.get_current_context().invoke(
+                    full_stack,
+                    master=_local_eodata_relative_path(_eodata, task.config['master_path']),
+                    slave=_local_eodata_relative_path(_eodata, task.config['slave_path']),
+                    **kw
+                )
         p0 = perf_counter() - p0
         conf = task.config
         conf['stack_processor'] = 'sarpy'
@@ -1142,7 +1240,6 @@ def task_recipe(repo: Repo, task: Task, force, override,
     * use --override to override existed task's default recipe file
 
     """
-    # TODO CLEAR RECIPE bofore make (REPL recipe remebers old values for prev run)
     try:
         _id, _roi = resolve_roi(roi_id, repo)
         r = TaskRecipe(task=task)
@@ -1197,6 +1294,7 @@ def task_recipe(repo: Repo, task: Task, force, override,
                     e += ["Stack is empty"]
                     output.warning("Stack is empty")
                 if _env_file:
+                    from ocli.ai.Envi import zoneByRoi
                     zone = zoneByRoi(_env_file, _roi, roi_crs=repo.roi.db.crs)
                 else:
                     raise AssertionError("Could not apply option --zone-by-roi: Stack is incomplete")
@@ -1239,3 +1337,99 @@ def task_recipe(repo: Repo, task: Task, force, override,
         raise OCLIException(f'Task is invalid, reason: {e}')
     except RuntimeError as e:
         raise OCLIException(str(e))
+
+
+def _match_any(value, masks) -> bool:
+    from fnmatch import fnmatch
+    return not masks or any(fnmatch(str(value), m) for m in masks)
+
+
+@task_run.command('recipes')
+@option_repo_name
+@click.option('-t', '--task', 'task_masks', multiple=True,
+              help='task name or shell-like mask, multiple allowed, all project tasks if omitted')
+@click.option('-r', '--roi', 'roi_masks', multiple=True,
+              help='ROI name, ID or shell-like mask, multiple allowed, all ROIs if omitted')
+@click.option('--zone-by-roi', is_flag=True, default=False,
+              help='Define zone by ROI envelope (rectangular bounding box containing all ROI points)')
+@click.option('--override', 'override', is_flag=True, default=False,
+              help='Override default recipe files if exist')
+@click.option('--force', 'force', is_flag=True, default=False,
+              help='save recipes with errors, use to generate AI recipes for learning phase')
+@click.option('--dry-run', is_flag=True, default=False, help='validate recipes, do not save files')
+@pass_repo
+def task_recipes(repo: Repo, task_masks, roi_masks, zone_by_roi, override, force, dry_run):
+    """ Generate default AI recipe files for all ROIs x tasks of project
+
+    \b
+    task is validated, stack is listed and georeferenced once for all ROIs,
+    recipe schema is compiled once for all recipes
+
+    \b
+    ocli task make recipes -t 'S1*' -r 'field-*' --zone-by-roi
+    """
+    from ocli.ai.Envi import zonesByRois
+    from ocli.ai.schema import aggregate
+    _path = repo.get_project_path()
+    if not os.path.isdir(_path):
+        raise click.BadOptionUsage('project', f"Project '{repo.active_project}': Could not find directory '{_path}'")
+    tasks = sorted(t[1] for t in Task.get_list(_path) if _match_any(t[1], task_masks))
+    if not tasks:
+        raise OCLIException('No tasks found')
+    db = repo.roi.db
+    rois = [(_id, db.iloc[_id]) for _id in range(len(db))
+            if _match_any(_id, roi_masks) or _match_any(db.iloc[_id]['name'], roi_masks)]
+    if not rois:
+        raise OCLIException('No ROIs found')
+    res = []
+    reports = {}
+    for name in tasks:
+        task = Task()
+        task.projects_home = repo.projects_home
+        task.project = repo.active_project
+        task.name = name
+        try:
+            task.resolve()
+            task_errors = task.validate_all(ignore=['ai_results', 'stack_path'])
+            zones = {}
+            if zone_by_roi:
+                _env_file = next(Path(task.get_stack_path(full=True)).glob('*.img'), None)
+                if _env_file is None:
+                    raise AssertionError("Could not apply option --zone-by-roi: Stack is incomplete")
+                _z = zonesByRois(str(_env_file.absolute()), [roi for _, roi in rois], roi_crs=db.crs)
+                zones = {_id: z for (_id, _), z in zip(rois, _z)}
+        except (AssertionError, RuntimeError) as e:
+            res.append([name, '', '', 'FAILED', str(e)])
+            continue
+        for _id, roi in rois:
+            try:
+                r = TaskRecipe(task=task)
+                e = r.generate_recipe(roi=roi, task_errors=task_errors)
+                if _id in zones:
+                    z = zones[_id]
+                    r.recipe['zone'] = [[z[0], z[1]], [z[2], z[3]]]
+                e += r.validate_recipe(force)
+                fname = r.get_ai_recipe_name(roi['name'])
+                exists = Path(fname).is_file()
+                save = (not dry_run) and (force or not e) and (override or not exists)
+                r.save_recipe(fname, roi, save=save)
+                if save:
+                    status = 'saved'
+                elif e and not force:
+                    status = 'invalid'
+                elif dry_run:
+                    status = 'valid'
+                else:
+                    status = 'exists'
+                res.append([name, roi['name'], fname, status, len(set(e))])
+                reports[f"{name}/{roi['name']}"] = e
+            except (AssertionError, RuntimeError) as e:
+                res.append([name, roi['name'], '', 'FAILED', str(e)])
+    output.table(res, headers=['task', 'roi', 'recipe', 'status', 'errors'])
+    _errors = aggregate(reports)
+    if _errors:
+        output.comment('\nErrors:')
+        output.table([[e, n, ', '.join(keys[:3]) + (' ...' if n > 3 else '')] for e, n, keys in _errors],
+                     headers=['error', 'recipes', 'task/roi'])
+    _saved = len([x for x in res if x[3] == 'saved'])
+    output.comment(f"{_saved} of {len(res)} recipes saved")
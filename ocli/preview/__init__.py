@@ -9,7 +9,7 @@ import os
 from pathlib import Path
 from pprint import pprint
 
-from scipy.stats import describe
+from concurrent.futures import ThreadPoolExecutor
 
 import cartopy.crs as ccrs
 import geopandas as gpd
@@ -21,6 +21,9 @@ from matplotlib import ticker
 from matplotlib.patches import Patch
 from skimage import exposure
 
+from ocli.ai.pyramid import select_overview, overview_slice, open_overview
+from ocli.ai.stats import WORKERS, BandStats, BandWindow, band_stats, cached_stats, stream_stats, window_key
+from ocli.ai.tensor_store import open_tensor, tensor_mtime
 from ocli.ai.util import Filenames
 from ocli.cli.output import OCLIException
 from ocli.preview.cfeatures import add_basemap
@@ -182,25 +185,39 @@ def major_formatter(x, pos):
 
 def preview_stack(df, dir, full_shape: list, slice_region: tuple,
                   band: list, clip: tuple, columns: int,
-                  hist=None, ylog=False
+                  hist=None, ylog=False, resolution=None
                   ):
     import spectral.io.envi as envi
+    if hist:
+        return preview_stack_hist(df, dir, full_shape, slice_region, clip, columns, hist, ylog)
+    """ use overviews only if all bands have them """
+    factors = [select_overview(os.path.join(dir, f) + '.img', full_shape, slice_region, resolution)
+               for f in df['filename']]
+    factor = min(factors) if factors else 1
+    if factor > 1:
+        log.info(f'Using {factor}x overviews')
+    _slice = overview_slice(slice_region, factor)
     if (slice_region[0] != -1):
-        arr = np.zeros([slice_region[2] - slice_region[0], slice_region[3] - slice_region[1], len(band)])
+        arr = np.zeros([_slice[2] - _slice[0], _slice[3] - _slice[1], len(band)])
         log.info(f'Slice:{slice_region} from {full_shape}')
     else:
-        arr = np.zeros([*full_shape[:2], len(band)])
+        arr = None
     idx = 0
     # log.error(arr.shape)
-    ymin, xmin, ymax, xmax = slice_region
+    ymin, xmin, ymax, xmax = slice_region if slice_region[0] != -1 else (0, 0, *full_shape[:2])
     band_names = []
     for i, row in df.iterrows():
         band_names.append(row['filename'])
         _p = os.path.join(dir, row['filename'])
-        img = envi.open(_p + '.hdr', _p + '.img')
-        b = img.read_band(0, use_memmap=True)
+        if factor > 1:
+            b = open_overview(_p + '.img', factor)
+        else:
+            img = envi.open(_p + '.hdr', _p + '.img')
+            b = img.read_band(0, use_memmap=True)
+        if arr is None:
+            arr = np.zeros([*b.shape[:2], len(band)])
         if (slice_region[0] != -1):
-            arr[..., idx] = b[slice_region[0]:slice_region[2], slice_region[1]:slice_region[3]]
+            arr[..., idx] = b[_slice[0]:_slice[2], _slice[1]:_slice[3]]
         else:
             arr[..., idx] = b
             # ymin, xmin, ymax, xmax = (0, 0, full_shape[0], full_shape[1])
@@ -221,21 +238,15 @@ def preview_stack(df, dir, full_shape: list, slice_region: tuple,
         for i in range(0, len(band)):
             ax = fig.add_subplot(rows, cols, i + 1)
             ax.set_title(band_names[i], fontdict={'fontsize': 8})
-            if hist:
-                _a = arr[..., i].reshape(-1)
-                if ylog:
-                    plt.yscale("log")
-                plt.hist(_a, bins=hist)
-                _d = describe(_a)
-                plt.xlabel(f"min:{_d.minmax[0]} max:{_d.minmax[1]}\nmean:{_d.mean} dev: {np.sqrt(_d.variance)}")
-            else:
-                plt.imshow(arr[..., i])
-                plt.colorbar(ax=ax)
-                ax.tick_params(axis='both', which='major', labelsize=8)
-                ax.tick_params(axis='both', which='minor', labelsize=6)
-                ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{int(x + xmin)}'))
-                ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{int(y + ymin)}'))
+            plt.imshow(arr[..., i])
+            plt.colorbar(ax=ax)
+            ax.tick_params(axis='both', which='major', labelsize=8)
+            ax.tick_params(axis='both', which='minor', labelsize=6)
+            ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{int(x * factor + xmin)}'))
+            ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{int(y * factor + ymin)}'))
     sup = f"STACK {arr.shape[0]}x{arr.shape[1]}"
+    if factor > 1:
+        sup += f" overview 1:{factor}"
     if clip:
         sup += f" clip-log {clip}"
     plt.suptitle(sup)
@@ -244,6 +255,90 @@ def preview_stack(df, dir, full_shape: list, slice_region: tuple,
     return plt
 
 
+def _plot_stats(ax, st: BandStats, bins: int, ylog=False, color=None):
+    """ histogram of precomputed band statistics """
+    counts, edges = st.histogram(bins)
+    if ylog:
+        ax.set_yscale("log")
+    ax.hist(edges[:-1], bins=edges, weights=counts, color=color)
+    d = st.describe()
+    ax.set_xlabel(f"min:{d['min']} max:{d['max']}\nmean:{d['mean']} dev: {d['std']}\n"
+                  f"p2:{d['p2']:.4g} median:{d['p50']:.4g} p98:{d['p98']:.4g}")
+
+
+def preview_hist(stats: list, band_names: list, columns: int, bins: int, title: str, ylog=False):
+    """ histograms of bands by statistics (see ocli.ai.stats) """
+    cols = min(columns, len(stats))
+    rows = np.math.ceil(len(stats) / cols)
+    fig = plt.figure(figsize=(10, 10))
+    for i, st in enumerate(stats):
+        ax = fig.add_subplot(rows, cols, i + 1)
+        ax.set_title(band_names[i], fontdict={'fontsize': 8})
+        _plot_stats(ax, st, bins, ylog)
+    plt.suptitle(title)
+    plt.tight_layout()
+    return plt
+
+
+def _clip_log(clip):
+    minval = 10 ** clip[0]
+    maxval = 10 ** clip[1]
+    return lambda x: np.log10(np.clip(x, minval, maxval))
+
+
+def stack_stats(df, dir, slice_region: tuple, clip: tuple) -> list:
+    """ statistics of full resolution stack bands, bands are streamed from memmaps in parallel,
+    results are cached in sidecar of every band file
+    """
+    import spectral.io.envi as envi
+    window = slice_region if slice_region[0] != -1 else None
+    key = f"{window_key(window)}|clip={list(clip) if clip else None}"
+    transform = _clip_log(clip) if clip else None
+
+    def _band(filename):
+        _p = os.path.join(dir, filename)
+
+        def _compute(_):
+            b = envi.open(_p + '.hdr', _p + '.img').read_band(0, use_memmap=True)
+            return [band_stats(BandWindow(b, None, window), transform)]
+
+        return cached_stats(_p + '.img', os.path.getmtime(_p + '.img'), [key], _compute)[0]
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        return list(executor.map(_band, df['filename']))
+
+
+def preview_stack_hist(df, dir, full_shape: list, slice_region: tuple, clip: tuple, columns: int,
+                       hist: int, ylog=False):
+    stats = stack_stats(df, dir, slice_region, clip)
+    ymin, xmin, ymax, xmax = slice_region if slice_region[0] != -1 else (0, 0, *full_shape[:2])
+    sup = f"STACK {ymax - ymin}x{xmax - xmin}"
+    if clip:
+        sup += f" clip-log {clip}"
+    return preview_hist(stats, df['filename'].tolist(), columns, hist, sup, ylog)
+
+
+def tensor_stats(filenames: Filenames, blist: list, slice_range, tnorm=None) -> list:
+    """ statistics of full resolution tensor bands, bands are streamed in parallel,
+    results are cached in sidecar of tensor
+
+    :param tnorm: normalisation file name
+    """
+    ary = open_tensor(filenames.tnsr)
+    window = slice_range if slice_range[0] != -1 else None
+    transforms = [None] * len(blist)
+    keys = [f"{b}|{window_key(window)}" for b in blist]
+    if tnorm:
+        tn = np.load(tnorm)
+        transforms = [(lambda m, s: lambda x: (x - m) / s)(tn[b, 0], tn[b, 1]) for b in blist]
+        keys = [f"{k}|tnorm={tn[b, 0]!r},{tn[b, 1]!r}" for k, b in zip(keys, blist)]
+
+    def _compute(idx):
+        return stream_stats([BandWindow(ary, blist[i], window) for i in idx], [transforms[i] for i in idx])
+
+    return cached_stats(filenames.tnsr, tensor_mtime(filenames.tnsr), keys, _compute)
+
+
 def _vis_rgb(r, g, b, title, hist=None, ylog=False):
     if hist:
         fig, axes = plt.subplots(nrows=1, ncols=3, figsize=(10, 10))
@@ -251,9 +346,8 @@ def _vis_rgb(r, g, b, title, hist=None, ylog=False):
             [ax.axes.set_yscale('log') for ax in axes]
         fig.suptitle(title, fontdict={'fontsize': 8})
         fig.canvas.set_window_title(f"Band math histogram")
-        axes[0].hist(r.reshape(-1), bins=hist, color='r')
-        axes[1].hist(g.reshape(-1), bins=hist, color='g')
-        axes[2].hist(b.reshape(-1), bins=hist, color='b')
+        for ax, st, color in zip(axes, stream_stats([BandWindow(c) for c in (r, g, b)]), 'rgb'):
+            _plot_stats(ax, st, hist, color=color)
         # ax.set_xlabel('B')
     else:
         img = np.stack((r, g, b), axis=-1)  # RGB
@@ -444,12 +538,12 @@ def compute_tensor_pol3(b1: np.ndarray, b2: np.ndarray, b3: np.ndarray, vis_mode
     # return _vis_rgb(band1, band2, band3, title, hist, ylog)
 
 
-def preview_tnsr(arr,  band,band_names, columns, slice_range, hist, title, ylog):
+def preview_tnsr(arr,  band,band_names, columns, slice_range, hist, title, ylog, overview=1):
 
     if (slice_range[0] != -1):
         ymin, xmin, ymax, xmax = slice_range
     else:
-        ymin, xmin, ymax, xmax = (0, 0, arr.shape[0], arr.shape[1])
+        ymin, xmin, ymax, xmax = (0, 0, arr.shape[0] * overview, arr.shape[1] * overview)
 
     if len(band):
         cols = min(columns, len(band))
@@ -462,21 +556,17 @@ def preview_tnsr(arr,  band,band_names, columns, slice_range, hist, title, ylog)
             ax.set_title(band_names[i], fontdict={'fontsize': 8})
             log.info(f"add band  {i} {band_names[i]} to plot")
             if hist:
-                _a = arr[..., i].reshape(-1)
-                if ylog:
-                    plt.yscale("log")
-                plt.hist(_a, bins=hist)
-                _d = describe(_a)
-                plt.xlabel(f"min:{_d.minmax[0]} max:{_d.minmax[1]}\nmean:{_d.mean} dev: {np.sqrt(_d.variance)}")
-                pass
+                _plot_stats(ax, stream_stats([BandWindow(arr, i)])[0], hist, ylog)
             else:
                 plt.imshow(arr[..., i])
                 plt.colorbar()
                 ax.tick_params(axis='both', which='major', labelsize=8)
                 ax.tick_params(axis='both', which='minor', labelsize=6)
-                ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{int(x + xmin)}'))
-                ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{int(y + ymin)}'))
+                ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{int(x * overview + xmin)}'))
+                ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{int(y * overview + ymin)}'))
             # plt.ioff()
+    if overview > 1:
+        title += f" overview 1:{overview}"
     plt.suptitle(f"TENSOR {arr.shape[0]}x{arr.shape[1]} {title}")
     plt.subplots_adjust(bottom=0.01, left=0.04, wspace=0.1, hspace=0.1, right=0.99, top=0.95)
     plt.tight_layout()
@@ -488,44 +578,56 @@ def preview_hist_pol(ary: np.ndarray, bins: int, bnames):
     """ preview arry histograms """
     fig = plt.figure(figsize=(10, 10))
     cols = ary.shape[2]
+    stats = stream_stats([BandWindow(ary, i) for i in range(cols)])
     for i in range(0, cols):
         ax = fig.add_subplot(1, cols, i + 1)
         ax.set_title(bnames[i])
-        log.error(ax)
-        plt.hist(ary[..., i].reshape(-1), bins=bins)
+        _plot_stats(ax, stats[i], bins)
         plt.tight_layout()
     return plt
 
 
-def preview_cluster(pred8c_hdr, pred8c_img, band, slice_region, columns, rgb):
+def preview_cluster(pred8c_hdr, pred8c_img, band, slice_region, columns, rgb, resolution=None):
+    """
+
+    :param resolution: requested preview resolution, None - full resolution (overviews of pred8c image are used)
+    """
     img = envi.open(pred8c_hdr, pred8c_img)
     full_shape = img.shape[:2]
     band_names = img.metadata['band names']
+    factor = select_overview(pred8c_img, full_shape, slice_region, resolution)
+    if factor > 1:
+        log.info(f'Using {factor}x overviews')
+        _ovr = open_overview(pred8c_img, factor)
+        read_band = lambda _b: _ovr[..., _b]
+    else:
+        read_band = lambda _b: img.read_band(_b, use_memmap=True)
+    _slice = overview_slice(slice_region, factor)
     if (slice_region[0] != -1):
         ymin, xmin, ymax, xmax = slice_region
-        sl = np.s_[slice_region[0]:slice_region[2], slice_region[1]:slice_region[3]]
+        sl = np.s_[_slice[0]:_slice[2], _slice[1]:_slice[3]]
     else:
         ymin, xmin, ymax, xmax = (0, 0, full_shape[0], full_shape[1])
         sl = np.s_[:, :]
     if rgb:
         fig1, ax1 = plt.subplots()
-        r = img.read_band(band[0], use_memmap=True)[sl]
-        g = img.read_band(band[1], use_memmap=True)[sl]
-        b = img.read_band(band[2], use_memmap=True)[sl]
+        r = read_band(band[0])[sl]
+        g = read_band(band[1])[sl]
+        b = read_band(band[2])[sl]
         ax1.imshow(np.stack((r, g, b), axis=-1))
     elif len(band):
         cols = min(columns, len(band))
         rows = np.math.ceil(len(band) / cols)
         fig = plt.figure(figsize=(rows, cols))
         for i, _b in enumerate(band):
-            b = img.read_band(_b, use_memmap=True)[sl]
+            b = read_band(_b)[sl]
             ax = fig.add_subplot(rows, cols, i + 1)
             plt.imshow(b)
             plt.tight_layout()
             ax.tick_params(axis='both', which='major', labelsize=8)
             ax.tick_params(axis='both', which='minor', labelsize=6)
-            ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{int(x + xmin)}'))
-            ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{int(y + ymin)}'))
+            ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, _: f'{int(x * factor + xmin)}'))
+            ax.yaxis.set_major_formatter(ticker.FuncFormatter(lambda y, _: f'{int(y * factor + ymin)}'))
             ax.set_title(band_names[_b], fontdict={'fontsize': 8})
     plt.subplots_adjust(bottom=0.01, left=0.04, wspace=0.1, hspace=0.1, right=0.99, top=0.99)
     plt.show()
@@ -598,8 +700,17 @@ def _read_bands(band1, band2, band3, df, slice_range):
     return title, (b1, b2, b3)
 
 
-def read_tensor(blist, df: gpd.GeoDataFrame, slice_range, filenames, tnorm, gauss, split) -> (str, np.ndarray):
-    ary = np.load(filenames.tnsr, mmap_mode='r')  # type: np.ndarray
+def read_tensor(blist, df: gpd.GeoDataFrame, slice_range, filenames, tnorm, gauss, split,
+                overview=1) -> (str, np.ndarray):
+    """
+
+    :param overview: overview factor (see ocli.ai.pyramid.select_overview), 1 - full resolution
+    """
+    if overview > 1:
+        ary = open_overview(filenames.tnsr, overview)  # type: np.ndarray
+        slice_range = overview_slice(slice_range, overview)
+    else:
+        ary = open_tensor(filenames.tnsr)  # type: np.ndarray
     ns = df.iloc[blist]['name'].tolist()
     title = " ".join([f"B{i}:{n}" for i, n in enumerate(ns)])
     if slice_range[0] != -1:
@@ -617,10 +728,11 @@ def read_tensor(blist, df: gpd.GeoDataFrame, slice_range, filenames, tnorm, gaus
         title += "\nNot normalised"
 
     if gauss:
-        from scipy.ndimage.filters import gaussian_filter
-        for i in range(0, tnsr.shape[2]):
-            tnsr[..., i] = gaussian_filter(tnsr[..., i], gauss)
+        from ocli.ai.filter.gauss import gaussian_block
+        gaussian_block(tnsr, gauss / overview, out=tnsr)
         title += f"\nGauss={gauss}"
+    if overview > 1:
+        title += f"\nOverview 1:{overview}"
     if split:
         if len(blist) == 3:
             return title, (tnsr[..., 0], tnsr[..., 1], tnsr[..., 2])
@@ -630,7 +742,7 @@ def read_tensor(blist, df: gpd.GeoDataFrame, slice_range, filenames, tnorm, gaus
         return tnsr
 
 
-def create_tensor_rgb(band1, band2, band3, df, vis_mode, slice_range, filenames, tnorm, gauss):
+def create_tensor_rgb(band1, band2, band3, df, vis_mode, slice_range, filenames, tnorm, gauss, resolution=None):
     bands_2 = ['simple', 'rgb-ratio', 'rgb-diff', 'false-color', 'false-color-enhanced']
     bands_3 = ['sar', 'composite', 'composite-u']
 
@@ -651,13 +763,16 @@ def create_tensor_rgb(band1, band2, band3, df, vis_mode, slice_range, filenames,
     except IndexError:
         raise AssertionError("Band number is invalid")
     try:
+        overview = select_overview(filenames.tnsr, open_tensor(filenames.tnsr).shape,
+                                   slice_range, resolution)
         title, (b1, b2, b3) = read_tensor(blist,
                                           df=df,
                                           slice_range=slice_range,
                                           filenames=filenames,
                                           tnorm=tnorm,
                                           gauss=gauss,
-                                          split=True
+                                          split=True,
+                                          overview=overview
                                           )
         if band3:
             (r, g, b) = compute_tensor_pol3(b1, b2, b3, vis_mode=vis_mode)
@@ -672,7 +787,7 @@ def create_tensor_rgb(band1, band2, band3, df, vis_mode, slice_range, filenames,
 
 def create_tensor_plt(band1, band2, band3, vis_mode, slice_range, filenames: Filenames,
                       tnorm=False,
-                      gauss=None, hist=None, ylog=False):
+                      gauss=None, hist=None, ylog=False, resolution=None):
     # TODO Google Earth overlay? https://ocefpaf.github.io/python4oceanographers/blog/2014/03/10/gearth/
     bands_2 = ['simple', 'rgb-ratio', 'rgb-diff', 'false-color', 'false-color-enhanced']
     bands_3 = ['sar', 'composite', 'composite-u']
@@ -689,9 +804,13 @@ def create_tensor_plt(band1, band2, band3, vis_mode, slice_range, filenames: Fil
         import spectral.io.envi as s_envi
         try:
             bn = s_envi.open(filenames.tnsr_hdr).metadata['band names']
-            ary = np.load(filenames.tnsr, mmap_mode='r')  # type: np.ndarray
+            ary = open_tensor(filenames.tnsr)  # type: np.ndarray
         except Exception as e:
             raise OCLIException(e)
+        overview = select_overview(filenames.tnsr, ary.shape, slice_range, None if hist else resolution)
+        if overview > 1:
+            ary = open_overview(filenames.tnsr, overview)
+            slice_range = overview_slice(slice_range, overview)
 
         if band3 is None:
             title = f"tensor: {filenames.tnsr}\n B1: {bn[band1]} B2: {bn[band2]}"
@@ -719,9 +838,8 @@ def create_tensor_plt(band1, band2, band3, vis_mode, slice_range, filenames: Fil
         else:
             title += "\n not normalised"
         if gauss:
-            from scipy.ndimage.filters import gaussian_filter
-            for i in range(0, tnsr.shape[2]):
-                tnsr[..., i] = gaussian_filter(tnsr[..., i], gauss)
+            from ocli.ai.filter.gauss import gaussian_block
+            gaussian_block(tnsr, gauss / overview, out=tnsr)
             title += f" Gauss={gauss}"
 
         if band3 is None:
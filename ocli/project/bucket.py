@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime, timedelta
 
+import numpy as np
 from geopandas import GeoDataFrame
 
 from ocli.sent1 import get_bucket
@@ -15,13 +16,20 @@ log = logging.getLogger()
 
 BUCKET_THRESHOLD = 10  # pairs max startDate diff in secs in the bucket
 MGRSPRECISION = 0  # 1 - 10km, 2 - 1km, 3 - 100m ....
+S1_CYCLE_T = 24 * 3600 * 12  # 12 days in seconds
+BUCKET_KEY = ['platform', 'polarisation', 'swath', 'relativeOrbitNumber']
+
+
+def _mgrs_str(v) -> str:
+    """ mgrs < 1.4 returns bytes """
+    return v.decode() if isinstance(v, bytes) else v
 
 
 def toMgrs():
     m = mgrs.MGRS()
 
     def _t(point):
-        return m.toMGRS(point.y, point.x, MGRSPrecision=MGRSPRECISION).decode()
+        return _mgrs_str(m.toMGRS(point.y, point.x, MGRSPrecision=MGRSPRECISION))
     return _t
 
 def unitime_delta(t0, t1):
@@ -42,8 +50,110 @@ def unitime_delta_factory(d0):
     return _fn
 
 
+def _cycle_dt(t1: np.ndarray, t0) -> np.ndarray:
+    """ vectorized unitime_delta_factory(t0)(t1) on int64 nanoseconds, same float math as original """
+    d = np.abs((t1 - t0).astype(np.float64) / 1e9) % S1_CYCLE_T
+    return np.where(d <= S1_CYCLE_T / 2, d, S1_CYCLE_T - d)
+
+
+def _phase_window(sphase: np.ndarray, sorder: np.ndarray, phase) -> np.ndarray:
+    """ group positions (ascending) which phase (time of cycle) is close to given phase
+
+    window is a bit wider than BUCKET_THRESHOLD, exact check is done by caller with _cycle_dt
+    """
+    cycle_ns = S1_CYCLE_T * 10 ** 9
+    w = (BUCKET_THRESHOLD + 1) * 10 ** 9
+    lo, hi = phase - w, phase + w
+    parts = [sorder[np.searchsorted(sphase, max(lo, 0), 'left'):np.searchsorted(sphase, min(hi, cycle_ns - 1), 'right')]]
+    if lo < 0:
+        parts.append(sorder[np.searchsorted(sphase, lo + cycle_ns, 'left'):])
+    if hi >= cycle_ns:
+        parts.append(sorder[:np.searchsorted(sphase, hi - cycle_ns, 'right')])
+    return np.sort(np.concatenate(parts))
+
+
+def _sweep_group(t: np.ndarray) -> list:
+    """ assign bucket to products of single orbit key
+
+    :param t: start dates (int64 ns) in product list order (descending start date)
+    :return: list of (q, median, members, cycle_dt) group positions
+    """
+    phase = t % (S1_CYCLE_T * 10 ** 9)
+    sorder = np.argsort(phase, kind='stable')
+    sphase = phase[sorder]
+    processed = np.zeros(t.size, dtype=bool)
+    steps = []
+    for q in range(t.size):
+        if processed[q]:
+            continue
+        """ ------------- #1 pairs for q, filter by BUCKET_THRESHOLD ----------------"""
+        cand = _phase_window(sphase, sorder, phase[q])
+        cand = cand[~processed[cand]]
+        cdt = _cycle_dt(t[cand], t[q])
+        _sel = cdt <= BUCKET_THRESHOLD
+        pairs, cdt = cand[_sel], cdt[_sel]
+        """---------------- #2 median product ----------------"""
+        med = np.median(cdt)
+        m = pairs[np.argsort(np.abs(cdt - med))[0]]
+        """---------------- #3 bucket members around median ----------------"""
+        cand = _phase_window(sphase, sorder, phase[m])
+        cand = cand[~processed[cand]]
+        cdt = _cycle_dt(t[cand], t[m])
+        _sel = cdt <= BUCKET_THRESHOLD
+        members = cand[_sel]
+        processed[members] = True
+        steps.append((q, m, members, np.round(cdt[_sel], 3)))
+    return steps
+
+
 def create_list(odf: GeoDataFrame, buckets_dir='.') -> GeoDataFrame:
-    """ add bucket coulmnt to product list"""
+    """ add bucket coulmnt to product list
+
+    products are grouped by BUCKET_KEY, each group is swept in startDate descending order,
+    candidates are looked up by time-of-cycle in sorted array. Result is the same as _create_list_loop
+    """
+    if odf.empty:
+        log.error("No full-cover SAR images found for ROI")
+        return None
+
+    df = odf.sort_values(by=['startDate'], inplace=False, ascending=False)
+    df.reset_index(inplace=True, drop=True)
+    df['bucket'] = None
+    df['processed'] = False
+    df['cycle_dt'] = None
+    n = len(df)
+    t = df['startDate'].values.astype('datetime64[ns]').astype(np.int64)
+    df['centroid'] = df.centroid
+    m = mgrs.MGRS()
+    df['mgrs'] = [_mgrs_str(m.toMGRS(y, x, MGRSPrecision=MGRSPRECISION))
+                  for x, y in zip(df['centroid'].x.values, df['centroid'].y.values)]
+    prefix = df['platform'].astype(str) + '_' + df['sensorMode'].astype(str) + '_' + \
+             df['productType'].astype(str) + '_' + df['relativeOrbitNumber'].astype(str) + '_'
+    bnames = (prefix + df['mgrs']).values
+    product_ids = df['productId'].values
+    steps = []
+    for _, pos in df.groupby(BUCKET_KEY, sort=False).indices.items():
+        pos = np.sort(pos)
+        steps.extend((pos[q], pos[_m], pos[members], cdt) for q, _m, members, cdt in _sweep_group(t[pos]))
+    """ apply in the original sweep order: median '-0-' mark could be overwritten by later buckets """
+    steps.sort(key=lambda x: x[0])
+    pid_pos = df.groupby('productId', sort=False).indices
+    bucket = np.full(n, None, dtype=object)
+    processed = np.zeros(n, dtype=bool)
+    cycle_dt = np.full(n, None, dtype=object)
+    for _, _m, members, cdt in steps:
+        bucket[members] = bnames[_m]
+        processed[members] = True
+        cycle_dt[members] = cdt
+        cycle_dt[pid_pos[product_ids[_m]]] = '-0-'
+    df['bucket'] = bucket
+    df['processed'] = processed
+    df['cycle_dt'] = cycle_dt
+    return df
+
+
+def _create_list_loop(odf: GeoDataFrame, buckets_dir='.') -> GeoDataFrame:
+    """ add bucket coulmnt to product list (reference row-by-row implementation, see ocli.bench.buckets)"""
     if odf.empty:
         log.error("No full-cover SAR images found for ROI")
         return None
@@ -0,0 +1,125 @@
+"""
+Cached bucket index: bucket.create_list result plus per-ROI fit fractions.
+
+Index is stored near the pairs cache (sar.parquet -> sar.buckets.pkl) and kept in memory,
+so repeated 'bucket list' / 'bucket show' do not re-read the pairs cache and rebuild buckets.
+Bucket assignment is invalidated when the pairs cache files change (mtime, size),
+fit columns are keyed by ROI geometry hash.
+"""
+import logging
+import os
+from pickle import dump, load, HIGHEST_PROTOCOL
+from typing import Optional
+
+from geopandas import GeoDataFrame
+from shapely.geometry import Polygon
+
+from ocli.project import bucket
+from ocli.sent1 import pairs
+from ocli.sent1.spatial import ProductIndex, roi_key
+
+log = logging.getLogger()
+
+""" ESRI Shapefile cache sidecars are checked too """
+_SHP_EXT = ('.shp', '.dbf', '.shx')
+""" in-memory index: index file name -> {'key': source key, 'data': buckets, 'fit': {roi key: array}, 'spatial': ProductIndex}
+'spatial' is not saved
+"""
+_index = {}
+
+
+def index_file_name(cache_file_name: str) -> str:
+    return os.path.splitext(cache_file_name)[0] + '.buckets.pkl'
+
+
+def source_key(cache_file_name: str) -> tuple:
+    """ (name, mtime, size) of every existing pairs cache file, legacy .shp cache if not migrated yet """
+    if not os.path.isfile(cache_file_name):
+        cache_file_name = pairs.legacy_cache_file_name(cache_file_name)
+    base, ext = os.path.splitext(cache_file_name)
+    key = []
+    for _e in (_SHP_EXT if ext == '.shp' else (ext,)):
+        _f = base + _e
+        if os.path.isfile(_f):
+            st = os.stat(_f)
+            key.append((_e, st.st_mtime_ns, st.st_size))
+    if not key:
+        raise RuntimeError(f"Pairs cache {cache_file_name} not found, use 'pairs load' first")
+    return tuple(key)
+
+
+def _read(index_file: str, key: tuple) -> Optional[dict]:
+    try:
+        with open(index_file, 'rb') as _f:
+            idx = load(_f)
+        if idx.get('key') == key:
+            return idx
+        log.debug(f"bucket index {index_file} is outdated")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning(f"Could not read bucket index {index_file}: {e}")
+    return None
+
+
+def _write(index_file: str, idx: dict):
+    _tmp = index_file + '.tmp'
+    try:
+        with open(_tmp, 'wb') as _f:
+            dump({k: idx[k] for k in ('key', 'data', 'fit')}, _f, protocol=HIGHEST_PROTOCOL)
+        os.replace(_tmp, index_file)
+    except OSError as e:
+        log.warning(f"Could not save bucket index {index_file}: {e}")
+
+
+def _spatial(idx: dict) -> ProductIndex:
+    if idx.get('spatial') is None:
+        idx['spatial'] = ProductIndex(idx['data'].geometry)
+    return idx['spatial']
+
+
+def _load(cache_file_name: str, index_file: Optional[str] = None) -> (str, dict):
+    index_file = index_file if index_file else index_file_name(cache_file_name)
+    key = source_key(cache_file_name)
+    idx = _index.get(index_file)
+    if idx is None or idx['key'] != key:
+        idx = _read(index_file, key)
+        if idx is None:
+            log.debug(f"building bucket index {index_file}")
+            _df = pairs.load_from_cache(cache_file_name=cache_file_name)
+            idx = {'key': key, 'data': bucket.create_list(_df, buckets_dir=''), 'fit': {}}
+            _write(index_file, idx)
+        _index[index_file] = idx
+    return index_file, idx
+
+
+def load_bucket_index(cache_file_name: str, geometry: Optional[Polygon] = None,
+                      index_file: Optional[str] = None) -> Optional[GeoDataFrame]:
+    """ products with assigned buckets (see bucket.create_list)
+
+    :param cache_file_name: pairs cache file name
+    :param geometry: ROI, if given 'fit' column (ROI coverage 0...1) is added
+    :param index_file: index file name, default is derived from cache_file_name
+    :return: copy of the indexed products or None if pairs cache is empty
+    """
+    index_file, idx = _load(cache_file_name, index_file)
+    if idx['data'] is None:
+        return None
+    df = idx['data'].copy()
+    if geometry is not None:
+        _rk = roi_key(geometry)
+        fit = idx['fit'].get(_rk)
+        if fit is None:
+            fit = _spatial(idx).fit(geometry)
+            idx['fit'][_rk] = fit
+            _write(index_file, idx)
+        df['fit'] = fit
+    return df
+
+
+def clear_bucket_index(cache_file_name: str, index_file: Optional[str] = None):
+    """ drop in-memory and on-disk index """
+    index_file = index_file if index_file else index_file_name(cache_file_name)
+    _index.pop(index_file, None)
+    if os.path.isfile(index_file):
+        os.remove(index_file)
@@ -30,7 +30,7 @@ def relative_orbit_number(mission: str, orbitNumber: int) -> int:
 log.debug("Initint S1")
 QPROJ =  'epsg:4326' ## gpd >= 0.7 See https://jorisvandenbossche.github.io/blog/2020/02/11/geopandas-pyproj-crs/
 __data_dir = './GeoDataFrame'
-__data_filename = os.path.join(__data_dir, 'sar.shp')
+__data_filename = os.path.join(__data_dir, 'sar.parquet')
 __data = gpd.GeoDataFrame(crs=QPROJ)
 log.debug("Initint S1 done")
 
@@ -0,0 +1,374 @@
+"""
+Persistent catalogue of local SAFE products (SQLite)
+
+Catalogue is updated incrementally:
+    * directory tree listing is cached with directory mtime, unchanged directories are not listed again
+    * manifest.safe is parsed only for new or changed (by mtime) SAFE directories
+    * products which are gone from disk are removed
+    * SAFE directories which could not be parsed are recorded with mtime and are not parsed again until changed
+
+Products without footprint in manifest are stored with NULL geometry and never match spatial queries.
+
+Products footprint bounding boxes are stored in R*Tree index (if sqlite is built without rtree plain columns are used)
+"""
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Iterable
+
+from dateutil.parser import parse
+
+from ocli.sent1 import get_bucket, s1_prod_id, QPROJ
+from ocli.sent1.metadata_extractor import extract_manifest
+
+log = logging.getLogger()
+
+CATALOG_VERSION = 2
+
+PRODUCT_COLUMNS = ['productId', 'platform', 'sensorMode', 'relativeOrbitNumber', 'productType', 'polarisation',
+                   'swath', 'startDate', 'stopDate', 'backetname', 'productname', 'path']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL, children TEXT);
+CREATE TABLE IF NOT EXISTS failed (path TEXT PRIMARY KEY, mtime REAL, error TEXT);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime REAL,
+    productId TEXT,
+    platform TEXT,
+    sensorMode TEXT,
+    relativeOrbitNumber INTEGER,
+    productType TEXT,
+    polarisation TEXT,
+    swath TEXT,
+    startDate TEXT,
+    stopDate TEXT,
+    backetname TEXT,
+    productname TEXT,
+    geometry TEXT,
+    minx REAL, miny REAL, maxx REAL, maxy REAL
+);
+CREATE INDEX IF NOT EXISTS products_orbit ON products (platform, relativeOrbitNumber);
+CREATE INDEX IF NOT EXISTS products_start ON products (startDate);
+"""
+
+
+def _product_swaths(path) -> str:
+    """ swaths from annotation file names: s1a-iw1-slc-vv-...xml -> IW1 """
+    try:
+        _sw = {f.split('-')[1].upper() for f in os.listdir(os.path.join(path, 'annotation')) if f.endswith('.xml')}
+    except (OSError, IndexError):
+        return ''
+    return ','.join(sorted(_sw))
+
+
+def read_safe(path: str) -> dict:
+    """ parse SAFE directory manifest into catalogue record
+
+    :param path: SAFE directory
+    :raises AssertionError, OSError: on unknown or broken products
+    """
+    with open(os.path.join(path, 'manifest.safe'), 'rb') as _f:
+        manifest = _f.read()
+    prodname = os.path.basename(os.path.normpath(path))
+    parsed = extract_manifest(manifest, prodname)
+    platform = parsed['ProductClass'] + '1' + parsed['FamilyNameNumber']
+    coords = parsed.get('Coordinates')
+    if coords:
+        xs = [c[0] for c in coords]
+        ys = [c[1] for c in coords]
+        bbox = dict(minx=min(xs), miny=min(ys), maxx=max(xs), maxy=max(ys))
+    else:
+        bbox = dict(minx=None, miny=None, maxx=None, maxy=None)
+    return dict(
+        path=path,
+        mtime=os.path.getmtime(path),
+        productId=s1_prod_id(prodname),
+        platform=platform,
+        sensorMode=parsed['InstrumentMode'],
+        relativeOrbitNumber=int(parsed['relativeOrbitNumber']),
+        productType=parsed['ProductType'],
+        polarisation=parsed.get('TransmitterReceiverPolarisation'),
+        swath=_product_swaths(path),
+        startDate=parsed['StartTime'],
+        stopDate=parsed.get('StopTime'),
+        backetname=get_bucket(
+            buckets_dir='',
+            mission=platform,
+            sensorMode=parsed['InstrumentMode'],
+            productType=parsed['ProductType'],
+            relativeOrbitNumber=parsed['relativeOrbitNumber'],
+            startDate=parse(parsed['StartTime']),
+        ),
+        productname=prodname,
+        geometry=json.dumps(coords) if coords else None,
+        **bbox
+    )
+
+
+def _read_safe_noraise(path: str) -> (str, Optional[dict], Optional[str]):
+    """ process pool worker: (path, record, error) """
+    try:
+        return path, read_safe(path), None
+    except (AssertionError, OSError, KeyError, IndexError, ValueError) as e:
+        return path, None, f"{e}"
+
+
+def read_safe_bulk(paths: Iterable[str], workers: Optional[int] = None, callback=None) -> (List[dict], dict):
+    """ parse many SAFE directories over process pool
+
+    :param paths: SAFE directories
+    :param workers: number of processes, None - CPU count, 0 - parse in current process
+    :param callback: progress callback(total, step)
+    :return: tuple(records, {path: error})
+    """
+    paths = list(paths)
+    records, errors = [], {}
+    if workers == 0 or len(paths) < 2:
+        results = map(_read_safe_noraise, paths)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        _workers = workers if workers else os.cpu_count() or 1
+        results = executor.map(_read_safe_noraise, paths, chunksize=max(1, min(64, len(paths) // (_workers * 4))))
+    try:
+        for path, rec, err in results:
+            if rec is None:
+                errors[path] = err
+            else:
+                records.append(rec)
+            if callback:
+                callback(len(paths), 1)
+    finally:
+        if executor:
+            executor.shutdown()
+    return records, errors
+
+
+def records_to_geodataframe(records: List[dict]) -> 'gpd.GeoDataFrame':
+    """ catalogue records as GeoDataFrame with footprint polygons """
+    import geopandas as gpd
+    from shapely.geometry import Polygon
+    columns = PRODUCT_COLUMNS + ['geometry']
+    if not records:
+        return gpd.GeoDataFrame(columns=columns, geometry='geometry', crs=QPROJ)
+    df = gpd.pd.DataFrame.from_records(records, columns=columns)
+    df['geometry'] = [Polygon(json.loads(g)) if g else None for g in df['geometry']]
+    return gpd.GeoDataFrame(df, geometry='geometry', crs=QPROJ)
+
+
+def ingest_manifests(paths: Iterable[str], workers: Optional[int] = None, callback=None) -> 'gpd.GeoDataFrame':
+    """ bulk ingestion: parse SAFE directories over process pool into GeoDataFrame, broken products are skipped """
+    records, errors = read_safe_bulk(paths, workers=workers, callback=callback)
+    for path, err in errors.items():
+        log.debug(f"Skipped {path}: {err}")
+    return records_to_geodataframe(records)
+
+
+class LocalCatalog(object):
+    """ SQLite catalogue of local SAFE products """
+    log = logging.getLogger('LocalCatalog')
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(_SCHEMA)
+        self.rtree = self._init_rtree()
+        version = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if version and version['value'] != str(CATALOG_VERSION):
+            """ records of older catalogue are parsed again """
+            self.log.info(f"catalogue {db_file} version {version['value']} is outdated, products will be parsed again")
+            self.conn.execute("DELETE FROM products")
+            self.conn.execute("DELETE FROM failed")
+            if self.rtree:
+                self.conn.execute("DELETE FROM products_rtree")
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(CATALOG_VERSION),))
+        self.conn.commit()
+
+    def _init_rtree(self) -> bool:
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS products_rtree USING rtree(id, minx, maxx, miny, maxy)")
+            return True
+        except sqlite3.OperationalError as e:
+            self.log.warning(f"sqlite rtree is not available, fall-back to bbox columns: {e}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS products_bbox ON products (minx, maxx, miny, maxy)")
+            return False
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ######################### update #############################
+
+    def _scan(self, root) -> (List[str], List[str]):
+        """ walk directory tree using cached directory listings
+
+        :return: (all SAFE dirs, changed or new SAFE dirs)
+        """
+        cur = self.conn.cursor()
+        known = {r['path']: r['mtime'] for r in cur.execute("SELECT path, mtime FROM failed")}
+        known.update({r['path']: r['mtime'] for r in cur.execute("SELECT path, mtime FROM products")})
+        safes, changed = [], []
+        stack = [os.path.abspath(root)]
+        while stack:
+            d = stack.pop()
+            try:
+                mtime = os.stat(d).st_mtime
+            except OSError:
+                continue
+            if d.endswith('.SAFE'):
+                safes.append(d)
+                if known.get(d) != mtime:
+                    changed.append(d)
+                continue
+            row = cur.execute("SELECT mtime, children FROM dirs WHERE path=?", (d,)).fetchone()
+            if row and row['mtime'] == mtime:
+                children = json.loads(row['children'])
+            else:
+                try:
+                    children = sorted(e.path for e in os.scandir(d) if e.is_dir())
+                except OSError as e:
+                    self.log.debug(f"Skipped {d}: {e}")
+                    continue
+                cur.execute("INSERT OR REPLACE INTO dirs VALUES (?,?,?)", (d, mtime, json.dumps(children)))
+            stack.extend(children)
+        return safes, changed
+
+    def _put(self, rec: dict):
+        cur = self.conn.cursor()
+        old = cur.execute("SELECT id FROM products WHERE path=?", (rec['path'],)).fetchone()
+        if old:
+            self._delete_ids([old['id']])
+        keys = list(rec.keys())
+        cur.execute(f"INSERT INTO products ({','.join(keys)}) VALUES ({','.join('?' * len(keys))})",
+                    [rec[k] for k in keys])
+        cur.execute("DELETE FROM failed WHERE path=?", (rec['path'],))
+        if self.rtree and rec['minx'] is not None:
+            cur.execute("INSERT INTO products_rtree VALUES (?,?,?,?,?)",
+                        (cur.lastrowid, rec['minx'], rec['maxx'], rec['miny'], rec['maxy']))
+
+    def _put_failed(self, path: str, error: str):
+        """ broken SAFE directory is not parsed again until its mtime is changed """
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        cur = self.conn.cursor()
+        old = cur.execute("SELECT id FROM products WHERE path=?", (path,)).fetchone()
+        if old:
+            self._delete_ids([old['id']])
+        cur.execute("INSERT OR REPLACE INTO failed VALUES (?,?,?)", (path, mtime, error))
+
+    def _delete_ids(self, ids):
+        cur = self.conn.cursor()
+        for i in ids:
+            cur.execute("DELETE FROM products WHERE id=?", (i,))
+            if self.rtree:
+                cur.execute("DELETE FROM products_rtree WHERE id=?", (i,))
+
+    def update(self, root: str, callback=None, workers: Optional[int] = None) -> dict:
+        """ synchronise catalogue with directory tree
+
+        :param root: eodata directory
+        :param callback: progress callback(total, step)
+        :param workers: manifest parser processes, see read_safe_bulk
+        :return: statistics {total, parsed, removed, errors}
+        """
+        root = os.path.abspath(root)
+        safes, changed = self._scan(root)
+        records, errors = read_safe_bulk(changed, workers=workers, callback=callback)
+        for rec in records:
+            self._put(rec)
+        for path, err in errors.items():
+            self.log.debug(f"Skipped {path}: {err}")
+            self._put_failed(path, err)
+        _safes = set(safes)
+        _prefix = root.rstrip(os.sep) + os.sep
+        gone = [r['id'] for r in self.conn.execute("SELECT id, path FROM products WHERE path LIKE ?", (_prefix + '%',))
+                if r['path'] not in _safes]
+        self._delete_ids(gone)
+        for r in self.conn.execute("SELECT path FROM failed WHERE path LIKE ?", (_prefix + '%',)).fetchall():
+            if r['path'] not in _safes:
+                self.conn.execute("DELETE FROM failed WHERE path=?", (r['path'],))
+        self.conn.commit()
+        self.log.info(f"catalogue {self.db_file}: {len(safes)} products, {len(changed)} parsed, {len(gone)} removed")
+        return dict(total=len(safes), parsed=len(changed), removed=len(gone), errors=len(errors))
+
+    # ######################### query #############################
+
+    def query(self, root: Optional[str] = None,
+              platform: Optional[str] = None,
+              relative_orbit: Optional[int] = None,
+              start: Optional[str] = None,
+              end: Optional[str] = None,
+              swath: Optional[str] = None,
+              geometry=None,
+              limit=-1) -> List[dict]:
+        """ query products
+
+        :param root: only products under directory
+        :param platform: S1A | S1B
+        :param relative_orbit: relative orbit number
+        :param start: ISO date, products started at or after
+        :param end: ISO date, products started before
+        :param swath: IW1 | IW2 | IW3
+        :param geometry: shapely geometry (EPSG:4326), products which footprint intersects it
+        :param limit: -1 for no limit
+        :return: list of records (dict with PRODUCT_COLUMNS keys)
+        """
+        where, args = [], []
+        tables = "products p"
+        if root:
+            where.append("p.path LIKE ?")
+            args.append(os.path.abspath(root).rstrip(os.sep) + os.sep + '%')
+        if platform:
+            where.append("p.platform = ?")
+            args.append(platform)
+        if relative_orbit is not None:
+            where.append("p.relativeOrbitNumber = ?")
+            args.append(int(relative_orbit))
+        if start:
+            where.append("p.startDate >= ?")
+            args.append(start)
+        if end:
+            where.append("p.startDate < ?")
+            args.append(end)
+        if swath:
+            where.append("(',' || p.swath || ',') LIKE ?")
+            args.append(f"%,{swath.upper()},%")
+        if geometry is not None:
+            minx, miny, maxx, maxy = geometry.bounds
+            if self.rtree:
+                tables += " JOIN products_rtree r ON r.id = p.id"
+                where.append("r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?")
+            else:
+                where.append("p.minx <= ? AND p.maxx >= ? AND p.miny <= ? AND p.maxy >= ?")
+            args.extend([maxx, minx, maxy, miny])
+        sql = f"SELECT p.* FROM {tables}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY p.startDate"
+        if limit >= 0 and geometry is None:
+            sql += f" LIMIT {int(limit)}"
+        res = []
+        for r in self.conn.execute(sql, args):
+            if geometry is not None:
+                from shapely.geometry import Polygon
+                if not r['geometry'] or not Polygon(json.loads(r['geometry'])).intersects(geometry):
+                    continue
+            res.append({k: r[k] for k in PRODUCT_COLUMNS})
+            if 0 <= limit <= len(res):
+                break
+        return res
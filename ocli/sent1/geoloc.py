@@ -1,11 +1,21 @@
+import logging
 import os
 from glob import glob
-from xml.dom.minidom import parse as xml_parse
+from typing import Dict, Optional
+from xml.etree.ElementTree import iterparse
 
 import geopandas as gpd
 import numpy as np
 from shapely.geometry import Polygon, MultiPoint
 
+from ocli.sent1.spatial import ProductIndex
+
+log = logging.getLogger()
+
+GEOLOC_CRS = {'init': 'epsg:4326'}
+""" burst index in-memory cache: product path -> (annotation mtime, {swath: grid}) """
+_burst_index = {}
+
 
 def xmlGetByPath(dom, path):
     nd = dom
@@ -16,6 +26,28 @@ def xmlGetByPath(dom, path):
     return nd
 
 
+def _grid_reshape(garr: np.ndarray) -> np.ndarray:
+    """ reshape list of (line,pixel,lon,lat) points into (azimuth,range,4) grid """
+    agrd = np.unique(garr[:, 0])
+    rgrd = np.unique(garr[:, 1])
+    garr = garr.reshape((agrd.size, rgrd.size, 4))
+    assert (np.all(garr[..., 0] == garr[:, 0, 0][:, np.newaxis]))
+    assert (np.all(garr[..., 1] == garr[0, :, 1][np.newaxis, :]))
+    return garr
+
+
+def _grid_bursts(garr: np.ndarray) -> gpd.GeoDataFrame:
+    """ burst polygons as convex hulls of neighbour azimuth grid lines, index starts from 1 """
+    bursts = []
+    for _y in range(garr.shape[0] - 1):
+        _burst = garr[_y:_y + 2].reshape(-1, 4)
+        bursts.append(MultiPoint(_burst[:, 2:4]))
+    df = gpd.GeoDataFrame(geometry=bursts, crs=GEOLOC_CRS)
+    df['geometry'] = df.convex_hull
+    df.index += 1  # make bursts start from 1
+    return df
+
+
 def get_geoloc(dom):
     ggrid = xmlGetByPath(dom, '/product/geolocationGrid/geolocationGridPointList')
     garr = []
@@ -25,12 +57,7 @@ def get_geoloc(dom):
         lat = float(node.getElementsByTagName('latitude')[0].childNodes[0].nodeValue)
         lon = float(node.getElementsByTagName('longitude')[0].childNodes[0].nodeValue)
         garr.append((l, p, lon, lat))
-    garr = np.array(garr)
-    agrd = np.unique(garr[:, 0])
-    rgrd = np.unique(garr[:, 1])
-    garr = garr.reshape((agrd.size, rgrd.size, 4))
-    assert (np.all(garr[..., 0] == garr[:, 0, 0][:, np.newaxis]))
-    assert (np.all(garr[..., 1] == garr[0, :, 1][np.newaxis, :]))
+    garr = _grid_reshape(np.array(garr))
     # swath = Polygon([garr[0, 0, 2:],
     #                  garr[0, -1, 2:],
     #                  garr[-1, -1, 2:],
@@ -40,41 +67,139 @@ def get_geoloc(dom):
     # LatLon = namedtuple('LatLon', ('lat', 'lon'))
     # bbox = (LatLon(garr[..., 2].min(), garr[..., 3].min()),
     #         LatLon(garr[..., 2].max(), garr[..., 3].max()))
-
-    bursts = []
-    for _y in range(garr.shape[0] - 1):
-        _burst = garr[_y:_y + 2].reshape(-1, 4)
-        bursts.append(MultiPoint(_burst[:, 2:4]))
-    df = gpd.GeoDataFrame(geometry=bursts, crs={'init': 'epsg:4326'})
-    df['geometry'] = df.convex_hull
-    df.index += 1  # make bursts start from 1
     # return bbox, swath, df
-    return df
+    return _grid_bursts(garr)
+
+
+def read_geoloc_grid(fname: str, skip_swath=()) -> (str, Optional[np.ndarray]):
+    """ stream annotation XML and extract swath and geolocation grid
+
+    :param fname: annotation XML file name
+    :param skip_swath: stop parsing (and return None as grid) if swath is one of these
+    :return: tuple(swath, grid as (azimuth,range,[line,pixel,lon,lat]) array)
+    """
+    swath = None
+    points = []
+    depth = 0
+    in_header = False
+    for event, elem in iterparse(fname, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if elem.tag == 'adsHeader' and depth == 2:
+                in_header = True
+            continue
+        depth -= 1
+        if in_header and elem.tag == 'swath':
+            swath = elem.text
+            if swath in skip_swath:
+                return swath, None
+        elif elem.tag == 'adsHeader':
+            in_header = False
+        elif elem.tag == 'geolocationGridPoint':
+            points.append((float(elem.findtext('line')),
+                           float(elem.findtext('pixel')),
+                           float(elem.findtext('longitude')),
+                           float(elem.findtext('latitude'))))
+            elem.clear()
+        if depth == 1:
+            """ top-level section is done, free memory """
+            elem.clear()
+    if swath is None or not points:
+        raise ValueError(f"{fname}: swath or geolocation grid not found")
+    return swath, _grid_reshape(np.array(points, dtype=np.float64))
+
+
+def _cache_file_name(path, cache_dir):
+    return os.path.join(cache_dir, os.path.basename(os.path.normpath(path)) + '.geoloc.npz')
+
 
+def burst_index(path: str, cache_dir: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """ geolocation grids for all product swaths
 
-def swath_table(path: str, roi: Polygon) -> 'gpd.pd.DataFrame':
+    grids are cached in memory and, if cache_dir is given, on disk. cache is invalidated by annotation files mtime
+
+    :param path: product (.SAFE) directory
+    :param cache_dir: directory for on-disk index
+    :return: {swath: grid}
+    """
+    xml_pathl = sorted(glob(os.path.join(path, 'annotation', '*.xml')))
+    mtime = max([os.path.getmtime(p) for p in xml_pathl], default=0)
+    _c = _burst_index.get(path)
+    if _c and _c[0] >= mtime:
+        return _c[1]
+    _cf = _cache_file_name(path, cache_dir) if cache_dir else None
+    if _cf and os.path.isfile(_cf) and os.path.getmtime(_cf) >= mtime:
+        try:
+            with np.load(_cf) as _npz:
+                grids = {k: _npz[k] for k in _npz.files}
+            _burst_index[path] = (mtime, grids)
+            return grids
+        except (OSError, ValueError) as e:
+            log.warning(f"Could not read burst index {_cf}: {e}")
+    grids = {}
+    for p in xml_pathl:
+        swath, grid = read_geoloc_grid(p, skip_swath=grids.keys())
+        if grid is not None:
+            grids[swath] = grid
+    if _cf and grids:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(_cf, **grids)
+        except OSError as e:
+            log.warning(f"Could not save burst index {_cf}: {e}")
+    _burst_index[path] = (mtime, grids)
+    return grids
+
+
+def burst_geometries(path: str, cache_dir: Optional[str] = None) -> gpd.GeoDataFrame:
+    """ all product bursts as GeoDataFrame with columns swath, burst, geometry  """
+    frames = []
+    for swath, grid in sorted(burst_index(path, cache_dir).items()):
+        df = _grid_bursts(grid)
+        df['swath'] = swath
+        df['burst'] = df.index
+        frames.append(df)
+    if not frames:
+        return gpd.GeoDataFrame(columns=['swath', 'burst', 'geometry'], geometry='geometry', crs=GEOLOC_CRS)
+    return gpd.GeoDataFrame(gpd.pd.concat(frames, ignore_index=True), geometry='geometry', crs=GEOLOC_CRS)
+
+
+def swath_fit(path: str, rois: gpd.GeoSeries, cache_dir: Optional[str] = None) -> 'gpd.pd.DataFrame':
+    """ burst/roi intersection fractions for many ROIs at once
+
+    :param path: product (.SAFE) directory
+    :param rois: GeoSeries of ROI polygons (EPSG:4326), index is used as roi key
+    :param cache_dir: directory for on-disk burst index
+    :return: DataFrame with columns roi, swath, burst, fit (0...1), only intersected pairs are returned
+    """
+    if (rois.area == 0).any():
+        raise ValueError("Zero area ROI is not allowed")
+    bursts = burst_geometries(path, cache_dir)
+    """ spatial index prefilter, exact intersections only for candidate pairs """
+    fit = ProductIndex(bursts.geometry).fit_many(rois).values
+    bp, rp = np.nonzero(fit > 0)
+    if not bp.size:
+        return gpd.pd.DataFrame(columns=['roi', 'swath', 'burst', 'fit'])
+    res = gpd.pd.DataFrame({
+        'roi': rois.index.values[rp],
+        'swath': bursts['swath'].values[bp],
+        'burst': bursts['burst'].values[bp],
+        'fit': fit[bp, rp],
+    })
+    return res.sort_values(['roi', 'swath', 'burst']).reset_index(drop=True)
+
+
+def swath_table(path: str, roi: Polygon, cache_dir: Optional[str] = None) -> 'gpd.pd.DataFrame':
     """ create Dataframe with Index as burst_id:
             IW1 burst's Polygon
             IW1_fit burst/roi intersection % (0...1)
     """
-    _gl = os.path.join(path, 'annotation', '*.xml')
-    # print(_gl)
-    xml_pathl = glob(_gl)
     if not roi.area:
         raise ValueError("Zero area ROI is not allowed")
-    processed = []
-    _df_joined = gpd.GeoDataFrame(crs={'init': 'epsg:4326'})  # type: gpd.GeoDataFrame
-    _df_joined.reset_index()
-    for p in xml_pathl:
-        dom = xml_parse(p)
-        _ra = roi.area
-        iw = xmlGetByPath(dom, '/product/adsHeader/swath').childNodes[0].nodeValue
-        if iw not in processed:
-            # print(f"# ---- {iw} {p} -----")
-            df = get_geoloc(dom)
-
-            _df_joined[iw] = df['geometry']
-            _df_joined[iw + '_fit'] = df['geometry'].convex_hull.intersection(roi).area / roi.area
-            # df[1:].plot(edgecolor='red', facecolor='green', ax=ax, legend=True)
-            processed.append(iw)
+    _df_joined = gpd.GeoDataFrame(crs=GEOLOC_CRS)  # type: gpd.GeoDataFrame
+    for iw, grid in sorted(burst_index(path, cache_dir).items()):
+        df = _grid_bursts(grid)
+        _df_joined[iw] = df['geometry']
+        """ swaths could have different number of bursts, fit is aligned by burst index as geometry """
+        _df_joined[iw + '_fit'] = gpd.pd.Series(ProductIndex(df['geometry']).fit(roi), index=df.index)
     return _df_joined
@@ -79,21 +79,36 @@ supported_sentinel_formats =  list(itertools.chain(supported_raw ,
                                                    supported_s2_msil1c))
 
 
+def extract_manifest(manifest: bytes, filename: str) -> dict:
+    """ stateless manifest.safe parser
+
+    :param manifest: manifest.safe content
+    :param filename: product name (used to resolve product type)
+    :raises AssertionError: on broken manifest or unknown product type
+    """
+    try:
+        root = etree.fromstring(manifest)
+    except etree.XMLSyntaxError as e:
+        raise AssertionError(f"{e}")
+    return SentinelMetadataExtractor(root).extractMetadataFromManifestFiles(filename)
+
+
 class SentinelMetadataExtractor:
-    filepath = ''
-    tree = ""
+    """ all state is kept per instance, so instances could be used concurrently (one per thread/process) """
     root: Element = None
-    file_error_count = 0
-    filenames_error = []
-    total_files = 0
-    productMetadata = {}
-    productMetadataEtrees = {}
 
-    def __init__(self):
-        pass
+    def __init__(self, root: Element = None):
+        self.filepath = ''
+        self.tree = ""
+        self.root = root
+        self.file_error_count = 0
+        self.filenames_error = []
+        self.total_files = 0
+        self.productMetadata = {}
+        self.productMetadataEtrees = {}
 
     def extractMetadataFromManifestFiles(self, filename):
-        '''main method for metadata extarction'''
+        '''main method for metadata extarction, returns extracted metadata'''
 
         #####all this names represent files succesfully parsed with this program
 
@@ -102,24 +117,29 @@ class SentinelMetadataExtractor:
             if re.match(sentinel_name, filename):
                 self.productMetadata = self._extractGR()
                 processed = True
+                break
 
         for sentinel_name in supported_raw:
             if re.match(sentinel_name, filename):
                 self.productMetadata = self._extractRAW()
                 processed = True
+                break
 
         for sentinel_name in supported_s2_msil1c:
             if re.match(sentinel_name, filename):
                 self.productMetadata = self._extractS2MSIL1C()
                 processed = True
+                break
         for sentinel_name in supported_s2:
             if re.match(sentinel_name, filename):
                 self.productMetadata = self._extractS2()
                 processed = True
+                break
         for sentinel_name in supported_ocn:
             if re.match(sentinel_name, filename):
                 self.productMetadata = self._extractIWOCN()
                 processed = True
+                break
         if processed:
             # transform coordinates to geojson geometry
             pass
@@ -127,6 +147,7 @@ class SentinelMetadataExtractor:
             self.file_error_count = self.file_error_count + 1
             self.filenames_error.append(str(filename))
             raise AssertionError("FILE NOT IN KNOWN FILES - " + str(filename))
+        return self.productMetadata
 
     def _transformSolrCoordsToSAFECoords(self, coords):
         '''receives coordinates in solr format and parses to the one in SAFE format for further processing
@@ -175,7 +196,7 @@ class SentinelMetadataExtractor:
         return final_list  # lat,long
 
     def _extractS2(self):
-        log.info(f"Manifest resolved as S2 Common")
+        log.debug(f"Manifest resolved as S2 Common")
         metadata = {}
         ###############S1A_S3_GRDH_1SDH###############S1A_IW_SLC__1SSV###############S1A_IW__1SSH###############S1A_IW_SLC__1SDV
         ###############S1A_IW_SLC__1SDH###############S1A_IW_GRDH_1SSV###############S1A_IW_GRDH_1SSH###############S1A_IW_GRDH_1SDV
@@ -206,7 +227,7 @@ class SentinelMetadataExtractor:
         return metadata
 
     def _extractS2MSIL1C(self):
-        log.info(f"Manifest resolved as MSIL1C")
+        log.debug(f"Manifest resolved as MSIL1C")
         metadata = {}
         extracted = self.root.findall(
             './metadataSection/metadataObject/metadataWrap/xmlData/safe:acquisitionPeriod/safe:startTime',
@@ -235,7 +256,7 @@ class SentinelMetadataExtractor:
         return metadata
 
     def _extractGR(self):
-        log.info(f"Manifest resolved as GR")
+        log.debug(f"Manifest resolved as GR")
         metadata = {}
         ###############S1A_S3_GRDH_1SDH###############S1A_IW_SLC__1SSV###############S1A_IW__1SSH###############S1A_IW_SLC__1SDV
         ###############S1A_IW_SLC__1SDH###############S1A_IW_GRDH_1SSV###############S1A_IW_GRDH_1SSH###############S1A_IW_GRDH_1SDV
@@ -309,7 +330,7 @@ class SentinelMetadataExtractor:
         return metadata
 
     def _extractRAW(self):
-        log.info(f"Manifest resolved as RAW")
+        log.debug(f"Manifest resolved as RAW")
         metadata = {}
         ###############S1A_S3_RAW__0SDH###############S1A_IW_RAW__0SSV###############S1A_IW_RAW__0SSH###############S1A_IW_RAW__0SDV
         ###############S1A_IW_RAW__0SDH###############S1A_EW_RAW__0SDH
@@ -374,7 +395,7 @@ class SentinelMetadataExtractor:
         return metadata
 
     def _extractIWOCN(self):
-        log.info(f"Manifest resolved as IWOCN")
+        log.debug(f"Manifest resolved as IWOCN")
         metadata = {}
         ###############S1A_IW_OCN__2SDV
         extracted = self.root.findall(
@@ -1,18 +1,36 @@
+import logging
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Optional
+
+import numpy as np
 import pandas as pd
 import requests
 from dateutil.parser import parse
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+log = logging.getLogger()
 
-RESORB_URL = 'https://step.esa.int/auxdata/orbits/Sentinel-1/RESORB'
-POEORB_URL = 'https://step.esa.int/auxdata/orbits/Sentinel-1/POEORB'
+ORBITS_URL = 'https://step.esa.int/auxdata/orbits/Sentinel-1'
+RESORB_URL = ORBITS_URL + '/RESORB'
+POEORB_URL = ORBITS_URL + '/POEORB'
+""" concurrent catalogue requests """
+SYNC_WORKERS = 8
+""" preferred orbit types first """
+ORBIT_TYPES = ('POEORB', 'RESORB')
+COLUMNS = ['filename', 'catalog_date', 'mission', 'orbit_type', 'valid_start', 'valid_end', 'url']
 
 __data = None
 __data_dir = './GeoDataFrame'
-__data_filename = os.path.join(__data_dir, 'orbits.pkl')
+__data_filename = os.path.join(__data_dir, 'orbits.parquet')
+_FILENAME_RE = re.compile(r"href=\"([^\"]*\.zip)\"")
+_VALIDITY_RE = r'_V(\d{8}T\d{6})_(\d{8}T\d{6})\.'
 
 
-def build_path(mission, orbit_type, date):
+def build_path(mission, orbit_type, date, base_url=None):
     """Build URL to scrap orbit files
 
 
@@ -22,14 +40,29 @@ def build_path(mission, orbit_type, date):
     :type date: str
     :param mission: S1A|S1B
     :type mission: str
+    :param base_url: override ORBITS_URL
     """
     year = date[0:4]
     month = date[4:6]
-    path = POEORB_URL if orbit_type == 'POEORB' else RESORB_URL
+    if base_url:
+        path = f"{base_url}/{orbit_type}"
+    else:
+        path = POEORB_URL if orbit_type == 'POEORB' else RESORB_URL
     path = f"{path}/{mission}/{year}/{month}"
     return path
 
 
+def orbit_session(pool_size=SYNC_WORKERS) -> requests.Session:
+    """ session with connection pool for concurrent catalogue requests """
+    session = requests.Session()
+    retry = Retry(total=3, connect=3, read=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Accept': "*/*", 'Cache-Control': "no-cache"})
+    return session
+
+
 def get_valid_start(row: pd.Series):
     """ extract START date from filename  field of DataFrane
         S1A_OPER_AUX_POEORB_OPOD_20190422T120811_V20190401T225942_20190403T005942.EOF.zip
@@ -50,7 +83,20 @@ def get_valid_end(row: pd.Series):
     return parse(st + 'Z')  # +'Z' to fit UTC
 
 
-def __get_df(mission, orbit_type, date):
+def parse_listing(html: str, url: str, mission, orbit_type, date) -> pd.DataFrame:
+    """ orbit files from catalogue directory listing, validity dates are parsed vectorized """
+    df = pd.DataFrame(_FILENAME_RE.findall(html), columns=['filename'])
+    df['catalog_date'] = date
+    df['mission'] = mission
+    df['orbit_type'] = orbit_type
+    _v = df['filename'].str.extract(_VALIDITY_RE)
+    df['valid_start'] = pd.to_datetime(_v[0], format='%Y%m%dT%H%M%S', utc=True)
+    df['valid_end'] = pd.to_datetime(_v[1], format='%Y%m%dT%H%M%S', utc=True)
+    df['url'] = url + '/' + df['filename']
+    return df
+
+
+def __get_df(mission, orbit_type, date, session=None, base_url=None):
     """get mission orbits
 
 
@@ -60,36 +106,17 @@ def __get_df(mission, orbit_type, date):
     :type date: str
     :param mission: S1A|S1B
     :type mission: str
+    :param session: requests session, new one is created if None
+    :param base_url: override ORBITS_URL
+    :return: DataFrame or None if catalogue is not found
     """
-    url = build_path(mission=mission, orbit_type=orbit_type, date=date)
-    print(f"loading orbits: {url}")
-    payload = ""
-    headers = {
-        # 'User-Agent': "PostmanRuntime/7.11.0",
-        'Accept': "*/*",
-        'Cache-Control': "no-cache",
-        # 'Postman-Token': "4b229046-9c16-436a-bf1f-c36c36c3685b,db914d16-1a5a-40b3-86ea-a24889ca4427",
-        # 'Host': "step.esa.int",
-        # 'accept-encoding': "gzip, deflate",
-        # 'content-length': "",
-        # 'Connection': "keep-alive",
-        'cache-control': "no-cache"
-    }
-
-    r = requests.request("HEAD", url, data=payload, headers=headers)
+    url = build_path(mission=mission, orbit_type=orbit_type, date=date, base_url=base_url)
+    log.debug(f"loading orbits: {url}")
+    """ single GET, HEAD request does not save anything for directory listings """
+    r = (session or orbit_session(1)).get(url)
     if r.status_code != 200:
         return None
-    r = requests.request("GET", url, data=payload, headers=headers)
-    html = r.content.decode("utf-8")
-    reg = r"href=\"(.*\.zip)\""
-    df = pd.DataFrame(re.findall(reg, html), columns=['filename'])
-    df['catalog_date'] = date
-    df['mission'] = mission
-    df['orbit_type'] = orbit_type
-    df['valid_start'] = df.apply(get_valid_start, axis=1)
-    df['valid_end'] = df.apply(get_valid_end, axis=1)
-    df['url'] = url + '/' + df['filename']
-    return df
+    return parse_listing(r.content.decode("utf-8"), url, mission, orbit_type, date)
 
 
 def get_res(mission, date):
@@ -116,7 +143,32 @@ def get_poe(mission, date):
     return __get_df(mission=mission, orbit_type='POEORB', date=date)
 
 
-def sync_orbits(force=False, dates=None, orbit_types=None, missions=None):
+def _empty() -> pd.DataFrame:
+    df = pd.DataFrame(columns=COLUMNS)
+    for c in ['valid_start', 'valid_end']:
+        df[c] = pd.to_datetime(df[c], utc=True)
+    return df
+
+
+def read_cache(cache_file_name=__data_filename) -> Optional[pd.DataFrame]:
+    """ read orbits catalogue, legacy pickle cache (orbits.pkl) is read if columnar one does not exist """
+    if os.path.isfile(cache_file_name):
+        return pd.read_parquet(cache_file_name)
+    _pkl = os.path.splitext(cache_file_name)[0] + '.pkl'
+    if os.path.isfile(_pkl):
+        return pd.read_pickle(_pkl)
+    return None
+
+
+def save_cache(df: pd.DataFrame, cache_file_name=__data_filename):
+    os.makedirs(os.path.dirname(cache_file_name) or '.', exist_ok=True)
+    _tmp = cache_file_name + '.tmp'
+    df.to_parquet(_tmp, index=False)
+    os.replace(_tmp, cache_file_name)
+
+
+def sync_orbits(force=False, dates=None, orbit_types=None, missions=None,
+                workers=SYNC_WORKERS, cache_file_name=__data_filename, base_url=None):
     global __data
     """ sync local orbits cache
         if force is False and some data present for Date/mission/orbit_type
@@ -128,47 +180,107 @@ def sync_orbits(force=False, dates=None, orbit_types=None, missions=None):
         :param orbit_types: list of orbit types POEORB|RESORB to sync
         :type force: bool
         :param force: forse sync for given dates
+        :param workers: concurrent catalogue requests
+        :param base_url: override ORBITS_URL
     """
-    do_save = False
-    if missions is None:
-        missions = []
-    if orbit_types is None:
-        orbit_types = []
-    if dates is None:
-        dates = []
-    if os.path.isfile(__data_filename):
-        __data = pd.read_pickle(__data_filename)
-    else:
-        os.makedirs(__data_dir, exist_ok=True)
-        __data = pd.DataFrame(columns=['filename', 'catalog_date', 'mission', 'orbit_type', 'valid_start',
-                                       'valid_end', 'url'])
-        do_save = True
+    __data = read_cache(cache_file_name)
+    do_save = __data is None or not os.path.isfile(cache_file_name)
+    if __data is None:
+        __data = _empty()
+    _keys = set(zip(__data['catalog_date'], __data['mission'], __data['orbit_type']))
     # Do we need to load data?
-    for date in dates:
-        for orbit_type in orbit_types:
-            for mission in missions:
-                do_load = False
-                ds = __data[(__data['catalog_date'] == date) & (__data['mission'] == mission) & (
-                        __data['orbit_type'] == orbit_type)]
-                if ds.empty:
-                    do_load = True
-                else:
-                    if force:
-                        """ delete old data """
-                        __data.drop(ds.index)
-                        do_load = True
-                if do_load:
-                    do_save = True
-                    df = __get_df(mission=mission, date=date, orbit_type=orbit_type)
-                    if df is not None:
-                        __data = pd.concat([__data, df], ignore_index=True)
-                else:
-                    print(f"orbits cache hit {mission} {orbit_type} {date}")
+    to_load = []
+    for date, orbit_type, mission in product(dates or [], orbit_types or [], missions or []):
+        if (date, mission, orbit_type) not in _keys or force:
+            to_load.append((date, orbit_type, mission))
+        else:
+            log.debug(f"orbits cache hit {mission} {orbit_type} {date}")
+    if to_load:
+        do_save = True
+        if force:
+            """ delete old data """
+            _k = pd.MultiIndex.from_arrays([__data['catalog_date'], __data['mission'], __data['orbit_type']])
+            _drop = pd.MultiIndex.from_tuples([(d, m, o) for d, o, m in to_load])
+            __data = __data[~_k.isin(_drop)]
+        session = orbit_session(max(1, workers))
+
+        def _load(k):
+            date, orbit_type, mission = k
+            return __get_df(mission=mission, date=date, orbit_type=orbit_type, session=session, base_url=base_url)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            frames = [df for df in ex.map(_load, to_load) if df is not None]
+        __data = pd.concat([__data, *frames], ignore_index=True)
     if do_save:
-        __data.to_pickle(__data_filename)
+        save_cache(__data, cache_file_name)
     return __data
 
 
+class OrbitIndex(object):
+    """ interval index over orbit files validity [valid_start, valid_end]
+
+    per mission/orbit type intervals are sorted by valid_start, running max of valid_end
+    stops backward scan as soon as no earlier interval could cover the acquisition
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data.reset_index(drop=True)
+        self._groups = {}
+        for (mission, orbit_type), pos in self.data.groupby(['mission', 'orbit_type']).indices.items():
+            start = self.data['valid_start'].values[pos].astype('datetime64[ns]').astype(np.int64)
+            end = self.data['valid_end'].values[pos].astype('datetime64[ns]').astype(np.int64)
+            o = np.argsort(start, kind='stable')
+            self._groups[(mission, orbit_type)] = (start[o], end[o], np.maximum.accumulate(end[o]), pos[o])
+
+    @staticmethod
+    def _ns(t) -> int:
+        return pd.Timestamp(t).tz_convert('UTC').value if pd.Timestamp(t).tzinfo else pd.Timestamp(t).value
+
+    def _find(self, mission, orbit_type, start: int, stop: int) -> Optional[int]:
+        g = self._groups.get((mission, orbit_type))
+        if g is None:
+            return None
+        _s, _e, _max_e, pos = g
+        i = np.searchsorted(_s, start, 'right') - 1
+        """ prefer the latest produced file: scan from the latest start backward """
+        while i >= 0 and _max_e[i] >= stop:
+            if _e[i] >= stop:
+                return pos[i]
+            i -= 1
+        return None
+
+    def find(self, mission, start, stop=None, orbit_types=ORBIT_TYPES) -> Optional[pd.Series]:
+        """ orbit file record which covers acquisition [start, stop], orbit_types in preference order
+
+        :param start: acquisition start (naive datetime is treated as UTC)
+        :param stop: acquisition stop, default is start
+        """
+        _s = self._ns(start)
+        _e = self._ns(stop) if stop is not None else _s
+        for orbit_type in orbit_types:
+            p = self._find(mission, orbit_type, _s, _e)
+            if p is not None:
+                return self.data.iloc[p]
+        return None
+
+    def find_many(self, missions, starts, stops=None, orbit_types=ORBIT_TYPES) -> pd.DataFrame:
+        """ bulk find, returns orbit records (NaN where not found) aligned with starts """
+        stops = starts if stops is None else stops
+        pos = []
+        for m, s, e in zip(missions, starts, stops):
+            _s, _e = self._ns(s), self._ns(e)
+            p = None
+            for orbit_type in orbit_types:
+                p = self._find(m, orbit_type, _s, _e)
+                if p is not None:
+                    break
+            pos.append(-1 if p is None else p)
+        pos = np.array(pos, dtype=np.intp)
+        res = self.data.reindex(pos)
+        res.index = range(len(pos))
+        return res
+
+
 def load_orbits(reload=False, dates=[]):
     if not reload and len(dates):
         raise ValueError("dates should be provided only on reload=True")
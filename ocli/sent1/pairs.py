@@ -3,13 +3,13 @@
 """
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 from urllib.parse import quote, urlencode
 
 import geopandas as gpd
 import pandas
 import requests
-from dateutil.parser import parse
 from requests import Request
 from requests.adapters import HTTPAdapter
 from shapely.geometry import Polygon
@@ -33,7 +33,7 @@ payload_defautl_dias = {
     'productType': 'SLC',
     'sensorMode': 'IW',
     'processingLevel': 'LEVEL1',
-    'maxRecords': 100,  # TODO pass in CLI
+    'maxRecords': 100,  # could be overridden by finder config
     # 'completionDate': '2019-05-13T00:00:00Z',
     'startDate': '2019-01-01T00:00:00Z',
     'sortParam': 'startDate',
@@ -45,6 +45,11 @@ payload_defautl_dias = {
 """
 DIAS Finder params
 """
+FINDER_URL = 'https://finder.creodias.eu/resto/api/collections/{collection}/search.json'
+""" concurrent page requests """
+FINDER_WORKERS = 4
+""" products are unique by this column when incremental results are merged into cache """
+PRODUCT_KEY = 'productIdentifier'
 
 
 def fix_esri_names(data):
@@ -91,7 +96,7 @@ def pp_json(json_thing, sort=False, indents=4):
     return None
 
 
-def retry_session():
+def retry_session(pool_size=10):
     # This will give the total wait time in minutes:
     # >>> sum([min((0.3 * (2 ** (i - 1))), 120) / 60 for i in range(24)])
     # >>> 30.5575
@@ -107,8 +112,8 @@ def retry_session():
         status_forcelist=(500, 502, 504),
         method_whitelist=('GET', 'POST'),
     )
-    adapter = HTTPAdapter(max_retries=retry)
-    # session.mount('http://', adapter)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
@@ -121,7 +126,8 @@ default_cols = {
 }
 
 
-def add_data(res: Dict):
+def page_frame(res: Dict) -> gpd.GeoDataFrame:
+    """ finder response page to GeoDataFrame """
     gdf = gpd.GeoDataFrame(crs=QPROJ)
     ''' You can pass the json directly to the GeoDataFrame constructor: '''
     gdf = gdf.from_features(res['features'], crs=QPROJ)
@@ -135,8 +141,11 @@ def add_data(res: Dict):
     for k, v in default_cols.items():
         if not k in cols:
             gdf[k] = v
+    return gdf
+
 
-    return gpd.GeoDataFrame(pandas.concat([sent1.__data, gdf], ignore_index=True), crs=QPROJ)
+def add_data(res: Dict):
+    return gpd.GeoDataFrame(pandas.concat([sent1.__data, page_frame(res)], ignore_index=True), crs=QPROJ)
 
 
 def data_witening(data):
@@ -151,14 +160,30 @@ def data_witening(data):
 def __getRequest(payload):
     payload = dict({**payload_defautl_dias, **payload})
     collection = payload.pop('collection', 'Sentinel1')
+    url = payload.pop('url', FINDER_URL)
     qry = urlencode(payload, quote_via=quote)
     # TODO check collection is valid for payload.source
-    p = Request('GET', f'https://finder.creodias.eu/resto/api/collections/{collection}/search.json?' + qry,
+    p = Request('GET', url.format(collection=collection) + '?' + qry,
                 # params=payload
                 ).prepare()
     return p
 
 
+DATE_COLUMNS = ['completionDate', 'startDate', 'updated']
+""" columnar cache formats by file extension, anything else is treated as ESRI Shapefile """
+CACHE_FORMATS = {
+    '.parquet': (gpd.read_parquet, 'to_parquet'),
+    '.feather': (gpd.read_feather, 'to_feather'),
+}
+
+
+def fix_dates(data: gpd.GeoDataFrame):
+    """ convert finder date strings to DateTime (UTC) in-place """
+    for c in DATE_COLUMNS:
+        if c in data.columns:
+            data[c] = pandas.to_datetime(data[c], utc=True)
+
+
 def fix_esri(data: gpd.GeoDataFrame):
     """ fix fiona.errors.DriverSupportError: ESRI Shapefile does not support datetime fields
     save dates as string, but return dataset with DateTime
@@ -167,50 +192,169 @@ def fix_esri(data: gpd.GeoDataFrame):
     :return: dataframe with converted str->DateTime
     """
     fix_esri_names(data)
-    data['completionDate'] = data['completionDate'].apply(parse)
-    data['startDate'] = data['startDate'].apply(parse)
-    data['updated'] = data['updated'].apply(parse)
+    fix_dates(data)
+
+
+def legacy_cache_file_name(cache_file_name):
+    """ ESRI Shapefile cache name used before columnar formats """
+    return os.path.splitext(cache_file_name)[0] + '.shp'
+
+
+def cache_exists(cache_file_name) -> bool:
+    return os.path.isfile(cache_file_name) or os.path.isfile(legacy_cache_file_name(cache_file_name))
+
+
+def save_to_cache(data: gpd.GeoDataFrame, cache_file_name):
+    """ write products list, dates should be already converted with fix_dates """
+    _fmt = CACHE_FORMATS.get(os.path.splitext(cache_file_name)[1])
+    os.makedirs(os.path.dirname(cache_file_name), exist_ok=True)
+    log.debug(f'updating cache {cache_file_name}')
+    if _fmt is None:
+        _d = data.copy()
+        for c in DATE_COLUMNS:
+            if c in _d.columns:
+                _d[c] = _d[c].astype(str)
+        _d.to_file(cache_file_name)
+    else:
+        """ write to temporary file, so readers never see partially written cache """
+        _tmp = cache_file_name + '.tmp'
+        getattr(data, _fmt[1])(_tmp)
+        os.replace(_tmp, cache_file_name)
+
+
+def _get_page(session, p) -> Dict:
+    log.debug(f"Downloading {p.url}")
+    r = session.send(p)
+    r.raise_for_status()
+    return r.json()
+
+
+def _next_link(res: Dict):
+    _next = next((x for x in res['properties'].get('links', []) if x.get('rel') == 'next'), None)
+    return None if _next is None else Request('GET', _next.get('href')).prepare()
 
 
+def fetch_pages(finder_conf: Dict, callback=None, workers=FINDER_WORKERS) -> list:
+    """ download all finder result pages
 
-def __load_data(roi: Polygon, finder_conf={}, callback=None, cache_file_name=None):
+    first page gives total results count, rest of pages are requested concurrently with 'page' parameter.
+    If total is unknown pages are followed by 'next' links one by one.
+
+    :param finder_conf: finder query params, 'url' could be used to override finder endpoint
+    :param callback: progress callback(total, items_per_page)
+    :param workers: max concurrent requests
+    :return: list of page responses (json) in page order
+    """
+    session = retry_session(pool_size=max(1, workers))
+    res = _get_page(session, __getRequest(finder_conf))
+    pages = [res]
+    total = res['properties'].get('totalResults')
+    per_page = res['properties'].get('itemsPerPage')
+    if callback is not None and per_page:
+        callback(total, per_page)
+    if not per_page:
+        return pages
+    if total is None or _next_link(res) is None:
+        """ count is unknown - sequential """
+        p = _next_link(res)
+        while p is not None:
+            res = _get_page(session, p)
+            if res['properties'].get('itemsPerPage'):
+                pages.append(res)
+                if callback is not None:
+                    callback(total, res['properties']['itemsPerPage'])
+            p = _next_link(res)
+        return pages
+    """ finder could cap requested maxRecords, page size of the first response is used """
+    page_size = int(per_page)
+    n_pages = -(-int(total) // page_size)
+
+    def _page(n):
+        return _get_page(session, __getRequest({**finder_conf, 'page': n}))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        for res in ex.map(_page, range(2, n_pages + 1)):
+            if res['properties'].get('itemsPerPage'):
+                pages.append(res)
+                if callback is not None:
+                    callback(total, res['properties']['itemsPerPage'])
+    return pages
+
+
+def __load_data(roi: Polygon, finder_conf={}, callback=None, cache_file_name=None, workers=FINDER_WORKERS):
     finder_conf['geometry'] = roi.wkt
     log.debug(roi.wkt)
     log.debug(f"searching {finder_conf}")
     try:
-        p = __getRequest(finder_conf)
-        while True:
-            log.debug(f"Downloading {p.url}")
-            r = retry_session().send(p)
-            res = r.json()
-
-            if res['properties']['itemsPerPage']:
-                if callback is not None:
-                    callback(res['properties']['totalResults'], res['properties']['itemsPerPage'])
-                sent1.__data = add_data(res)
-            """ check we have more data to GET """
-            _next = next((x for x in res['properties']['links'] if x.get('rel') == 'next'), None)
-            if _next is None:
-                break
-            p = Request('GET', _next.get('href')).prepare()
-        if not sent1.__data.empty:
-            data_witening(sent1.__data)
-            if cache_file_name:
-                os.makedirs(os.path.dirname(cache_file_name), exist_ok=True)
-                log.debug(f'updating cache {cache_file_name}')
-                sent1.__data.to_file(cache_file_name)
-            fix_esri(sent1.__data)
-        return sent1.__data
+        frames = [page_frame(res) for res in fetch_pages(finder_conf, callback=callback, workers=workers)
+                  if res['features']]
+        if frames:
+            """ single concat, pages could overlap if finder data were changed while loading """
+            data = gpd.GeoDataFrame(pandas.concat(frames, ignore_index=True), crs=QPROJ)
+            if PRODUCT_KEY in data.columns:
+                data.drop_duplicates(subset=[PRODUCT_KEY], inplace=True, ignore_index=True)
+            data_witening(data)
+            fix_dates(data)
+        else:
+            data = gpd.GeoDataFrame(crs=QPROJ)
+        sent1.__data = data
+        if cache_file_name and not data.empty:
+            save_to_cache(data, cache_file_name)
+        return data
     except Exception as e:
         log.error(f'{e.__class__}{e}')
         raise RuntimeError(e)
 
 
+def __update_data(roi: Polygon, finder_conf={}, callback=None, cache_file_name=None, workers=FINDER_WORKERS):
+    """ load only products updated after newest cached 'updated' and merge them into cache """
+    cached = load_from_cache(cache_file_name, roi)
+    if cached.empty or 'updated' not in cached.columns:
+        return __load_data(roi, finder_conf, callback, cache_file_name, workers)
+    last = cached['updated'].max()
+    finder_conf['updated'] = last.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    log.debug(f"loading products updated after {finder_conf['updated']}")
+    data = __load_data(roi, finder_conf, callback, cache_file_name=None, workers=workers)
+    if not data.empty:
+        """ finder may treat 'updated' as inclusive """
+        data = data[data['updated'] > last]
+    if data.empty:
+        sent1.__data = cached
+        return cached
+    log.info(f"{len(data)} new or updated products")
+    data = gpd.GeoDataFrame(pandas.concat([data, cached], ignore_index=True), crs=QPROJ)
+    data.drop_duplicates(subset=[PRODUCT_KEY], keep='first', inplace=True, ignore_index=True)
+    data.sort_values(by=['startDate'], ascending=False, inplace=True, ignore_index=True)
+    sent1.__data = data
+    save_to_cache(data, cache_file_name)
+    return data
+
+
+def _migrate_cache(cache_file_name) -> gpd.GeoDataFrame:
+    """ convert legacy ESRI Shapefile cache into columnar cache_file_name """
+    _shp = legacy_cache_file_name(cache_file_name)
+    log.info(f'migrating products cache {_shp} -> {cache_file_name}')
+    data = gpd.GeoDataFrame.from_file(_shp)
+    fix_esri(data)
+    try:
+        save_to_cache(data, cache_file_name)
+    except OSError as e:
+        log.warning(f'Could not migrate products cache: {e}')
+    return data
+
+
 def load_from_cache(cache_file_name, geometry=None) -> gpd.GeoDataFrame:
     # TODO return warning if cache is not for geometry
     try:
         # log.error(cache_file_name)
-        data = gpd.GeoDataFrame.from_file(cache_file_name)
+        _fmt = CACHE_FORMATS.get(os.path.splitext(cache_file_name)[1])
+        if _fmt is None:
+            data = gpd.GeoDataFrame.from_file(cache_file_name)
+            fix_esri(data)
+        elif os.path.isfile(cache_file_name):
+            data = _fmt[0](cache_file_name)
+        else:
+            data = _migrate_cache(cache_file_name)
         valid = False
         try:
             with open(os.path.join(cache_file_name, '.roi'), 'r') as _f:
@@ -221,19 +365,32 @@ def load_from_cache(cache_file_name, geometry=None) -> gpd.GeoDataFrame:
         if not valid:
             pass
             # log.error("_md is invalid")
-        fix_esri(data)
         return data
     except Exception as e:
         log.fatal(e)
         raise RuntimeError(e)
 
 
-def load_data(geometry: Polygon, reload=True, callback=None, finder_conf={}, cache_file_name=sent1.__data_filename):
-    if reload or not os.path.isfile(cache_file_name):
+def load_data(geometry: Polygon, reload=True, callback=None, finder_conf={}, cache_file_name=sent1.__data_filename,
+              incremental=False, workers=FINDER_WORKERS):
+    """ load products from cache or finder
+
+    :param reload: query finder even if cache exists
+    :param incremental: with reload, query only products updated after newest cached one and merge into cache
+    :param workers: max concurrent finder requests
+    """
+    if reload and incremental and cache_file_name and cache_exists(cache_file_name):
+        data = __update_data(geometry,
+                             callback=callback,
+                             finder_conf=finder_conf,
+                             cache_file_name=cache_file_name,
+                             workers=workers)
+    elif reload or not cache_exists(cache_file_name):
         data = __load_data(geometry,
                            callback=callback,
                            finder_conf=finder_conf,
-                           cache_file_name=cache_file_name)
+                           cache_file_name=cache_file_name,
+                           workers=workers)
     else:
         data = load_from_cache(cache_file_name, geometry)
     return data
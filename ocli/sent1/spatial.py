@@ -0,0 +1,123 @@
+"""
+Spatial queries over products (or bursts) footprints.
+
+ROI fit is a fraction of ROI area covered by footprint (0...1).
+Candidates are prefiltered with geopandas STRtree spatial index (shapely 2 or pygeos),
+otherwise with vectorized bbox test: rtree index build is slower than bbox scan of whole products list.
+Exact intersections are computed only for candidates.
+"""
+import logging
+from hashlib import sha1
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from cachetools import LRUCache
+from geopandas import GeoSeries
+from pandas import DataFrame
+from shapely.geometry import Polygon
+
+log = logging.getLogger()
+
+""" max elements of roi x footprint bbox test matrix computed at once """
+_BBOX_CHUNK = 10 ** 7
+
+
+def _strtree_sindex() -> bool:
+    return int(shapely.__version__.split('.')[0]) >= 2 or getattr(gpd.options, 'use_pygeos', False)
+
+
+def roi_key(geometry: Polygon) -> str:
+    return sha1(geometry.wkb).hexdigest()
+
+
+def _check_area(rois: GeoSeries):
+    if (rois.area == 0).any():
+        raise AssertionError('ROI has zero area')
+
+
+class ProductIndex(object):
+    """ spatial index over footprints with cached per-ROI fit
+
+    :param geometry: footprints, results are in the same order
+    :param cache_size: number of ROIs to keep fit for
+    """
+    log = logging.getLogger('ProductIndex')
+
+    def __init__(self, geometry: GeoSeries, cache_size=64):
+        self.geometry = geometry
+        self._bounds = geometry.bounds.values if len(geometry) else np.empty((0, 4))
+        self._sindex = None
+        self._fit = LRUCache(maxsize=cache_size)
+
+    def __len__(self):
+        return len(self.geometry)
+
+    def _has_sindex(self) -> bool:
+        if self._sindex is None:
+            self._sindex = False
+            if _strtree_sindex():
+                try:
+                    self._sindex = self.geometry.sindex is not None
+                except ImportError as e:
+                    self.log.debug(f"spatial index is not available, using bbox prefilter: {e}")
+        return self._sindex
+
+    def _bbox_pairs(self, rois: GeoSeries) -> (np.ndarray, np.ndarray):
+        """ (roi positions, footprint positions) with intersected bounding boxes """
+        b = self._bounds
+        rb = rois.bounds.values
+        step = max(1, _BBOX_CHUNK // max(1, len(b)))
+        rp, gp = [], []
+        for i in range(0, len(rb), step):
+            r = rb[i:i + step]
+            hit = ((b[:, 0][None, :] <= r[:, 2][:, None]) & (b[:, 2][None, :] >= r[:, 0][:, None]) &
+                   (b[:, 1][None, :] <= r[:, 3][:, None]) & (b[:, 3][None, :] >= r[:, 1][:, None]))
+            _r, _g = np.nonzero(hit)
+            rp.append(_r + i)
+            gp.append(_g)
+        return np.concatenate(rp), np.concatenate(gp)
+
+    def query(self, rois: GeoSeries) -> (np.ndarray, np.ndarray):
+        """ candidate pairs (roi positions, footprint positions) which could intersect """
+        if not len(self) or not len(rois):
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        if self._has_sindex():
+            _si = self.geometry.sindex
+            """ geopandas >= 0.12 accepts arrays in query, query_bulk is deprecated """
+            res = _si.query(rois.values, predicate='intersects') if _strtree_sindex() and not hasattr(_si, 'query_bulk') \
+                else _si.query_bulk(rois.values, predicate='intersects')
+            return res[0], res[1]
+        return self._bbox_pairs(rois)
+
+    def fit_many(self, rois: GeoSeries) -> DataFrame:
+        """ fit of every footprint for every ROI, single batched query
+
+        :param rois: ROI polygons, index is used as columns
+        :return: DataFrame indexed as geometry, one column per ROI
+        """
+        _check_area(rois)
+        res = np.zeros((len(self), len(rois)), dtype=np.float64)
+        rp, gp = self.query(rois)
+        if rp.size:
+            _g = GeoSeries(self.geometry.values[gp])
+            _r = GeoSeries(rois.values[rp])
+            res[gp, rp] = _g.intersection(_r).area.values / _r.area.values
+        return DataFrame(res, index=self.geometry.index, columns=rois.index)
+
+    def fit(self, roi: Polygon) -> np.ndarray:
+        """ fit of every footprint for ROI, results are cached by ROI geometry """
+        _k = roi_key(roi)
+        res = self._fit.get(_k)
+        if res is None:
+            res = self.fit_many(GeoSeries([roi])).values[:, 0]
+            self._fit[_k] = res
+        return res.copy()
+
+    def intersects(self, roi: Polygon) -> np.ndarray:
+        """ positions of footprints intersecting ROI """
+        rp, gp = self.query(GeoSeries([roi]))
+        if not gp.size:
+            return gp
+        gp = np.sort(gp)
+        return gp[self.geometry.iloc[gp].intersects(roi).values]
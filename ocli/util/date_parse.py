@@ -1,6 +1,5 @@
-import dateparser
-
-
 def parse_to_utc_string(s:str)->str:
+    """ dateparser import is slow, it is loaded on first use """
+    import dateparser
     value = dateparser.parse(s,settings={ 'TO_TIMEZONE': 'UTC'})
     return None if value is None else  value.isoformat(timespec='seconds')
\ No newline at end of file
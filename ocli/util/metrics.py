@@ -0,0 +1,200 @@
+"""
+Pipeline instrumentation: named spans with wall/CPU time, bytes read/written and peak RSS.
+
+    with metrics.run('assemble', recipe['OUTDIR'], mode='zone'):
+        with metrics.span('load', band=name):
+            ...
+        _gauss = metrics.span('gauss')   # span could be entered many times (strip loops), times are summed
+        for strip in strips:
+            with _gauss:
+                ...
+
+run() appends JSON line per span and one summary line (span '*') to <path>/METRICS_FILE when it exits.
+run() inside active run is recorded as a span of the outer run.
+Without active run spans are measured and logged (DEBUG) only, so library code is instrumented unconditionally.
+
+bytes are rchar/wchar of /proc/self/io (all read/write calls incl. sockets and page cache), 0 where /proc is missed,
+peak RSS is process high-water mark at span exit.
+"""
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import List, Optional
+
+log = logging.getLogger('metrics')
+
+METRICS_FILE = 'metrics.jsonl'
+""" summary record of run """
+RUN_SPAN = '*'
+
+_runs = []
+
+
+def _io() -> (int, int):
+    try:
+        with open('/proc/self/io', 'r') as _f:
+            _d = dict(line.split(':', 1) for line in _f.read().splitlines() if ':' in line)
+        return int(_d['rchar']), int(_d['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def peak_rss() -> int:
+    """ process peak resident set size, bytes """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Span(object):
+    """ accumulating timer, see module doc """
+
+    def __init__(self, name: str, **tags):
+        self.name = name
+        self.tags = tags
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.read_bytes = 0
+        self.written_bytes = 0
+        self.peak_rss = 0
+        self._start = None
+
+    def add(self, read=0, written=0):
+        """ add bytes not seen by /proc/self/io """
+        self.read_bytes += read
+        self.written_bytes += written
+
+    def __enter__(self):
+        _r, _w = _io()
+        self._start = (time.perf_counter(), time.process_time(), _r, _w)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _r, _w = _io()
+        wall = time.perf_counter() - self._start[0]
+        self.wall += wall
+        self.cpu += time.process_time() - self._start[1]
+        self.read_bytes += _r - self._start[2]
+        self.written_bytes += _w - self._start[3]
+        self.peak_rss = max(self.peak_rss, peak_rss())
+        self.count += 1
+        log.debug(f"{self.name} {self.tags if self.tags else ''} in {wall:.3f}s")
+
+    def record(self) -> dict:
+        return {
+            'span': self.name,
+            **self.tags,
+            'count': self.count,
+            'wall': round(self.wall, 6),
+            'cpu': round(self.cpu, 6),
+            'read_bytes': self.read_bytes,
+            'written_bytes': self.written_bytes,
+            'peak_rss': self.peak_rss,
+        }
+
+
+class Run(Span):
+    """ top-level span of pipeline step, collects spans and saves them as JSON lines
+
+    :param step: pipeline step name (assemble, process, makecog, ...)
+    :param path: directory of METRICS_FILE, None - do not save
+    """
+
+    def __init__(self, step: str, path: Optional[str], **tags):
+        super(Run, self).__init__(RUN_SPAN, **tags)
+        self.step = step
+        self.path = path
+        self.id = str(uuid.uuid4())
+        self.spans = []  # type: List[Span]
+        self.status = None
+        self.started = None
+
+    def __enter__(self):
+        _runs.append(self)
+        self.started = time.time()
+        return super(Run, self).__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        super(Run, self).__exit__(exc_type, exc_val, exc_tb)
+        _runs.remove(self)
+        self.status = 'ok' if exc_type is None else 'error'
+        log.info(f"{self.step} done in {self.wall:.3f}s, cpu {self.cpu:.3f}s, peak RSS {self.peak_rss >> 20}MB")
+        if self.path:
+            try:
+                self.save()
+            except OSError as e:
+                log.warning(f"Could not save metrics to {self.path}: {e}")
+
+    def records(self) -> List[dict]:
+        head = {'run': self.id, 'step': self.step, 'ts': round(self.started, 3)}
+        res = [{**head, **s.record()} for s in self.spans]
+        res.append({**head, **self.record(), 'status': self.status})
+        return res
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, METRICS_FILE), 'a') as _f:
+            for r in self.records():
+                _f.write(json.dumps(r) + '\n')
+
+
+def current() -> Optional[Run]:
+    return _runs[-1] if _runs else None
+
+
+def span(name: str, **tags) -> Span:
+    """ span registered in active run """
+    s = Span(name, **tags)
+    if _runs:
+        _runs[-1].spans.append(s)
+    return s
+
+
+def run(step: str, path: Optional[str], **tags) -> Span:
+    """ new run, or span of active run """
+    if _runs:
+        return span(step, **tags)
+    return Run(step, path, **tags)
+
+
+def read_metrics(path: str) -> List[dict]:
+    """ records of METRICS_FILE in directory, broken lines are skipped """
+    res = []
+    try:
+        with open(os.path.join(path, METRICS_FILE), 'r') as _f:
+            for line in _f:
+                try:
+                    res.append(json.loads(line))
+                except ValueError:
+                    pass
+    except OSError:
+        pass
+    return res
+
+
+def aggregate(records: List[dict], by=('step', 'span')) -> List[dict]:
+    """ totals grouped by record keys, sorted by total wall time """
+    groups = {}
+    for r in records:
+        k = tuple(r.get(b) for b in by)
+        g = groups.setdefault(k, {**dict(zip(by, k)), 'runs': 0, 'count': 0, 'wall': 0.0, 'wall max': 0.0, 'cpu': 0.0,
+                                  'read_bytes': 0, 'written_bytes': 0, 'peak_rss': 0})
+        g['runs'] += 1
+        g['count'] += r.get('count', 1)
+        g['wall'] += r.get('wall', 0)
+        g['wall max'] = max(g['wall max'], r.get('wall', 0))
+        g['cpu'] += r.get('cpu', 0)
+        g['read_bytes'] += r.get('read_bytes', 0)
+        g['written_bytes'] += r.get('written_bytes', 0)
+        g['peak_rss'] = max(g['peak_rss'], r.get('peak_rss', 0))
+    res = sorted(groups.values(), key=lambda g: -g['wall'])
+    for g in res:
+        g['wall mean'] = g['wall'] / g['runs']
+    return res
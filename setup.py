@@ -64,7 +64,8 @@ TSAR AI project is developed and maintained by OPT/NET BV (http://opt-net.eu) 
         'dateparser ',
         'lxml',
         'dpath',
-        'mgrs'
+        'mgrs',
+        'pyarrow'
     ],
 
     namespace_packages=[],
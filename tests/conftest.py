@@ -0,0 +1,61 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class HttpStub(object):
+    """ local HTTP stand-in for remote catalogues
+
+    routes(path, query) returns (status, body) or None for 404, body is str, bytes or json-able object;
+    every request is recorded as (path, query)
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                _u = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(_u.query).items()}
+                stub.requests.append((_u.path, query))
+                res = stub.routes(_u.path, query)
+                status, body = res if res is not None else (404, 'not found')
+                if not isinstance(body, (str, bytes)):
+                    body = json.dumps(body)
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def http_stub():
+    """ factory: http_stub(routes) -> HttpStub, servers are stopped after test """
+    stubs = []
+
+    def _make(routes):
+        stubs.append(HttpStub(routes))
+        return stubs[-1]
+
+    yield _make
+    for s in stubs:
+        s.close()
@@ -0,0 +1,37 @@
+""" bucket index: buckets and ROI fit cached per pairs cache file """
+import os
+
+import numpy as np
+from shapely.geometry import box
+
+from ocli.project import bucket_index
+from ocli.sent1 import pairs
+
+from test_pairs import ROI, SEARCH_PATH, finder_conf, page, product
+
+
+def load_pairs(http_stub, cache, n=4):
+    features = [product(i) for i in range(n)]
+    stub = http_stub(lambda path, query: (200, page(features, 1, 10, total=n)) if path == SEARCH_PATH else None)
+    pairs.load_data(ROI, reload=True, finder_conf=finder_conf(stub), cache_file_name=cache)
+
+
+def test_fit_is_cached_until_pairs_cache_changes(http_stub, tmp_path):
+    cache = str(tmp_path / 'sar.parquet')
+    load_pairs(http_stub, cache)
+    roi = box(10.5, 50.5, 11.5, 51.5)
+    df = bucket_index.load_bucket_index(cache, geometry=roi)
+    np.testing.assert_allclose(df['fit'], 0.25)
+    assert 'bucket' in df.columns
+    idx = bucket_index._index[bucket_index.index_file_name(cache)]
+    spatial = idx['spatial']
+    """ same index and cached fit are used for repeated calls """
+    df2 = bucket_index.load_bucket_index(cache, geometry=roi)
+    assert idx is bucket_index._index[bucket_index.index_file_name(cache)] and idx['spatial'] is spatial
+    np.testing.assert_array_equal(df2['fit'], df['fit'])
+    assert os.path.isfile(bucket_index.index_file_name(cache))
+
+    load_pairs(http_stub, cache, n=6)
+    df3 = bucket_index.load_bucket_index(cache, geometry=roi)
+    assert len(df3) == 6
+    assert bucket_index._index[bucket_index.index_file_name(cache)]['spatial'] is not spatial
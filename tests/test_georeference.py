@@ -0,0 +1,79 @@
+""" Georeference from ENVI header: GDAL ENVI driver parity, datums and GDAL fall-back """
+import numpy as np
+import pytest
+from pyproj import CRS
+
+from ocli.ai import Envi
+
+NORTH_UP = '{UTM, 1.5, 2.5, 500000.0, 5600000.0, 10.0, 10.0, 33, North, WGS-84, units=Meters}'
+ROTATED = '{UTM, 11.0, 21.0, 500000.0, 5600000.0, 10.0, 20.0, 33, North, WGS-84, units=Meters, rotation=30.0}'
+
+
+def write_envi(path, map_info: str, lines=40, samples=30, extra=''):
+    """ float32 single band ENVI raster, returns .img name """
+    np.zeros((lines, samples), dtype=np.float32).tofile(str(path) + '.img')
+    with open(str(path) + '.hdr', 'w') as _f:
+        _f.write(f"ENVI\nsamples = {samples}\nlines = {lines}\nbands = 1\nheader offset = 0\n"
+                 f"file type = ENVI Standard\ndata type = 4\ninterleave = bsq\nbyte order = 0\n"
+                 f"map info = {map_info}\n{extra}")
+    return str(path) + '.img'
+
+
+def test_north_up_transform(tmp_path):
+    g = Envi.Georeference.from_envi_header(write_envi(tmp_path / 'n', NORTH_UP)[:-4] + '.hdr')
+    assert (g.width, g.height) == (30, 40)
+    np.testing.assert_allclose(g.geo_transform, (499995.0, 10.0, 0.0, 5600015.0, 0.0, -10.0))
+    assert CRS(g.crs) == CRS.from_epsg(32633)
+
+
+def test_rotated_transform(tmp_path):
+    g = Envi.Georeference.from_envi_header(write_envi(tmp_path / 'r', ROTATED)[:-4] + '.hdr')
+    gt = g.geo_transform
+    """ 1-based tie point pixel maps to tie point coordinates """
+    np.testing.assert_allclose(g.to_coords(10.0, 20.0), (500000.0, 5600000.0))
+    np.testing.assert_allclose((np.hypot(gt[1], gt[2]), np.hypot(gt[4], gt[5])), (10.0, 20.0))
+    """ rotation as written back by GDAL ENVI driver """
+    rotation = -np.rad2deg(np.arctan2(-gt[2], gt[1]))
+    np.testing.assert_allclose(rotation, 30.0)
+    np.testing.assert_allclose(g.to_pixels(*g.to_coords(np.array([0., 7.]), np.array([0., 9.]))), ([0, 7], [0, 9]))
+
+
+@pytest.mark.parametrize('map_info, datum', [
+    ('{Geographic Lat/Lon, 1, 1, 10.0, 50.0, 0.001, 0.001, WGS-84, units=Degrees}', 'World Geodetic System 1984'),
+    ('{Geographic Lat/Lon, 1, 1, 10.0, 50.0, 0.001, 0.001, North America 1927, units=Degrees}',
+     'North American Datum 1927'),
+    ('{Geographic Lat/Lon, 1, 1, 10.0, 50.0, 0.001, 0.001}', 'World Geodetic System 1984'),
+    ('{UTM, 1, 1, 500000.0, 5600000.0, 10.0, 10.0, 17, North, North America 1983, units=Meters}',
+     'North American Datum 1983'),
+])
+def test_datum_by_projection(tmp_path, map_info, datum):
+    g = Envi.Georeference.from_envi_header(write_envi(tmp_path / 'd', map_info)[:-4] + '.hdr')
+    assert datum in CRS(g.crs).datum.name
+
+
+def test_coordinate_system_string_is_used(tmp_path):
+    wkt = CRS.from_epsg(3035).to_wkt()
+    g = Envi.Georeference.from_envi_header(
+        write_envi(tmp_path / 'w', NORTH_UP, extra=f"coordinate system string = {{{wkt}}}\n")[:-4] + '.hdr')
+    assert CRS(g.crs) == CRS.from_epsg(3035)
+
+
+def test_unknown_datum_falls_back_to_gdal(tmp_path, monkeypatch):
+    fname = write_envi(tmp_path / 'u', '{Geographic Lat/Lon, 1, 1, 10.0, 50.0, 0.001, 0.001, European 1950}')
+    with pytest.raises(AssertionError):
+        Envi.Georeference.from_envi_header(fname[:-4] + '.hdr')
+    gdal_ref = Envi.Georeference(30, 40, 'EPSG:4230', Envi.affine.Affine.identity())
+    monkeypatch.setattr(Envi.Georeference, 'from_gdal', classmethod(lambda cls, f: gdal_ref))
+    Envi._georeference.cache_clear()
+    assert Envi.get_georeference(fname) is gdal_ref
+
+
+@pytest.mark.parametrize('map_info', [NORTH_UP, ROTATED], ids=['north-up', 'rotated'])
+def test_gdal_parity(tmp_path, map_info):
+    pytest.importorskip('osgeo.gdal')
+    fname = write_envi(tmp_path / 'p', map_info)
+    g = Envi.Georeference.from_envi_header(fname[:-4] + '.hdr')
+    ref = Envi.Georeference.from_gdal(fname)
+    assert (g.width, g.height) == (ref.width, ref.height)
+    np.testing.assert_allclose(g.geo_transform, ref.geo_transform, rtol=0, atol=1e-6)
+    assert CRS(g.crs).equals(CRS(ref.crs), ignore_axis_order=True)
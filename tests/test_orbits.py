@@ -0,0 +1,95 @@
+""" orbit catalogue sync against local HTTP stub and orbit index lookups """
+import pandas as pd
+
+from ocli.sent1 import orbits
+
+LISTINGS = {
+    '/POEORB/S1A/2019/04': [
+        'S1A_OPER_AUX_POEORB_OPOD_20190421T120000_V20190401T000000_20190403T000000.EOF.zip',
+        'S1A_OPER_AUX_POEORB_OPOD_20190422T120000_V20190402T000000_20190402T060000.EOF.zip',
+        'S1A_OPER_AUX_POEORB_OPOD_20190423T120000_V20190402T120000_20190404T000000.EOF.zip',
+    ],
+    '/RESORB/S1A/2019/04': [
+        'S1A_OPER_AUX_RESORB_OPOD_20190402T120000_V20190401T220000_20190402T020000.EOF.zip',
+    ],
+    '/RESORB/S1A/2019/05': [
+        'S1A_OPER_AUX_RESORB_OPOD_20190510T120000_V20190510T000000_20190510T030000.EOF.zip',
+    ],
+}
+
+
+def listing(files) -> str:
+    """ single-line directory listing as served by step.esa.int """
+    return '<html><body>' + ''.join(f'<a href="{f}">{f}</a>' for f in files) + '</body></html>'
+
+
+def orbits_stub(http_stub, listings):
+    return http_stub(lambda path, query: (200, listing(listings[path])) if path in listings else None)
+
+
+def sync(stub, cache, force=False, dates=('201904', '201905')):
+    return orbits.sync_orbits(force=force, dates=list(dates), orbit_types=['POEORB', 'RESORB'], missions=['S1A'],
+                              workers=4, cache_file_name=cache, base_url=stub.url)
+
+
+def test_sync_is_cached_in_parquet(http_stub, tmp_path):
+    stub = orbits_stub(http_stub, LISTINGS)
+    cache = str(tmp_path / 'orbits.parquet')
+    data = sync(stub, cache)
+    """ POEORB 2019/05 is not published (404) """
+    assert sorted(p for p, _ in stub.requests) == sorted([*LISTINGS, '/POEORB/S1A/2019/05'])
+    assert sorted(data['filename']) == sorted(f for files in LISTINGS.values() for f in files)
+    assert str(data['valid_start'].dt.tz) == 'UTC'
+    _row = data[data['filename'] == LISTINGS['/RESORB/S1A/2019/05'][0]].iloc[0]
+    assert _row['url'] == stub.url + '/RESORB/S1A/2019/05/' + _row['filename']
+    assert _row['valid_end'] == pd.Timestamp('2019-05-10T03:00:00Z')
+    pd.testing.assert_frame_equal(orbits.read_cache(cache), data.reset_index(drop=True))
+
+    stub.requests.clear()
+    again = sync(stub, cache, dates=('201904',))
+    assert stub.requests == []
+    assert len(again) == len(data)
+
+
+def test_forced_sync_drops_old_rows(http_stub, tmp_path):
+    listings = dict(LISTINGS)
+    stub = orbits_stub(http_stub, listings)
+    cache = str(tmp_path / 'orbits.parquet')
+    sync(stub, cache)
+    listings['/POEORB/S1A/2019/04'] = [
+        'S1A_OPER_AUX_POEORB_OPOD_20190430T120000_V20190401T000000_20190405T000000.EOF.zip',
+    ]
+    data = sync(stub, cache, force=True, dates=('201904',))
+    _poe = data[(data['catalog_date'] == '201904') & (data['orbit_type'] == 'POEORB')]
+    assert _poe['filename'].tolist() == listings['/POEORB/S1A/2019/04']
+    """ other months are kept """
+    assert LISTINGS['/RESORB/S1A/2019/05'][0] in data['filename'].tolist()
+    assert len(orbits.read_cache(cache)) == len(data) == 3
+
+
+def test_orbit_index_overlapping_intervals(http_stub, tmp_path):
+    stub = orbits_stub(http_stub, LISTINGS)
+    index = orbits.OrbitIndex(sync(stub, cache=str(tmp_path / 'orbits.parquet')))
+
+    def found(start, stop=None):
+        r = index.find('S1A', pd.Timestamp(start), pd.Timestamp(stop) if stop else None)
+        return None if r is None else r['filename'][25:40]
+
+    """ nested interval started later is preferred """
+    assert found('2019-04-02T03:00:00') == '20190422T120000'
+    """ nested interval ended, enclosing one covers """
+    assert found('2019-04-02T10:00:00') == '20190421T120000'
+    assert found('2019-04-02T05:00:00', '2019-04-02T07:00:00') == '20190421T120000'
+    assert found('2019-04-03T12:00:00') == '20190423T120000'
+    """ naive time is UTC, RESORB is used when POEORB is missing """
+    assert found('2019-05-10T01:00:00') == '20190510T120000'
+    assert found('2019-04-01T23:00:00+00:00') == '20190421T120000'
+    assert found('2019-06-01T00:00:00') is None
+    assert index.find('S1B', pd.Timestamp('2019-04-02T03:00:00')) is None
+
+    many = index.find_many(['S1A', 'S1A', 'S1B'], [pd.Timestamp('2019-04-02T03:00:00'),
+                                                   pd.Timestamp('2019-06-01T00:00:00'),
+                                                   pd.Timestamp('2019-04-02T03:00:00')])
+    assert len(many) == 3
+    assert many['filename'][0][25:40] == '20190422T120000'
+    assert many['filename'][1:].isna().all()
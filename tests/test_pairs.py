@@ -0,0 +1,130 @@
+""" finder products loader against local HTTP stub """
+import pandas as pd
+from shapely.geometry import box
+
+from ocli.sent1 import pairs
+
+SEARCH_PATH = '/resto/api/collections/Sentinel1/search.json'
+ROI = box(10, 50, 11, 51)
+
+
+def product(n: int, updated='2020-02-01T00:00:00.000000Z', status='ONLINE') -> dict:
+    day = f"202001{n + 1:02d}"
+    title = f"S1A_IW_SLC__1SDV_{day}T000000_{day}T000027_0300{n:02d}_037000_{n:04X}"
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': [[[10, 50], [11, 50], [11, 51], [10, 51], [10, 50]]]},
+        'properties': {
+            'title': title,
+            'productIdentifier': f'/eodata/Sentinel-1/{title}.SAFE',
+            'platform': 'S1A',
+            'orbitNumber': 30000 + n,
+            'relativeOrbitNumber': 117,
+            'sensorMode': 'IW',
+            'productType': 'SLC',
+            'polarisation': 'VV VH',
+            'swath': 'IW1 IW2 IW3',
+            'startDate': f"{day[:4]}-{day[4:6]}-{day[6:]}T00:00:00.000Z",
+            'completionDate': f"{day[:4]}-{day[4:6]}-{day[6:]}T00:00:27.000Z",
+            'updated': updated,
+            'status': status,
+            'centroid': {}, 'license': {}, 'links': [], 'services': {}, 'keywords': [], 'gmlgeometry': '',
+        },
+    }
+
+
+def page(features: list, n: int, per_page: int, total=None, next_href=None) -> dict:
+    chunk = features[(n - 1) * per_page:n * per_page]
+    props = {'itemsPerPage': len(chunk), 'links': []}
+    if total is not None:
+        props['totalResults'] = total
+    if next_href and n * per_page < len(features):
+        props['links'].append({'rel': 'next', 'href': next_href(n + 1)})
+    return {'type': 'FeatureCollection', 'properties': props, 'features': chunk}
+
+
+def finder_conf(stub, **kwargs) -> dict:
+    return dict(url=stub.url + '/resto/api/collections/{collection}/search.json', **kwargs)
+
+
+def test_pages_are_loaded_concurrently_and_concatenated_once(http_stub, tmp_path):
+    features = [product(n) for n in range(7)]
+
+    def routes(path, query):
+        if path != SEARCH_PATH:
+            return None
+        return 200, page(features, int(query.get('page', 1)), int(query['maxRecords']), total=len(features),
+                         next_href=lambda p: stub.url + SEARCH_PATH + f'?page={p}')
+
+    stub = http_stub(routes)
+    data = pairs.load_data(ROI, reload=True, finder_conf=finder_conf(stub, maxRecords=3),
+                           cache_file_name=str(tmp_path / 'products.parquet'), workers=3)
+    assert len(data) == 7
+    assert data[pairs.PRODUCT_KEY].is_unique
+    assert sorted(q.get('page', '1') for _, q in stub.requests) == ['1', '2', '3']
+    assert all(q['geometry'] == ROI.wkt for _, q in stub.requests if 'maxRecords' in q)
+    cached = pairs.load_from_cache(str(tmp_path / 'products.parquet'))
+    assert sorted(cached[pairs.PRODUCT_KEY]) == sorted(data[pairs.PRODUCT_KEY])
+
+
+def test_page_size_capped_by_finder(http_stub, tmp_path):
+    features = [product(n) for n in range(7)]
+
+    def routes(path, query):
+        if path != SEARCH_PATH:
+            return None
+        """ maxRecords=5 is requested, finder returns 2 per page """
+        return 200, page(features, int(query.get('page', 1)), min(2, int(query['maxRecords'])), total=len(features),
+                         next_href=lambda p: stub.url + SEARCH_PATH + f'?page={p}')
+
+    stub = http_stub(routes)
+    data = pairs.load_data(ROI, reload=True, finder_conf=finder_conf(stub, maxRecords=5),
+                           cache_file_name=str(tmp_path / 'products.parquet'), workers=3)
+    assert len(data) == 7
+    assert sorted(q.get('page', '1') for _, q in stub.requests) == ['1', '2', '3', '4']
+
+
+def test_next_links_are_followed_when_total_is_unknown(http_stub, tmp_path):
+    features = [product(n) for n in range(5)]
+
+    def routes(path, query):
+        if path != SEARCH_PATH:
+            return None
+        return 200, page(features, int(query.get('page', 1)), 2,
+                         next_href=lambda p: stub.url + SEARCH_PATH + f'?page={p}')
+
+    stub = http_stub(routes)
+    data = pairs.load_data(ROI, reload=True, finder_conf=finder_conf(stub, maxRecords=2),
+                           cache_file_name=str(tmp_path / 'products.parquet'))
+    assert len(data) == 5
+    assert [q.get('page', '1') for _, q in stub.requests] == ['1', '2', '3']
+
+
+def test_incremental_update_merges_by_product_identifier(http_stub, tmp_path):
+    cache = str(tmp_path / 'products.parquet')
+    features = [product(n, updated=f'2020-02-0{n + 1}T00:00:00.000000Z') for n in range(4)]
+
+    def routes(path, query):
+        if path != SEARCH_PATH:
+            return None
+        _f = features
+        if 'updated' in query:
+            """ finder treats 'updated' as inclusive """
+            _f = [f for f in features if pd.Timestamp(f['properties']['updated']) >= pd.Timestamp(query['updated'])]
+        return 200, page(_f, int(query.get('page', 1)), 10, total=len(_f))
+
+    stub = http_stub(routes)
+    pairs.load_data(ROI, reload=True, finder_conf=finder_conf(stub), cache_file_name=cache)
+    """ product 1 is changed, product 9 is new """
+    features[1] = product(1, updated='2020-03-01T00:00:00.000000Z', status='OFFLINE')
+    features.append(product(9, updated='2020-03-02T00:00:00.000000Z'))
+    stub.requests.clear()
+    data = pairs.load_data(ROI, reload=True, incremental=True, finder_conf=finder_conf(stub), cache_file_name=cache)
+
+    assert [pd.Timestamp(q['updated']) for _, q in stub.requests] == [pd.Timestamp('2020-02-04T00:00:00Z')]
+    assert len(data) == 5
+    assert data[pairs.PRODUCT_KEY].is_unique
+    _changed = data[data[pairs.PRODUCT_KEY] == features[1]['properties']['productIdentifier']]
+    assert _changed['status'].tolist() == ['OFFLINE']
+    assert len(pairs.load_from_cache(cache)) == 5
+
@@ -0,0 +1,40 @@
+""" CLI startup budget: import time and lazily imported heavy modules (see ocli.bench.startup) """
+import os
+
+import pytest
+
+from ocli.bench import startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = startup.LIGHT_COMMANDS + ('task list',)
+""" must never be loaded on startup, regardless of HEAVY_MODULES changes """
+FORBIDDEN = ('geopandas', 'sklearn', 'gdal', 'osgeo', 'matplotlib')
+
+
+@pytest.fixture(scope='module')
+def results(tmp_path_factory):
+    """ commands are run in fresh interpreters with HOME holding a minimal main and project config """
+    home = tmp_path_factory.mktemp('home')
+    project = home / 'projects' / 'demo'
+    os.makedirs(project / 'task1')
+    (home / '.tsarrc').write_text(f"projects_home: {home / 'projects'}\nactive_project: demo\n")
+    (project / '.tsarrc').write_text("{}\n")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('HOME', str(home))
+        mp.setenv('PYTHONPATH', os.pathsep.join(p for p in (ROOT, os.environ.get('PYTHONPATH')) if p))
+        yield {r['command']: r for r in startup.run_startup(COMMANDS, repeat=3)}
+
+
+@pytest.mark.parametrize('command', COMMANDS)
+def test_heavy_modules_are_not_loaded(results, command):
+    assert set(FORBIDDEN) <= set(startup.HEAVY_MODULES)
+    r = results[command]
+    assert not r['failed']
+    assert not set(FORBIDDEN) & set(r['heavy modules'])
+    assert not r['heavy modules']
+
+
+@pytest.mark.parametrize('command', COMMANDS)
+def test_import_budget(results, command):
+    assert startup.check_budget([results[command]]) == []
+    assert results[command]['import seconds'] <= startup.STARTUP_BUDGET